@@ -0,0 +1,146 @@
+"""
+Benchmark of the FriendStore implementations.
+
+Every store is loaded with a number of faces and the latency of add_friend, get_friend, get_friends_by_ids and
+get_friends is measured. The brain store runs against an in-process SPARQL endpoint backed by rdflib, so no
+GraphDB instance is needed. Results are written as JSON lines, one line per store, size and operation.
+
+Usage::
+
+    python benchmarks/friends_benchmark.py --sizes 1000 10000 --stores memory file brain --output results.jsonl
+"""
+import argparse
+import json
+import logging
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from cltl.friends.cache import CachedFriendsStore
+from cltl.friends.file import FileFriendsStore
+from cltl.friends.memory import MemoryFriendsStore
+
+logger = logging.getLogger(__name__)
+
+
+STORES = ["memory", "file", "cached-file", "brain", "cached-brain"]
+
+
+def create_store(name, work_dir, endpoint):
+    if name == "memory":
+        return MemoryFriendsStore()
+    if name == "file":
+        return FileFriendsStore(Path(work_dir) / "friends")
+    if name == "cached-file":
+        return CachedFriendsStore(create_store("file", work_dir, endpoint))
+    if name == "brain":
+        from cltl.friends.brain import BrainFriendsStore
+        return BrainFriendsStore(endpoint.address, Path(work_dir) / "brain")
+    if name == "cached-brain":
+        return CachedFriendsStore(create_store("brain", work_dir, endpoint))
+
+    raise ValueError("Unsupported store: " + name)
+
+
+def face_id(index):
+    return f"face_{index}"
+
+
+def measure(operation, calls):
+    """
+    Measure the latency of the calls of an operation, returns None if there are no calls.
+    """
+    latencies = []
+    for call in calls:
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+
+    if not latencies:
+        return None
+
+    total = sum(latencies)
+    latencies = sorted(latencies)
+
+    return {
+        "operation": operation,
+        "count": len(latencies),
+        "mean_ms": 1000 * total / len(latencies),
+        "p50_ms": 1000 * latencies[len(latencies) // 2],
+        "p95_ms": 1000 * latencies[int(len(latencies) * 0.95)],
+        "max_ms": 1000 * latencies[-1],
+        "stdev_ms": 1000 * statistics.pstdev(latencies),
+        "throughput_per_s": len(latencies) / total if total else None,
+    }
+
+
+def run(store_name, size, samples, batch_size, endpoint):
+    with TemporaryDirectory(prefix="friends-benchmark") as work_dir:
+        store = create_store(store_name, work_dir, endpoint)
+        rng = random.Random(size)
+
+        results = []
+        start = time.perf_counter()
+        for offset in range(0, size, batch_size):
+            store.add_friends((face_id(index), [f"name {index}"])
+                              for index in range(offset, min(size, offset + batch_size)))
+        results.append({"operation": "load", "count": size, "total_s": time.perf_counter() - start})
+
+        lookups = [face_id(rng.randrange(size)) for _ in range(samples)]
+        results.append(measure("get_friend", [lambda id=id: store.get_friend(id) for id in lookups]))
+        results.append(measure("get_friend_unknown",
+                               [lambda index=index: store.get_friend(f"unknown_{index % 10}")
+                                for index in range(samples)]))
+        results.append(measure("get_friends_by_ids",
+                               [lambda offset=offset: store.get_friends_by_ids(lookups[offset:offset + 5])
+                                for offset in range(0, samples, 5)]))
+        results.append(measure("add_friend",
+                               [lambda index=index: store.add_friend(face_id(size + index), f"new {index}")
+                                for index in range(min(samples, 100))]))
+        results.append(measure("get_friends", [store.get_friends for _ in range(3)]))
+
+        if hasattr(store, "close"):
+            store.close()
+
+    return [{"store": store_name, "size": size, **result} for result in results if result]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the FriendStore implementations")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="Numbers of faces to load into the stores")
+    parser.add_argument("--stores", nargs="+", default=STORES, choices=STORES, help="Stores to benchmark")
+    parser.add_argument("--samples", type=int, default=1000, help="Number of calls measured per operation")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Number of faces per add_friends call")
+    parser.add_argument("--output", type=str, default=None, help="File to write the JSON lines results to")
+    args = parser.parse_args()
+
+    endpoint = None
+    if any("brain" in store for store in args.stores):
+        from sparql_endpoint import SparqlEndpoint
+        endpoint = SparqlEndpoint().start()
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for store in args.stores:
+            for size in args.sizes:
+                logger.info("Benchmark %s with %s faces", store, size)
+                for result in run(store, size, args.samples, args.batch_size, endpoint):
+                    output.write(json.dumps(result) + "\n")
+                    output.flush()
+                if endpoint:
+                    endpoint.dataset.update("CLEAR ALL")
+    finally:
+        if args.output:
+            output.close()
+        if endpoint:
+            endpoint.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""
+In-process stand-in for the GraphDB SPARQL endpoint used by the brain, backed by an rdflib Dataset.
+
+Supports the subset of the RDF4J REST protocol used by the brain:
+
+* ``GET|POST /repositories/<repository>`` with a ``query`` parameter, returning SPARQL JSON or TSV results
+* ``POST /repositories/<repository>/statements`` with an ``update`` parameter, a SPARQL update body,
+  or an RDF document to add
+"""
+import json
+import logging
+import threading
+
+from flask import Flask, Response, request
+from rdflib import Dataset, URIRef, BNode, Literal
+from werkzeug.serving import make_server
+
+logger = logging.getLogger(__name__)
+
+
+_RDF_FORMATS = {
+    "application/x-trig": "trig",
+    "application/trig": "trig",
+    "text/turtle": "turtle",
+    "application/x-turtle": "turtle",
+    "application/n-triples": "nt",
+    "text/plain": "nt",
+    "application/n-quads": "nquads",
+    "application/rdf+xml": "xml",
+    "application/ld+json": "json-ld",
+}
+
+
+def _json_term(term):
+    if isinstance(term, URIRef):
+        return {"type": "uri", "value": str(term)}
+    if isinstance(term, BNode):
+        return {"type": "bnode", "value": str(term)}
+
+    value = {"type": "literal", "value": str(term)}
+    if term.language:
+        value["xml:lang"] = term.language
+    elif term.datatype:
+        value["datatype"] = str(term.datatype)
+
+    return value
+
+
+def _tsv_term(term):
+    """
+    Serialize an RDF term for SPARQL TSV results, see https://www.w3.org/TR/sparql11-results-csv-tsv/
+    """
+    if term is None:
+        return ""
+    if not isinstance(term, Literal):
+        return term.n3()
+
+    escaped = (str(term).replace('\\', '\\\\').replace('"', '\\"')
+               .replace('\n', '\\n').replace('\r', '\\r').replace('\t', '\\t'))
+    if term.language:
+        return f'"{escaped}"@{term.language}'
+    if term.datatype:
+        return f'"{escaped}"^^<{term.datatype}>'
+
+    return f'"{escaped}"'
+
+
+class SparqlEndpoint:
+    """
+    SPARQL endpoint served from a background thread, use as a context manager.
+    """
+    def __init__(self, repository: str = "sandbox", host: str = "127.0.0.1", port: int = 0):
+        self._repository = repository
+        self._dataset = Dataset(default_union=True)
+        self._lock = threading.Lock()
+
+        self._server = make_server(host, port, self._create_app(), threaded=True)
+        self._thread = None
+
+    @property
+    def address(self) -> str:
+        return f"http://{self._server.host}:{self._server.port}/repositories/{self._repository}"
+
+    @property
+    def dataset(self) -> Dataset:
+        return self._dataset
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="SparqlEndpoint", daemon=True)
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _create_app(self):
+        app = Flask("SPARQL endpoint")
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+        @app.route(f"/repositories/{self._repository}", methods=['GET', 'POST'])
+        def query():
+            if "update" in request.values:
+                return self._update(request.values["update"])
+            if request.mimetype == "application/sparql-query":
+                return self._query(request.get_data(as_text=True))
+
+            return self._query(request.values["query"])
+
+        @app.route(f"/repositories/{self._repository}/statements", methods=['GET', 'POST'])
+        def statements():
+            if "update" in request.values:
+                return self._update(request.values["update"])
+            if request.mimetype == "application/sparql-update":
+                return self._update(request.get_data(as_text=True))
+            if "query" in request.values:
+                return self._query(request.values["query"])
+
+            rdf_format = _RDF_FORMATS.get(request.mimetype, "trig")
+            with self._lock:
+                self._dataset.parse(data=request.get_data(as_text=True), format=rdf_format)
+
+            return Response(status=204)
+
+        @app.route(f"/repositories/{self._repository}/size", methods=['GET'])
+        def size():
+            return Response(str(len(self._dataset)), mimetype="text/plain")
+
+        return app
+
+    def _update(self, update):
+        with self._lock:
+            self._dataset.update(update)
+
+        return Response(status=204)
+
+    def _query(self, query):
+        with self._lock:
+            result = self._dataset.query(query)
+
+        if result.type == "ASK":
+            return Response(json.dumps({"head": {}, "boolean": bool(result.askAnswer)}),
+                            mimetype="application/sparql-results+json")
+
+        if result.type != "SELECT":
+            return Response(result.serialize(format="turtle"), mimetype="text/turtle")
+
+        variables = [str(variable) for variable in result.vars]
+        if "text/tab-separated-values" in request.headers.get("Accept", ""):
+            lines = ["\t".join("?" + variable for variable in variables)]
+            lines.extend("\t".join(_tsv_term(row[variable]) for variable in variables) for row in result)
+
+            return Response("\n".join(lines) + "\n", mimetype="text/tab-separated-values")
+
+        bindings = [{variable: _json_term(row[variable]) for variable in variables if row[variable] is not None}
+                    for row in result]
+
+        return Response(json.dumps({"head": {"vars": variables}, "results": {"bindings": bindings}}),
+                        mimetype="application/sparql-results+json")
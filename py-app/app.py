@@ -3,6 +3,7 @@ import logging.config
 import logging.config
 import os
 import time
+from pathlib import Path
 
 from cltl.backend.api.backend import Backend
 from cltl.backend.api.camera import CameraResolution, Camera
@@ -50,10 +51,16 @@ from flask import Flask
 from werkzeug.middleware.dispatcher import DispatcherMiddleware
 from werkzeug.serving import run_simple
 
-from cltl.friends.api import FriendStore
+from cltl.context.api import LocationProvider
+from cltl.context.location import StaticLocationProvider, IpInfoLocationProvider, LocationCache, \
+    BackgroundLocationProvider
+from cltl.friends.api import FriendStore, AsyncFriendStore
+from cltl.friends.cache import CachedFriendsStore
+from cltl.friends.file import FileFriendsStore
 from cltl.friends.memory import MemoryFriendsStore
 from cltl_service.bdi.service import BDIService
 from cltl_service.context.service import ContextService
+from cltl_service.infra.metrics import MetricsRegistry
 from cltl_service.intentions.chat import InitializeChatService
 from cltl_service.intentions.init import InitService
 from cltl_service.keyword.service import KeywordService
@@ -65,7 +72,10 @@ logger = logging.getLogger(__name__)
 
 
 class InfraContainer(SynchronousEventBusContainer, K8LocalConfigurationContainer, ThreadedResourceContainer):
-    pass
+    @property
+    @singleton
+    def metrics(self) -> MetricsRegistry:
+        return MetricsRegistry()
 
 
 class BackendContainer(InfraContainer):
@@ -352,52 +362,117 @@ class LeolaniContainer(EmissorStorageContainer, InfraContainer):
     @property
     @singleton
     def friend_store(self) -> FriendStore:
-        implementation = self.config_manager.get_config("cltl.leolani.friends").get("implementation")
+        config = self.config_manager.get_config("cltl.leolani.friends")
+        implementation = config.get("implementation")
 
         if implementation == "memory":
-            return MemoryFriendsStore()
+            store = MemoryFriendsStore()
+        elif implementation == "brain":
+            from cltl.friends.brain import BrainFriendsStore
+            brain_config = self.config_manager.get_config("cltl.leolani.friends.brain")
+            direct_insert = brain_config.get_boolean("direct_insert") if "direct_insert" in brain_config else False
+            store = BrainFriendsStore(brain_config.get("address"), Path(brain_config.get("log_dir")), direct_insert)
+            if "sync_interval" in brain_config and brain_config.get_float("sync_interval"):
+                from cltl.friends.replica import ReplicatedFriendsStore
+                full_sync_interval = (brain_config.get_float("full_sync_interval")
+                                      if "full_sync_interval" in brain_config else None)
+                store = ReplicatedFriendsStore(store, brain_config.get_float("sync_interval"), full_sync_interval)
+        elif implementation == "file":
+            file_config = self.config_manager.get_config("cltl.leolani.friends.file")
+            compact_after = file_config.get_int("compact_after") if "compact_after" in file_config else 1000
+            sync = file_config.get_boolean("sync") if "sync" in file_config else False
+            store = FileFriendsStore(file_config.get("path"), compact_after, sync)
+        else:
+            raise ValueError("Unsupported implemenation: " + implementation)
+
+        cache_size = config.get_int("cache_size") if "cache_size" in config else 0
+        if cache_size:
+            cache_ttl = config.get_float("cache_ttl") if "cache_ttl" in config else None
+            negative_ttl = config.get_float("cache_negative_ttl") if "cache_negative_ttl" in config else None
+            store = CachedFriendsStore(store, cache_size, cache_ttl, negative_ttl)
 
-        raise ValueError("Unsupported implemenation: " + implementation)
+        return store
+
+    @property
+    @singleton
+    def async_friend_store(self) -> AsyncFriendStore:
+        config = self.config_manager.get_config("cltl.leolani.friends")
+        if not ("async" in config and config.get_boolean("async")):
+            return None
+
+        from cltl.friends.aio import AsyncBrainFriendsStore, AsyncMemoryFriendsStore, AsyncThreadedFriendsStore
+        from cltl.friends.brain import BrainFriendsStore
+        pool_size = config.get_int("async_pool_size") if "async_pool_size" in config else 8
+        if isinstance(self.friend_store, BrainFriendsStore):
+            return AsyncBrainFriendsStore(self.friend_store, pool_size)
+        if isinstance(self.friend_store, MemoryFriendsStore):
+            return AsyncMemoryFriendsStore(self.friend_store)
+
+        # Cached, replicated and file stores can block on the brain or on disk. They guard their state with locks,
+        # except for a cached MemoryFriendsStore
+        thread_safe = config.get("implementation") != "memory"
+        return AsyncThreadedFriendsStore(self.friend_store, pool_size, thread_safe)
 
     @property
     @singleton
     def monitoring_service(self) -> MonitoringService:
-        return MonitoringService.from_config(self.friend_store, self.event_bus, self.resource_manager, self.config_manager)
+        return MonitoringService.from_config(self.friend_store, self.event_bus, self.resource_manager,
+                                             self.config_manager, self.async_friend_store, self.metrics)
 
     @property
     @singleton
     def keyword_service(self) -> KeywordService:
         return KeywordService.from_config(self.emissor_data_client,
-                                          self.event_bus, self.resource_manager, self.config_manager)
+                                          self.event_bus, self.resource_manager, self.config_manager, self.metrics)
+
+    @property
+    @singleton
+    def location_provider(self) -> LocationProvider:
+        config = self.config_manager.get_config("cltl.context.location")
+        implementation = config.get("implementation")
+
+        if implementation == "static":
+            return StaticLocationProvider({key: config.get(key) for key in ("country", "region", "city")
+                                           if key in config})
+        if implementation == "ipinfo":
+            cache = LocationCache(config.get("cache_file"), config.get_float("cache_ttl")) \
+                if "cache_file" in config else None
+            return BackgroundLocationProvider(IpInfoLocationProvider(), cache, config.get_float("refresh_interval"))
+
+        raise ValueError("Unsupported location implementation: " + implementation)
 
     @property
     @singleton
     def context_service(self) -> ContextService:
-        return ContextService.from_config(self.friend_store, self.event_bus, self.resource_manager, self.config_manager)
+        return ContextService.from_config(self.friend_store, self.event_bus, self.resource_manager,
+                                          self.config_manager, self.async_friend_store, self.location_provider,
+                                          self.metrics)
 
     @property
     @singleton
     def bdi_service(self) -> BDIService:
         bdi_model = json.loads(self.config_manager.get_config("cltl.bdi").get("model"))
 
-        return BDIService.from_config(bdi_model, self.event_bus, self.resource_manager, self.config_manager)
+        return BDIService.from_config(bdi_model, self.event_bus, self.resource_manager, self.config_manager,
+                                      self.metrics)
 
     @property
     @singleton
     def init_intention(self) -> InitService:
         return InitService.from_config(self.emissor_data_client,
-                                       self.event_bus, self.resource_manager, self.config_manager)
+                                       self.event_bus, self.resource_manager, self.config_manager, self.metrics)
 
     @property
     @singleton
     def chat_intention(self) -> InitializeChatService:
         return InitializeChatService.from_config(self.emissor_data_client,
-                                       self.event_bus, self.resource_manager, self.config_manager)
+                                       self.event_bus, self.resource_manager, self.config_manager, self.metrics)
 
     def start(self):
         logger.info("Start Leolani services")
         super().start()
         self.bdi_service.start()
+        self.location_provider.start()
         self.context_service.start()
         self.init_intention.start()
         self.chat_intention.start()
@@ -413,6 +488,9 @@ class LeolaniContainer(EmissorStorageContainer, InfraContainer):
             self.chat_intention.stop()
             self.bdi_service.stop()
             self.context_service.stop()
+            self.location_provider.stop()
+            if self.async_friend_store:
+                self.async_friend_store.close()
         finally:
             super().stop()
 
@@ -494,6 +572,7 @@ def main():
             '/emissor': started_app.emissor_data_service.app,
             '/chatui': started_app.chatui_service.app,
             '/monitoring': started_app.monitoring_service.app,
+            '/monitoring/metrics': started_app.metrics.app,
         }
 
         if started_app.server:
@@ -20,4 +20,5 @@ rmdir storage/rdf/*
 rm -rf storage/emissor/**/*
 rmdir storage/emissor/*
 
-rm -rf storage/vector_id/*
\ No newline at end of file
+rm -rf storage/vector_id/*
+rm -f storage/friends/*
@@ -32,5 +32,9 @@ setup(
             "pillow",
             "flask",
             "kombu"
+        ],
+        "benchmark": [
+            "flask",
+            "rdflib"
         ]}
 )
@@ -0,0 +1,22 @@
+from typing import Mapping, Optional
+
+
+class LocationProvider:
+    def get_location(self) -> Optional[Mapping[str, str]]:
+        """
+        Get the current location with at least the keys 'country', 'region' and 'city', or None if the location
+        is not known.
+        """
+        raise NotImplementedError()
+
+    def start(self):
+        """
+        Start background activity of the provider, if any.
+        """
+        pass
+
+    def stop(self):
+        """
+        Stop background activity of the provider, if any.
+        """
+        pass
@@ -0,0 +1,136 @@
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Mapping, Optional, Tuple, Union
+
+import requests
+
+from cltl.context.api import LocationProvider
+
+logger = logging.getLogger(__name__)
+
+
+UNKNOWN_LOCATION = {"country": "", "region": "", "city": ""}
+
+
+class StaticLocationProvider(LocationProvider):
+    """
+    Provides a fixed location, e.g. from the configuration.
+    """
+    def __init__(self, location: Mapping[str, str]):
+        self._location = dict(UNKNOWN_LOCATION, **location)
+
+    def get_location(self) -> Optional[Mapping[str, str]]:
+        return self._location
+
+
+class IpInfoLocationProvider(LocationProvider):
+    """
+    Looks up the location from the public IP address at ipinfo.io. Every call to :meth:`get_location` makes an
+    HTTP request and blocks until it completes.
+    """
+    def __init__(self, url: str = "https://ipinfo.io", timeout: float = 5):
+        self._url = url
+        self._timeout = timeout
+
+    def get_location(self) -> Optional[Mapping[str, str]]:
+        try:
+            return dict(UNKNOWN_LOCATION, **requests.get(self._url, timeout=self._timeout).json())
+        except:
+            logger.warning("Failed to look up location from %s", self._url)
+            return None
+
+
+class LocationCache:
+    """
+    Stores a location with the time it was retrieved in a file.
+    """
+    def __init__(self, path: Union[str, Path], ttl: float):
+        """
+        :param path: File to store the location in
+        :param ttl: Time in seconds after which a stored location should be refreshed
+        """
+        self._path = Path(path)
+        self._ttl = ttl
+
+    def load(self) -> Tuple[Optional[Mapping[str, str]], bool]:
+        """
+        Load the stored location.
+
+        :return: The location or None, and whether the location is still fresh
+        """
+        try:
+            with open(self._path) as cache_file:
+                cached = json.load(cache_file)
+        except FileNotFoundError:
+            return None, False
+        except:
+            logger.warning("Failed to read cached location from %s", self._path)
+            return None, False
+
+        return cached["location"], time.time() - cached["timestamp"] < self._ttl
+
+    def store(self, location: Mapping[str, str]):
+        try:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self._path, "w") as cache_file:
+                json.dump({"location": location, "timestamp": time.time()}, cache_file)
+        except:
+            logger.warning("Failed to cache location in %s", self._path)
+
+
+class BackgroundLocationProvider(LocationProvider):
+    """
+    Non-blocking location provider that refreshes the location from another provider in a background thread.
+
+    :meth:`get_location` returns the most recent location immediately, initially the location in the cache,
+    if any. The location is refreshed when the cache is missing or expired and then periodically.
+    """
+    def __init__(self, provider: LocationProvider, cache: LocationCache = None, refresh_interval: float = 3600,
+                 retry_interval: float = 60):
+        """
+        :param provider: The provider to refresh the location from, may block
+        :param cache: Optional cache for the location
+        :param refresh_interval: Interval in seconds between refreshes of the location
+        :param retry_interval: Interval in seconds to retry a failed refresh
+        """
+        self._provider = provider
+        self._cache = cache
+        self._refresh_interval = refresh_interval
+        self._retry_interval = retry_interval
+
+        self._location = None
+        self._fresh = False
+        if cache:
+            self._location, self._fresh = cache.load()
+
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def get_location(self) -> Optional[Mapping[str, str]]:
+        return self._location
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name=self.__class__.__name__, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        interval = self._refresh_interval if self._fresh else 0
+        while not self._stopped.wait(interval):
+            location = self._provider.get_location()
+            if location:
+                self._location = location
+                if self._cache:
+                    self._cache.store(location)
+                logger.info("Refreshed location: %s", location)
+
+            interval = self._refresh_interval if location else self._retry_interval
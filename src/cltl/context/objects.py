@@ -0,0 +1,88 @@
+from collections import Counter, deque
+from typing import Iterable, List, Mapping
+
+
+class ObjectPresence:
+    """
+    Incremental record of the objects present in a scenario.
+
+    For every label the number of instances is the maximal number of instances detected at once within a sliding
+    time window, together with the time the label was last seen. Labels that were not seen within the window are
+    dropped, such that the record only contains recently seen objects.
+
+    The counts per label are maintained with a monotonic queue of (timestamp, count) pairs, updates take amortized
+    constant time per label in the update.
+    """
+    def __init__(self, window: int):
+        """
+        :param window: Length of the sliding window in milliseconds
+        """
+        self._window = window
+        self._detections = dict()
+        self._last_seen = dict()
+
+    def __len__(self):
+        return len(self._detections)
+
+    def __contains__(self, label):
+        return label in self._detections
+
+    def update(self, labels: Iterable[str], timestamp: int) -> bool:
+        """
+        Add the labels of the objects detected at the given timestamp, one label per detected instance.
+
+        :return: True if the count of any label changed
+        """
+        changed = False
+        for label, count in Counter(labels).items():
+            detections = self._detections.get(label)
+            if detections is None:
+                detections = self._detections[label] = deque()
+            previous = detections[0][1] if detections else 0
+
+            while detections and detections[-1][1] <= count:
+                detections.pop()
+            detections.append((timestamp, count))
+            self._drop_outdated(detections, timestamp)
+
+            self._last_seen[label] = timestamp
+            changed |= detections[0][1] != previous
+
+        return changed
+
+    def expire(self, timestamp: int) -> bool:
+        """
+        Remove detections that are older than the window at the given timestamp.
+
+        :return: True if the count of any label changed
+        """
+        changed = False
+        for label in list(self._detections):
+            detections = self._detections[label]
+            previous = detections[0][1]
+            self._drop_outdated(detections, timestamp)
+
+            if not detections:
+                del self._detections[label]
+                del self._last_seen[label]
+                changed = True
+            else:
+                changed |= detections[0][1] != previous
+
+        return changed
+
+    def counts(self) -> Mapping[str, int]:
+        return {label: detections[0][1] for label, detections in self._detections.items()}
+
+    def last_seen(self) -> Mapping[str, int]:
+        return dict(self._last_seen)
+
+    def labels(self) -> List[str]:
+        """
+        List of labels with one entry per object instance.
+        """
+        return [label for label, detections in self._detections.items() for _ in range(detections[0][1])]
+
+    def _drop_outdated(self, detections, timestamp):
+        while detections and detections[0][0] <= timestamp - self._window:
+            detections.popleft()
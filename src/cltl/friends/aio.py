@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Union, Iterable, List, Tuple, Mapping, Coroutine
+
+import requests
+from cltl.brain.infrastructure.rdf_builder import RdfBuilder
+from requests.adapters import HTTPAdapter
+
+from cltl.friends.api import AsyncFriendStore, FriendStore
+from cltl.friends.brain import BrainFriendsStore
+from cltl.friends.memory import MemoryFriendsStore
+from cltl.friends.querying import faces_by_id_query, parse_faces_by_id
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundEventLoop:
+    """
+    asyncio event loop running in a daemon thread, to run coroutines from synchronous code.
+    """
+    def __init__(self, name: str = None):
+        self._name = name
+        self._loop = None
+        self._thread = None
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name=self._name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self._loop:
+            return
+
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+        self._thread = None
+
+    def submit(self, coroutine: Coroutine) -> Future:
+        """
+        Schedule the coroutine on the event loop and return a future for its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+
+class AsyncMemoryFriendsStore(AsyncFriendStore):
+    """
+    AsyncFriendStore for friend stores that are held in memory, i.e. the MemoryFriendsStore. Calls are passed
+    directly to the wrapped store and run on the event loop, use :class:`AsyncThreadedFriendsStore` for stores
+    that may block.
+    """
+    def __init__(self, store: FriendStore = None):
+        self._store = store if store is not None else MemoryFriendsStore()
+
+    async def add_friend(self, identifier: str, names: Union[str, Iterable[str]],
+                         scenario_id: str = None, mention_id: str = None) -> str:
+        return self._store.add_friend(identifier, names, scenario_id=scenario_id, mention_id=mention_id)
+
+    async def add_friends(self, entries: Iterable[Tuple[str, Union[str, Iterable[str]]]]) -> List[str]:
+        return self._store.add_friends(entries)
+
+    async def get_friend(self, identifier: str) -> Tuple[str, List[str]]:
+        return self._store.get_friend(identifier)
+
+    async def get_friends_by_ids(self, identifiers: Iterable[str]) -> Mapping[str, Tuple[str, List[str]]]:
+        return self._store.get_friends_by_ids(identifiers)
+
+    async def find_by_name(self, query: str, fuzzy: bool = False,
+                           limit: int = 10) -> Mapping[str, Tuple[str, List[str]]]:
+        return self._store.find_by_name(query, fuzzy=fuzzy, limit=limit)
+
+    async def get_friends(self) -> Mapping[str, Tuple[str, List[str]]]:
+        return self._store.get_friends()
+
+    async def get_identifieres(self) -> List[str]:
+        return self._store.get_identifieres()
+
+
+class AsyncThreadedFriendsStore(AsyncFriendStore):
+    """
+    AsyncFriendStore for friend stores that may block, e.g. a cached or replicated BrainFriendsStore.
+
+    All calls are delegated to the wrapped store in a thread pool, such that they do not block the event loop.
+    Calls to stores that are not thread safe are run one at a time on a single thread.
+    """
+    def __init__(self, store: FriendStore, pool_size: int = 8, thread_safe: bool = False):
+        """
+        :param store: The FriendStore to delegate to
+        :param pool_size: Maximum number of concurrent calls to the store, if it is thread safe
+        :param thread_safe: Whether the store can be called concurrently from multiple threads
+        """
+        self._store = store
+        self._executor = ThreadPoolExecutor(max_workers=pool_size if thread_safe else 1,
+                                            thread_name_prefix=self.__class__.__name__)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    async def add_friend(self, identifier: str, names: Union[str, Iterable[str]],
+                         scenario_id: str = None, mention_id: str = None) -> str:
+        return await self._run(self._store.add_friend, identifier, names, scenario_id, mention_id)
+
+    async def add_friends(self, entries: Iterable[Tuple[str, Union[str, Iterable[str]]]]) -> List[str]:
+        return await self._run(self._store.add_friends, list(entries))
+
+    async def get_friend(self, identifier: str) -> Tuple[str, List[str]]:
+        return await self._run(self._store.get_friend, identifier)
+
+    async def get_friends_by_ids(self, identifiers: Iterable[str]) -> Mapping[str, Tuple[str, List[str]]]:
+        return await self._run(self._store.get_friends_by_ids, list(identifiers))
+
+    async def find_by_name(self, query: str, fuzzy: bool = False,
+                           limit: int = 10) -> Mapping[str, Tuple[str, List[str]]]:
+        return await self._run(self._store.find_by_name, query, fuzzy, limit)
+
+    async def get_friends(self) -> Mapping[str, Tuple[str, List[str]]]:
+        return await self._run(self._store.get_friends)
+
+    async def get_identifieres(self) -> List[str]:
+        return list(await self._run(self._store.get_identifieres))
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+
+class AsyncBrainFriendsStore(AsyncFriendStore):
+    """
+    AsyncFriendStore for the brain.
+
+    Lookups by identifier are sent directly to the SPARQL endpoint of the brain over a pool of HTTP connections,
+    such that multiple lookups can be in flight concurrently. All other calls are delegated to the wrapped
+    BrainFriendsStore in a thread pool.
+    """
+    def __init__(self, store: BrainFriendsStore, pool_size: int = 8, timeout: float = 10):
+        """
+        :param store: The BrainFriendsStore to use for writes and bulk reads
+        :param pool_size: Maximum number of concurrent requests to the brain
+        :param timeout: Timeout of lookup requests in seconds
+        """
+        self._store = store
+        self._timeout = timeout
+        self._rdf_builder = RdfBuilder()
+
+        self._session = requests.Session()
+        self._session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self._session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix=self.__class__.__name__)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._session.close()
+
+    async def add_friend(self, identifier: str, names: Union[str, Iterable[str]],
+                         scenario_id: str = None, mention_id: str = None) -> str:
+        return await self._run(self._store.add_friend, identifier, names, scenario_id, mention_id)
+
+    async def add_friends(self, entries: Iterable[Tuple[str, Union[str, Iterable[str]]]]) -> List[str]:
+        return await self._run(self._store.add_friends, list(entries))
+
+    async def get_friend(self, identifier: str) -> Tuple[str, List[str]]:
+        return (await self.get_friends_by_ids([identifier]))[identifier]
+
+    async def get_friends_by_ids(self, identifiers: Iterable[str]) -> Mapping[str, Tuple[str, List[str]]]:
+        face_uris = {identifier: self._create_uri(identifier) for identifier in identifiers}
+        query = faces_by_id_query(face_uris.values())
+        friends = parse_faces_by_id(await self._run(self._query, query)) if query else {}
+
+        return {identifier: friends.get(uri, (None, None)) for identifier, uri in face_uris.items()}
+
+    async def find_by_name(self, query: str, fuzzy: bool = False,
+                           limit: int = 10) -> Mapping[str, Tuple[str, List[str]]]:
+        return await self._run(self._store.find_by_name, query, fuzzy, limit)
+
+    async def get_friends(self) -> Mapping[str, Tuple[str, List[str]]]:
+        return await self._run(self._store.get_friends)
+
+    async def get_identifieres(self) -> List[str]:
+        return list(await self._run(self._store.get_identifieres))
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    def _query(self, query):
+        response = self._session.post(self._store.address, data={'query': query},
+                                      headers={'Accept': 'application/sparql-results+json'},
+                                      timeout=self._timeout)
+        response.raise_for_status()
+
+        return response.json()['results']['bindings']
+
+    def _create_uri(self, label):
+        return str(self._rdf_builder.create_resource_uri('LW', label.lower()))
@@ -9,12 +9,40 @@ class FriendStore:
         """
         raise NotImplementedError()
 
+    def add_friends(self, entries: Iterable[Tuple[str, Union[str, Iterable[str]]]]) -> List[str]:
+        """
+        Add multiple friends, given as pairs of identifier and one or more names, and return the URIs identifying
+        the friends in the order of the entries.
+        """
+        return [self.add_friend(identifier, names) for identifier, names in entries]
+
     def get_friend(self, identifier: str) -> Tuple[str, List[str]]:
         """
         Get the URI and names of a friend by identifier.
         """
         raise NotImplementedError()
 
+    def get_friends_by_ids(self, identifiers: Iterable[str]) -> Mapping[str, Tuple[str, List[str]]]:
+        """
+        Get a mapping from the given identifiers to the URI and names of the friend, or (None, None) for
+        identifiers without a friend.
+        """
+        return {identifier: self.get_friend(identifier) for identifier in identifiers}
+
+    def find_by_name(self, query: str, fuzzy: bool = False, limit: int = 10) -> Mapping[str, Tuple[str, List[str]]]:
+        """
+        Find friends with a name that starts with the query, or that is similar to the query if fuzzy is set.
+
+        Returns a mapping from friend identifiers to the URI and names, ordered by relevance.
+        """
+        from cltl.friends.index import NameIndex
+
+        friends = self.get_friends()
+        index = NameIndex()
+        index.update((identifier, names) for identifier, (_, names) in friends.items())
+
+        return {identifier: friends[identifier] for identifier in index.search(query, fuzzy=fuzzy, limit=limit)}
+
     def get_friends(self) -> Mapping[str, Tuple[str, List[str]]]:
         """
         Get a mapping from friend identifiers to the URI and names.
@@ -26,3 +54,37 @@ class FriendStore:
         Get all identifiers from the FriendStore.
         """
         raise NotImplementedError()
+
+
+class AsyncFriendStore:
+    """
+    Asynchronous version of the :class:`FriendStore` interface.
+    """
+    async def add_friend(self, identifier: str, names: Union[str, Iterable[str]],
+                         scenario_id: str = None, mention_id: str = None) -> str:
+        raise NotImplementedError()
+
+    async def add_friends(self, entries: Iterable[Tuple[str, Union[str, Iterable[str]]]]) -> List[str]:
+        raise NotImplementedError()
+
+    async def get_friend(self, identifier: str) -> Tuple[str, List[str]]:
+        raise NotImplementedError()
+
+    async def get_friends_by_ids(self, identifiers: Iterable[str]) -> Mapping[str, Tuple[str, List[str]]]:
+        raise NotImplementedError()
+
+    async def find_by_name(self, query: str, fuzzy: bool = False,
+                           limit: int = 10) -> Mapping[str, Tuple[str, List[str]]]:
+        raise NotImplementedError()
+
+    async def get_friends(self) -> Mapping[str, Tuple[str, List[str]]]:
+        raise NotImplementedError()
+
+    async def get_identifieres(self) -> List[str]:
+        raise NotImplementedError()
+
+    def close(self):
+        """
+        Release resources held by the store, e.g. thread or connection pools.
+        """
+        pass
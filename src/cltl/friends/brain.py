@@ -1,4 +1,6 @@
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import itertools
 from pathlib import Path
@@ -9,6 +11,7 @@ from cltl.combot.infra.time_util import timestamp_now
 from cltl.commons.discrete import UtteranceType
 
 from cltl.friends.api import FriendStore
+from cltl.friends.index import NameIndex
 from cltl.friends.querying import FriendSearch
 
 
@@ -16,10 +19,41 @@ logger = logging.getLogger(__name__)
 
 
 class BrainFriendsStore(FriendStore):
-    def __init__(self, address, log_dir):
+    def __init__(self, address, log_dir, direct_insert: bool = False):
+        """
+        :meth:`add_friend` writes the faceID, label and registration triples with a single update and then adds the
+        statement capsules with perspective and provenance.
+
+        :param address: Address of the triple store
+        :param log_dir: Directory for the brain logs
+        :param direct_insert: If set, the statement capsules are added asynchronously in the background
+        """
         super().__init__()
+        self._address = address
+        self._log_dir = log_dir
         self._rdf_builder = RdfBuilder()
         self._search = FriendSearch(address, log_dir)
+        # The brain builds the statement capsules in a local graph of the client, which is not thread safe
+        self._capsule_lock = threading.Lock()
+        self._index = None
+        self._index_lock = threading.Lock()
+
+        self._direct_insert = direct_insert
+        self._provenance_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="FriendsProvenance") \
+            if direct_insert else None
+        # Brain client of the provenance thread, created on the first use
+        self._provenance_search = None
+
+    @property
+    def address(self) -> str:
+        return self._address
+
+    def close(self):
+        """
+        Wait for pending provenance statements to be written.
+        """
+        if self._provenance_executor:
+            self._provenance_executor.shutdown(wait=True)
 
     def add_friend(self, identifier: str, names: Union[str, Iterable[str]],
                    scenario_id: str = None, mention_id: str = None) -> str:
@@ -28,21 +62,76 @@ class BrainFriendsStore(FriendStore):
 
         names = [names] if isinstance(names, str) else names
 
-        uri, _ = self._search.search_entity_by_face(self._create_uri(identifier))
-        self._search.capsule_statement(
-            self._create_speaker_capsule(scenario_id, mention_id, uri, identifier, names[0]),
-            create_label=True)
-
-        if not uri:
-            uri, _ = self._search.search_entity_by_face(self._create_uri(identifier))
+        if self._direct_insert:
+            uri = self._insert_friend(identifier, names, scenario_id, mention_id)
+        else:
+            uri = self._capsule_friend(identifier, names, scenario_id, mention_id)
 
-        for name in names[1:]:
-            self._search.capsule_statement(
-                self._create_speaker_capsule(scenario_id, mention_id, uri, identifier, name),
-                create_label=True)
+        if self._index is not None:
+            self._index.update([(identifier, names)], replace=False)
 
         return str(uri) if uri is not None else None
 
+    def _capsule_friend(self, identifier, names, scenario_id, mention_id):
+        uri = self._insert_face(identifier, names)
+
+        with self._capsule_lock:
+            for name in names:
+                self._search.capsule_statement(
+                    self._create_speaker_capsule(scenario_id, mention_id, uri, identifier, name),
+                    create_label=True, return_thoughts=False)
+
+        return uri
+
+    def _insert_friend(self, identifier, names, scenario_id, mention_id):
+        uri = self._insert_face(identifier, names)
+
+        if uri:
+            capsules = [self._create_speaker_capsule(scenario_id, mention_id, uri, identifier, name)
+                        for name in names]
+            self._provenance_executor.submit(self._add_provenance, capsules)
+
+        return uri
+
+    def _insert_face(self, identifier, names):
+        face_uri = self._create_uri(identifier)
+        self._search.insert_faces([(face_uri, self._search.create_uri(names[0]), names)], timestamp_now())
+        uri, _ = self._search.search_entities_by_faces([face_uri]).get(face_uri, (None, None))
+
+        return uri
+
+    def _add_provenance(self, capsules):
+        # Runs on the single provenance thread, which uses its own brain client
+        try:
+            if self._provenance_search is None:
+                self._provenance_search = FriendSearch(self._address, self._log_dir)
+            for capsule in capsules:
+                self._provenance_search.capsule_statement(capsule, create_label=True, return_thoughts=False)
+        except:
+            logger.exception("Failed to add provenance for friend %s", capsules[0]['object']['label'])
+
+    def add_friends(self, entries: Iterable[Tuple[str, Union[str, Iterable[str]]]]) -> List[str]:
+        """
+        Add friends in bulk.
+
+        All faceID and label triples are written with a single update request and the URIs of the friends are
+        resolved with a single query afterwards. In contrast to :meth:`add_friend` no statement capsules are
+        created, i.e. the triples are added without perspective and provenance.
+        """
+        entries = [(identifier, [names] if isinstance(names, str) else list(names)) for identifier, names in entries]
+        face_uris = [self._create_uri(identifier) for identifier, _ in entries]
+
+        self._search.insert_faces(((face_uri, self._search.create_uri(names[0]), names)
+                                   for face_uri, (_, names) in zip(face_uris, entries) if names),
+                                  timestamp_now())
+        friends = self._search.search_entities_by_faces(face_uri for face_uri, (_, names) in zip(face_uris, entries)
+                                                        if names)
+
+        if self._index is not None:
+            self._index.update(entries, replace=False)
+
+        return [str(friends[face_uri][0]) if face_uri in friends else None for face_uri in face_uris]
+
     def get_friend(self, identifier: str) -> Tuple[str, List[str]]:
         """
         Find friends.
@@ -53,8 +142,53 @@ class BrainFriendsStore(FriendStore):
 
         return str(uri) if uri is not None else None, names
 
+    def get_friends_by_ids(self, identifiers: Iterable[str]) -> Mapping[str, Tuple[str, List[str]]]:
+        face_uris = {identifier: self._create_uri(identifier) for identifier in identifiers}
+        friends = self._search.search_entities_by_faces(face_uris.values())
+
+        return {identifier: (str(friends[uri][0]), friends[uri][1]) if uri in friends else (None, None)
+                for identifier, uri in face_uris.items()}
+
+    def find_by_name(self, query: str, fuzzy: bool = False, limit: int = 10) -> Mapping[str, Tuple[str, List[str]]]:
+        """
+        Find friends by name using an in-memory name index.
+
+        The index is loaded from the brain on the first call and kept up to date by friends added through this
+        store. The friends found in the index are resolved from the brain with a single query.
+        """
+        with self._index_lock:
+            if self._index is None:
+                index = NameIndex()
+                index.update((identifier, names) for identifier, (_, names) in self.get_friends().items())
+                self._index = index
+
+        return self.get_friends_by_ids(self._index.search(query, fuzzy=fuzzy, limit=limit))
+
     def get_friends(self) -> Mapping[str, Tuple[str, List[str]]]:
-        face_entries = self._search.search_faces()
+        faces = dict()
+        for face_id, uri, names, persons in self._search.stream_faces():
+            if persons > 1:
+                logger.warning("Face is assigned to multiple persons: %s", face_id)
+
+            faces[face_id] = uri, names
+
+        return faces
+
+    def get_friends_since(self, timestamp: int) -> Tuple[Mapping[str, Tuple[str, List[str]]], int]:
+        """
+        Get the friends registered at or after the given timestamp.
+
+        Only faces registered through this class are marked with a registration timestamp.
+
+        :param timestamp: Registration timestamp in milliseconds
+        :return: Mapping from friend identifiers to the URI and names, and the latest registration timestamp found
+        """
+        face_entries = self._search.search_faces_since(timestamp)
+        latest = max((entry[3] for entry in face_entries), default=timestamp)
+
+        return self._group_faces(list(dict.fromkeys(entry[:3] for entry in face_entries))), latest
+
+    def _group_faces(self, face_entries):
         if not face_entries:
             return {}
 
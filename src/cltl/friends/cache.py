@@ -0,0 +1,157 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Union, Iterable, List, Tuple, Mapping
+
+from cltl.friends.api import FriendStore
+
+logger = logging.getLogger(__name__)
+
+
+_NOT_FOUND = (None, None)
+
+
+class CachedFriendsStore(FriendStore):
+    """
+    Read-through cache in front of another FriendStore.
+
+    Lookups by identifier are served from a bounded LRU cache with an optional time to live. Unknown identifiers
+    are cached as well (negative caching), so repeated lookups of faces without a registered friend do not
+    reach the underlying store either. Writes go to the underlying store and invalidate the affected entries.
+    """
+    def __init__(self, store: FriendStore, max_size: int = 1024, ttl: float = None, negative_ttl: float = None):
+        """
+        :param store: The FriendStore to cache
+        :param max_size: Maximum number of cached identifiers, the least recently used entry is evicted first
+        :param ttl: Time to live of cache entries in seconds, None to keep entries until they are evicted
+        :param negative_ttl: Time to live of entries for unknown identifiers, defaults to ttl
+        """
+        super().__init__()
+        self._store = store
+        self._max_size = max_size
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl if negative_ttl is not None else ttl
+
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def hits(self) -> int:
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        return self._misses
+
+    @property
+    def stats(self) -> Mapping[str, int]:
+        with self._lock:
+            return {"hits": self._hits, "misses": self._misses, "size": len(self._cache)}
+
+    def invalidate(self, identifier: str = None):
+        """
+        Remove the entry for the given identifier from the cache, or clear the cache if no identifier is given.
+        """
+        with self._lock:
+            if identifier is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(identifier, None)
+
+    def add_friend(self, identifier: str, names: Union[str, Iterable[str]],
+                   scenario_id: str = None, mention_id: str = None) -> str:
+        try:
+            return self._store.add_friend(identifier, names, scenario_id=scenario_id, mention_id=mention_id)
+        finally:
+            self.invalidate(identifier)
+
+    def add_friends(self, entries: Iterable[Tuple[str, Union[str, Iterable[str]]]]) -> List[str]:
+        entries = list(entries)
+        try:
+            return self._store.add_friends(entries)
+        finally:
+            with self._lock:
+                for identifier, _ in entries:
+                    self._cache.pop(identifier, None)
+
+    def get_friend(self, identifier: str) -> Tuple[str, List[str]]:
+        with self._lock:
+            cached = self._lookup(identifier)
+            if cached is not None:
+                self._hits += 1
+                return cached
+            self._misses += 1
+
+        friend = self._store.get_friend(identifier)
+        friend = friend if friend is not None else _NOT_FOUND
+
+        with self._lock:
+            self._insert(identifier, friend)
+
+        return friend
+
+    def get_friends_by_ids(self, identifiers: Iterable[str]) -> Mapping[str, Tuple[str, List[str]]]:
+        identifiers = list(identifiers)
+
+        friends = dict()
+        with self._lock:
+            for identifier in identifiers:
+                cached = self._lookup(identifier)
+                if cached is not None:
+                    friends[identifier] = cached
+            self._hits += len(friends)
+            self._misses += len(set(identifiers) - friends.keys())
+
+        missing = [identifier for identifier in dict.fromkeys(identifiers) if identifier not in friends]
+        if missing:
+            fetched = self._store.get_friends_by_ids(missing)
+            with self._lock:
+                for identifier in missing:
+                    friend = fetched.get(identifier) or _NOT_FOUND
+                    self._insert(identifier, friend)
+                    friends[identifier] = friend
+
+        return friends
+
+    def find_by_name(self, query: str, fuzzy: bool = False, limit: int = 10) -> Mapping[str, Tuple[str, List[str]]]:
+        return self._store.find_by_name(query, fuzzy=fuzzy, limit=limit)
+
+    def get_friends(self) -> Mapping[str, Tuple[str, List[str]]]:
+        return self._store.get_friends()
+
+    def get_identifieres(self) -> List[str]:
+        return self._store.get_identifieres()
+
+    def _lookup(self, identifier):
+        if identifier not in self._cache:
+            return None
+
+        friend, expires = self._cache[identifier]
+        if expires is not None and expires < time.monotonic():
+            del self._cache[identifier]
+            return None
+
+        self._cache.move_to_end(identifier)
+
+        return friend
+
+    def _insert(self, identifier, friend):
+        ttl = self._negative_ttl if self._is_unknown(friend) else self._ttl
+        expires = time.monotonic() + ttl if ttl is not None else None
+
+        self._cache[identifier] = (friend, expires)
+        self._cache.move_to_end(identifier)
+
+        while len(self._cache) > self._max_size:
+            evicted, _ = self._cache.popitem(last=False)
+            logger.debug("Evicted %s from friend cache", evicted)
+
+    @staticmethod
+    def _is_unknown(friend):
+        uri, names = friend
+
+        return not uri and not names
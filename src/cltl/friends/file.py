@@ -0,0 +1,149 @@
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Union, Iterable, List, Tuple, Mapping
+
+from cltl.friends.api import FriendStore
+from cltl.friends.index import NameIndex
+
+logger = logging.getLogger(__name__)
+
+
+class FileFriendsStore(FriendStore):
+    """
+    FriendStore that persists friends in a local directory.
+
+    Added friends are journaled to an append-only log, which is compacted into a snapshot of all friends once it
+    grows beyond a configured number of entries. On startup the snapshot is loaded and the log is replayed on top.
+    """
+    SNAPSHOT_FILE = "friends.json"
+    LOG_FILE = "friends.log"
+
+    def __init__(self, path: Union[str, Path], compact_after: int = 1000, sync: bool = False):
+        """
+        :param path: Directory in which the snapshot and log are stored
+        :param compact_after: Number of log entries after which the log is compacted into the snapshot
+        :param sync: Whether to fsync the log after every write
+        """
+        super().__init__()
+        self._path = Path(path)
+        self._compact_after = compact_after
+        self._sync = sync
+
+        self._lock = threading.Lock()
+
+        self._path.mkdir(parents=True, exist_ok=True)
+        self._friends = self._load_snapshot()
+        self._log_size = self._replay_log()
+        self._log = open(self._path / self.LOG_FILE, "a", encoding="utf-8")
+
+        self._index = NameIndex()
+        self._index.update((identifier, names) for identifier, (_, names) in self._friends.items())
+
+        logger.info("Loaded %s friends from %s (%s log entries)", len(self._friends), self._path, self._log_size)
+
+    def add_friend(self, identifier: str, names: Union[str, Iterable[str]],
+                   scenario_id: str = None, mention_id: str = None) -> str:
+        return self.add_friends([(identifier, names)])[0]
+
+    def add_friends(self, entries: Iterable[Tuple[str, Union[str, Iterable[str]]]]) -> List[str]:
+        entries = [(identifier, [names] if isinstance(names, str) else list(names)) for identifier, names in entries]
+
+        with self._lock:
+            self._write_log(entries)
+            self._friends.update((identifier, (None, names)) for identifier, names in entries)
+            self._index.update(entries)
+
+            if self._log_size >= self._compact_after:
+                self._compact()
+
+        return [None] * len(entries)
+
+    def get_friend(self, identifier: str) -> Tuple[str, List[str]]:
+        return self._friends.get(identifier, (None, None))
+
+    def get_friends_by_ids(self, identifiers: Iterable[str]) -> Mapping[str, Tuple[str, List[str]]]:
+        return {identifier: self.get_friend(identifier) for identifier in identifiers}
+
+    def find_by_name(self, query: str, fuzzy: bool = False, limit: int = 10) -> Mapping[str, Tuple[str, List[str]]]:
+        return {identifier: self._friends[identifier]
+                for identifier in self._index.search(query, fuzzy=fuzzy, limit=limit)}
+
+    def get_friends(self) -> Mapping[str, Tuple[str, List[str]]]:
+        return dict(self._friends)
+
+    def get_identifieres(self) -> List[str]:
+        return self.get_friends().keys()
+
+    def compact(self):
+        """
+        Write all friends to the snapshot and truncate the log.
+        """
+        with self._lock:
+            self._compact()
+
+    def close(self):
+        with self._lock:
+            self._log.close()
+
+    def _load_snapshot(self):
+        snapshot_path = self._path / self.SNAPSHOT_FILE
+        if not snapshot_path.exists():
+            return dict()
+
+        with open(snapshot_path, "rb") as snapshot:
+            friends = json.loads(snapshot.read())
+
+        return {identifier: (uri, names) for identifier, (uri, names) in friends.items()}
+
+    def _replay_log(self):
+        log_path = self._path / self.LOG_FILE
+        if not log_path.exists():
+            return 0
+
+        count = 0
+        valid_size = 0
+        with open(log_path, "rb") as log:
+            for line in log:
+                try:
+                    entry = json.loads(line) if line.endswith(b"\n") else None
+                except json.JSONDecodeError:
+                    entry = None
+
+                if entry is None:
+                    logger.warning("Discard incomplete entries at the end of the friends log %s", log_path)
+                    break
+
+                self._friends[entry["id"]] = (None, entry["names"])
+                valid_size += len(line)
+                count += 1
+
+        if valid_size < log_path.stat().st_size:
+            os.truncate(log_path, valid_size)
+
+        return count
+
+    def _write_log(self, entries):
+        self._log.write("".join(json.dumps({"id": identifier, "names": names}) + "\n"
+                                for identifier, names in entries))
+        self._log.flush()
+        if self._sync:
+            os.fsync(self._log.fileno())
+
+        self._log_size += len(entries)
+
+    def _compact(self):
+        snapshot_path = self._path / self.SNAPSHOT_FILE
+        tmp_path = snapshot_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as snapshot:
+            json.dump(self._friends, snapshot, separators=(",", ":"))
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        os.replace(tmp_path, snapshot_path)
+
+        self._log.truncate(0)
+        self._log_size = 0
+
+        logger.debug("Compacted %s friends to %s", len(self._friends), snapshot_path)
@@ -0,0 +1,218 @@
+import bisect
+import math
+import re
+import threading
+import unicodedata
+from collections import defaultdict, Counter
+from typing import Iterable, List, Tuple
+
+
+_NON_ALPHANUMERIC = re.compile(r"[\W_]+")
+
+
+def normalize_name(name: str) -> str:
+    """
+    Normalize a name for lookup: remove diacritics, case-fold and collapse punctuation and whitespace.
+    """
+    decomposed = unicodedata.normalize("NFKD", name)
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+
+    return _NON_ALPHANUMERIC.sub(" ", stripped.casefold()).strip()
+
+
+class NameIndex:
+    """
+    In-memory index from names to identifiers with prefix and fuzzy lookup.
+
+    Every name is indexed with its normalized full form and with each of its trailing words, such that
+    "Thomas Baier" is found by both "tho" and "bai". Prefix lookup uses sorted arrays of the full names and of
+    all indexed terms, and ranks matches of the full name before matches of a later word. Fuzzy lookup uses a
+    character n-gram index scored by the Dice coefficient. Candidates are collected from the least frequent
+    n-grams of the query first, and at most max_candidates are collected before scoring, such that queries
+    with n-grams shared by most names remain fast.
+    """
+    def __init__(self, ngram: int = 3, threshold: float = 0.4, max_candidates: int = 1000):
+        """
+        :param ngram: Length of the character n-grams used for fuzzy lookup
+        :param threshold: Minimal similarity of fuzzy matches, between 0 and 1
+        :param max_candidates: Number of candidates after which fuzzy lookup stops to collect new candidates
+        """
+        self._n = ngram
+        self._threshold = threshold
+        self._max_candidates = max_candidates
+
+        self._terms = []
+        self._pending_terms = set()
+        # Sorted full names and the number of identifiers per full name
+        self._names = []
+        self._pending_names = set()
+        self._name_counts = Counter()
+        self._id_names = dict()
+        self._term_ids = defaultdict(set)
+        self._id_terms = dict()
+        self._grams = defaultdict(set)
+        self._gram_counts = dict()
+
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._id_terms)
+
+    def add(self, identifier: str, names: Iterable[str]):
+        """
+        Index the names of an identifier, replacing previously indexed names.
+        """
+        self.update([(identifier, names)])
+
+    def update(self, entries: Iterable[Tuple[str, Iterable[str]]], replace: bool = True):
+        """
+        Index the names of multiple identifiers, given as pairs of identifier and names.
+
+        If replace is set, previously indexed names of the identifiers are removed, otherwise the names are
+        added to them.
+        """
+        with self._lock:
+            for identifier, names in entries:
+                if replace:
+                    self.remove(identifier)
+
+                names = [names] if isinstance(names, str) else names or ()
+                full_names = {normalize_name(name) for name in names if name} - {""}
+                terms = {term for name in full_names for term in self._terms_of(name)}
+                self._id_terms[identifier] = self._id_terms.get(identifier, set()) | terms
+                for term in terms:
+                    if term not in self._term_ids:
+                        self._index_term(term)
+                        self._pending_terms.add(term)
+                    self._term_ids[term].add(identifier)
+
+                previous_names = self._id_names.get(identifier, set())
+                self._id_names[identifier] = previous_names | full_names
+                for name in full_names - previous_names:
+                    if not self._name_counts[name]:
+                        self._pending_names.add(name)
+                    self._name_counts[name] += 1
+
+            self._insert_pending(self._terms, self._pending_terms)
+            self._insert_pending(self._names, self._pending_names)
+
+    def remove(self, identifier: str):
+        with self._lock:
+            for term in self._id_terms.pop(identifier, ()):
+                self._term_ids[term].discard(identifier)
+                if not self._term_ids[term]:
+                    self._remove_term(term)
+
+            for name in self._id_names.pop(identifier, ()):
+                self._name_counts[name] -= 1
+                if not self._name_counts[name]:
+                    del self._name_counts[name]
+                    self._remove_sorted(self._names, self._pending_names, name)
+
+    def search(self, query: str, fuzzy: bool = False, limit: int = 10) -> List[str]:
+        """
+        Find identifiers with a name matching the query, ordered by relevance.
+
+        Without fuzzy matching names must start with the query, or have a word that starts with the query.
+        With fuzzy matching names are matched by n-gram similarity.
+        """
+        query = normalize_name(query)
+        if not query:
+            return []
+
+        with self._lock:
+            terms = self._fuzzy(query, limit) if fuzzy else self._prefix(query, limit)
+
+            identifiers = dict()
+            for term in terms:
+                # Identifiers with the term as full name before identifiers with the term as later words
+                identifiers.update(dict.fromkeys(sorted(self._term_ids[term],
+                                                        key=lambda identifier: (term not in self._id_names[identifier],
+                                                                                identifier))))
+                if len(identifiers) >= limit:
+                    break
+
+        return list(identifiers)[:limit]
+
+    def _prefix(self, query, limit):
+        # Full names starting with the query are collected separately, as they can sort after many shorter
+        # terms of later words that start with the query
+        names = set(self._starting_with(self._names, query, limit))
+        terms = names.union(self._starting_with(self._terms, query, limit))
+
+        return sorted(terms, key=lambda term: (term != query, term not in names, len(term), term))
+
+    def _starting_with(self, terms, query, limit):
+        matches = []
+        for index in range(bisect.bisect_left(terms, query), len(terms)):
+            term = terms[index]
+            if not term.startswith(query) or len(matches) >= limit:
+                break
+            matches.append(term)
+
+        return matches
+
+    def _fuzzy(self, query, limit):
+        query_grams = self._ngrams(query)
+        postings = sorted((self._grams.get(gram, set()) for gram in query_grams), key=len)
+
+        # A candidate must share at least min_shared n-grams with the query to reach the threshold,
+        # hence it must occur in one of the len(postings) - min_shared + 1 least frequent n-grams.
+        # Once max_candidates are collected, only the n-grams of collected candidates are counted.
+        min_shared = max(1, math.ceil(self._threshold * len(query_grams) / (2 - self._threshold)))
+        candidates = Counter()
+        for index, posting in enumerate(postings):
+            if index < len(postings) - min_shared + 1 and len(candidates) < self._max_candidates:
+                candidates.update(posting)
+            else:
+                candidates.update(posting.intersection(candidates))
+
+        query_count = len(query_grams)
+        gram_counts = self._gram_counts
+        threshold = self._threshold
+        scored = [(-2 * shared / (query_count + gram_counts[term]), len(term), term)
+                  for term, shared in candidates.items()
+                  if shared >= min_shared and 2 * shared >= threshold * (query_count + gram_counts[term])]
+
+        return [term for _, _, term in sorted(scored)[:limit]]
+
+    def _terms_of(self, name):
+        words = name.split(" ")
+
+        return {" ".join(words[i:]) for i in range(len(words))} if name else set()
+
+    def _ngrams(self, term):
+        padded = " " + term + " "
+
+        return {padded[i:i + self._n] for i in range(max(1, len(padded) - self._n + 1))}
+
+    def _index_term(self, term):
+        grams = self._ngrams(term)
+        self._gram_counts[term] = len(grams)
+        for gram in grams:
+            self._grams[gram].add(term)
+
+    def _remove_term(self, term):
+        del self._term_ids[term]
+        del self._gram_counts[term]
+        self._remove_sorted(self._terms, self._pending_terms, term)
+        for gram in self._ngrams(term):
+            self._grams[gram].discard(term)
+            if not self._grams[gram]:
+                del self._grams[gram]
+
+    @staticmethod
+    def _insert_pending(terms, pending):
+        if len(pending) > 16:
+            terms[:] = sorted(terms + list(pending))
+        else:
+            for term in pending:
+                bisect.insort(terms, term)
+        pending.clear()
+
+    @staticmethod
+    def _remove_sorted(terms, pending, term):
+        if term in pending:
+            pending.discard(term)
+        else:
+            del terms[bisect.bisect_left(terms, term)]
@@ -1,21 +1,37 @@
 from typing import Union, Iterable, List, Tuple, Mapping
 
 from cltl.friends.api import FriendStore
+from cltl.friends.index import NameIndex
 
 
 class MemoryFriendsStore(FriendStore):
     def __init__(self):
         super().__init__()
         self._friends = dict()
+        self._index = NameIndex()
 
     def add_friend(self, identifier: str, names: Union[str, Iterable[str]],
                    scenario_id: str = None, mention_id: str = None) -> str:
-        self._friends[identifier] = (None, names)
+        self.add_friends([(identifier, names)])
 
         return None
 
+    def add_friends(self, entries: Iterable[Tuple[str, Union[str, Iterable[str]]]]) -> List[str]:
+        entries = [(identifier, [names] if isinstance(names, str) else list(names)) for identifier, names in entries]
+        self._friends.update((identifier, (None, names)) for identifier, names in entries)
+        self._index.update(entries)
+
+        return [None] * len(entries)
+
     def get_friend(self, identifier: str) -> Tuple[str, List[str]]:
-        return self._friends[identifier]
+        return self._friends.get(identifier, (None, None))
+
+    def get_friends_by_ids(self, identifiers: Iterable[str]) -> Mapping[str, Tuple[str, List[str]]]:
+        return {identifier: self.get_friend(identifier) for identifier in identifiers}
+
+    def find_by_name(self, query: str, fuzzy: bool = False, limit: int = 10) -> Mapping[str, Tuple[str, List[str]]]:
+        return {identifier: self._friends[identifier]
+                for identifier in self._index.search(query, fuzzy=fuzzy, limit=limit)}
 
     def get_friends(self) -> Mapping[str, Tuple[str, List[str]]]:
         return dict(self._friends)
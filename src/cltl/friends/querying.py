@@ -1,11 +1,16 @@
+import logging
+import re
 from pathlib import Path
-from typing import List, Tuple, Mapping
+from typing import Iterable, Iterator, List, Tuple, Mapping
 
 import importlib_resources as pkg_resources
+import requests
 from cltl.brain.long_term_memory import LongTermMemory
 
 import cltl.friends
 
+logger = logging.getLogger(__name__)
+
 
 def read_query(query_filename):
     """
@@ -24,27 +29,168 @@ def read_query(query_filename):
     return (resources / f"{query_filename}.rq").read_text()
 
 
+_FACE_QUERY = read_query('./queries/face')
+_FACES_QUERY = read_query('./queries/faces')
+_FACES_BY_ID_QUERY = read_query('./queries/faces_by_id')
+_FACES_GROUPED_QUERY = read_query('./queries/faces_grouped')
+_FACES_SINCE_QUERY = read_query('./queries/faces_since')
+_INSERT_FACES_QUERY = read_query('./queries/insert_faces')
+
+
+def _literal(value: str) -> str:
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"')
+               .replace('\n', '\\n').replace('\r', '\\r').replace('\t', '\\t'))
+
+    return f'"{escaped}"'
+
+
+def faces_by_id_query(ids: Iterable[str]) -> str:
+    """
+    Create the query for the persons of multiple face URIs, or None if there are no face URIs.
+    """
+    ids = list(dict.fromkeys(ids))
+
+    return _FACES_BY_ID_QUERY % " ".join(f"<{id}>" for id in ids) if ids else None
+
+
+def parse_faces_by_id(bindings) -> Mapping[str, Tuple[str, List[str]]]:
+    """
+    Parse the result bindings of the query created by :func:`faces_by_id_query` to a mapping from face URI to the
+    URI and names of the person.
+    """
+    entities = dict()
+    for entity in bindings or []:
+        face_id = entity['face_id']['value']
+        person, names = entities.setdefault(face_id, (entity['person']['value'], []))
+        if entity['person']['value'] != person:
+            logger.warning("Face is assigned to multiple persons: %s", face_id)
+        else:
+            names.append(entity['name']['value'])
+
+    return entities
+
+
+# Separator of the names concatenated by the faces_grouped query
+_NAME_SEPARATOR = "\u001F"
+
+_TSV_ESCAPE = re.compile(r'\\(u[0-9a-fA-F]{4}|U[0-9a-fA-F]{8}|.)')
+_TSV_ESCAPES = {'t': '\t', 'n': '\n', 'r': '\r', 'b': '\b', 'f': '\f', '"': '"', "'": "'", '\\': '\\'}
+
+
+def _unescape(match):
+    escape = match.group(1)
+    if escape[0] in 'uU' and len(escape) > 1:
+        return chr(int(escape[1:], 16))
+
+    return _TSV_ESCAPES.get(escape, escape)
+
+
+def _parse_tsv_term(term: str):
+    """
+    Parse an RDF term in a SPARQL TSV result, see https://www.w3.org/TR/sparql11-results-csv-tsv/
+    """
+    if not term:
+        return None
+    if term.startswith('<') and term.endswith('>'):
+        return term[1:-1]
+    if term.startswith('"'):
+        end = term.rindex('"')
+        return _TSV_ESCAPE.sub(_unescape, term[1:end])
+
+    return term
+
+
 class FriendSearch(LongTermMemory):
-    def __init__(self, address, log_dir):
+    def __init__(self, address, log_dir, timeout: float = 60):
         super().__init__(address, log_dir)
+        self._address = address
+        self._timeout = timeout
 
     def search_entity_by_face(self, id):
-        query = read_query('./queries/face') % id
+        query = _FACE_QUERY % id
         response = self._submit_query(query)
         if response:
             return response[0]['person']['value'], [entity['name']['value'] for entity in response]
         else:
             return None, None
 
+    def search_entities_by_faces(self, ids: Iterable[str]) -> Mapping[str, Tuple[str, List[str]]]:
+        """
+        Find the persons for multiple face URIs with a single query.
+
+        Returns a mapping from face URI to the URI and names of the person, face URIs without a person are omitted.
+        """
+        query = faces_by_id_query(ids)
+        if not query:
+            return {}
+
+        return parse_faces_by_id(self._submit_query(query))
+
+    def insert_faces(self, entries: Iterable[Tuple[str, str, List[str]]], registered: int):
+        """
+        Insert the person, faceID and label triples for multiple faces in a single update request.
+
+        Entries are triples of face URI, the person URI to use if the face is not yet assigned to a person, and the
+        names of the person. The faces are marked as registered at the given timestamp.
+        """
+        persons = dict()
+        for face, person, names in entries:
+            if names:
+                persons.setdefault(face, (person, dict()))[1].update(dict.fromkeys(names))
+
+        values = [f"(<{face}> <{person}> {_literal(name)})"
+                  for face, (person, names) in persons.items()
+                  for name in names]
+        if values:
+            self._submit_query(_INSERT_FACES_QUERY % {'values': "\n        ".join(values), 'registered': registered},
+                               post=True)
+
+    def search_faces_since(self, registered: int) -> List[Tuple[str, str, str, int]]:
+        """
+        Find the face entries of faces that were registered at or after the given timestamp.
+
+        Returns a list of tuples of face identifier, person URI, name and registration timestamp.
+        """
+        response = self._submit_query(_FACES_SINCE_QUERY % int(registered))
+
+        return [(entity['face_id']['value'].split("/")[-1], entity['person']['value'], entity['name']['value'],
+                 int(entity['registered']['value']))
+                for entity in response or []]
+
     def search_faces(self) -> Mapping[str, Tuple[str, List[str]]]:
-        query = read_query('./queries/faces')
-        response = self._submit_query(query)
+        response = self._submit_query(_FACES_QUERY)
         if response:
             return [(entity['face_id']['value'].split("/")[-1], entity['person']['value'], entity['name']['value'])
                             for entity in response]
         else:
             return None
 
+    def stream_faces(self) -> Iterator[Tuple[str, str, List[str], int]]:
+        """
+        Stream the faces with the names of the person they are assigned to.
+
+        Names are grouped per face in the triple store, and the result is requested as TSV and parsed while it is
+        received, such that neither the response nor the result is held in memory as a whole.
+
+        Returns an iterator of tuples of face identifier, person URI, names and the number of persons the face is
+        assigned to.
+        """
+        with requests.post(self._address, data={'query': _FACES_GROUPED_QUERY},
+                           headers={'Accept': 'text/tab-separated-values'},
+                           stream=True, timeout=self._timeout) as response:
+            response.raise_for_status()
+
+            lines = response.iter_lines()
+            header = [variable.lstrip('?') for variable in next(lines, b'').decode('utf-8').split('\t')]
+            for line in lines:
+                if not line:
+                    continue
+
+                entry = dict(zip(header, map(_parse_tsv_term, line.decode('utf-8').split('\t'))))
+                names = entry['names'].split(_NAME_SEPARATOR) if entry['names'] else []
+
+                yield entry['face_id'].split("/")[-1], entry['friend'], names, int(entry['persons'])
+
     def create_uri(self, label):
         return str(self._rdf_builder.create_resource_uri('LW', label.lower()))
 
@@ -0,0 +1,154 @@
+import logging
+import threading
+import time
+from typing import Union, Iterable, List, Tuple, Mapping
+
+from cltl.friends.api import FriendStore
+from cltl.friends.brain import BrainFriendsStore
+from cltl.friends.index import NameIndex
+
+logger = logging.getLogger(__name__)
+
+
+class ReplicatedFriendsStore(FriendStore):
+    """
+    Local replica of the friends in a BrainFriendsStore.
+
+    The replica loads all friends once and then periodically pulls only the friends registered since the last
+    synchronization in a background thread. Reads are served from the replica, lookups of unknown identifiers
+    fall back to the brain. Writes go to the brain and are applied to the replica immediately.
+
+    The initial load runs in the background thread as well and is retried until it succeeds, such that creating
+    the replica does not block on the brain. Until then reads are served by the brain.
+
+    Friends that are added to the brain without registration timestamp, i.e. not through a BrainFriendsStore,
+    are only picked up by the optional periodic full synchronization.
+    """
+    def __init__(self, store: BrainFriendsStore, sync_interval: float = 5, full_sync_interval: float = None,
+                 overlap: int = 5000):
+        """
+        :param store: The BrainFriendsStore to replicate
+        :param sync_interval: Interval in seconds to pull newly registered friends
+        :param full_sync_interval: Interval in seconds to reload all friends, None to load them only on startup
+        :param overlap: Time in milliseconds by which successive synchronization windows overlap,
+            to account for clock differences between the robots that register friends
+        """
+        super().__init__()
+        self._store = store
+        self._sync_interval = sync_interval
+        self._full_sync_interval = full_sync_interval
+        self._overlap = overlap
+
+        self._lock = threading.Lock()
+        self._friends = dict()
+        self._index = NameIndex()
+        self._watermark = 0
+        self._last_full_sync = None
+
+        self._stopped = threading.Event()
+        self._loaded = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=self.__class__.__name__, daemon=True)
+        self._thread.start()
+
+    @property
+    def loaded(self) -> bool:
+        """
+        True once the replica completed the initial load of the friends.
+        """
+        return self._loaded.is_set()
+
+    def close(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def add_friend(self, identifier: str, names: Union[str, Iterable[str]],
+                   scenario_id: str = None, mention_id: str = None) -> str:
+        uri = self._store.add_friend(identifier, names, scenario_id=scenario_id, mention_id=mention_id)
+        if names:
+            self._merge({identifier: (uri, [names] if isinstance(names, str) else list(names))})
+
+        return uri
+
+    def add_friends(self, entries: Iterable[Tuple[str, Union[str, Iterable[str]]]]) -> List[str]:
+        entries = [(identifier, [names] if isinstance(names, str) else list(names)) for identifier, names in entries]
+        uris = self._store.add_friends(entries)
+        self._merge({identifier: (uri, names) for (identifier, names), uri in zip(entries, uris) if names})
+
+        return uris
+
+    def get_friend(self, identifier: str) -> Tuple[str, List[str]]:
+        return self.get_friends_by_ids([identifier])[identifier]
+
+    def get_friends_by_ids(self, identifiers: Iterable[str]) -> Mapping[str, Tuple[str, List[str]]]:
+        if not self.loaded:
+            return self._store.get_friends_by_ids(identifiers)
+
+        identifiers = list(identifiers)
+        with self._lock:
+            friends = {identifier: self._friends[identifier]
+                       for identifier in identifiers if identifier in self._friends}
+
+        missing = [identifier for identifier in identifiers if identifier not in friends]
+        if missing:
+            fetched = self._store.get_friends_by_ids(missing)
+            self._merge({identifier: friend for identifier, friend in fetched.items() if friend[0]})
+            friends.update(fetched)
+
+        return friends
+
+    def find_by_name(self, query: str, fuzzy: bool = False, limit: int = 10) -> Mapping[str, Tuple[str, List[str]]]:
+        if not self.loaded:
+            return self._store.find_by_name(query, fuzzy=fuzzy, limit=limit)
+
+        with self._lock:
+            return {identifier: self._friends[identifier]
+                    for identifier in self._index.search(query, fuzzy=fuzzy, limit=limit)}
+
+    def get_friends(self) -> Mapping[str, Tuple[str, List[str]]]:
+        if not self.loaded:
+            return self._store.get_friends()
+
+        with self._lock:
+            return dict(self._friends)
+
+    def get_identifieres(self) -> List[str]:
+        return self.get_friends().keys()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self._sync()
+            except:
+                logger.exception("Failed to synchronize friends")
+
+            self._stopped.wait(self._sync_interval)
+
+    def _sync(self):
+        full_sync = self._last_full_sync is None or (self._full_sync_interval is not None
+                                                     and time.monotonic() - self._last_full_sync
+                                                     > self._full_sync_interval)
+        if full_sync:
+            watermark = int(time.time() * 1000)
+            friends = self._store.get_friends()
+            with self._lock:
+                self._friends = dict(friends)
+                self._index = NameIndex()
+                self._index.update((identifier, names) for identifier, (_, names) in friends.items())
+                self._watermark = watermark
+            self._last_full_sync = time.monotonic()
+            self._loaded.set()
+            logger.info("Loaded %s friends", len(friends))
+        else:
+            friends, latest = self._store.get_friends_since(self._watermark - self._overlap)
+            self._merge(friends)
+            with self._lock:
+                self._watermark = max(self._watermark, latest)
+            logger.debug("Synchronized %s friends", len(friends))
+
+    def _merge(self, friends):
+        with self._lock:
+            for identifier, (uri, names) in friends.items():
+                current_uri, current_names = self._friends.get(identifier, (None, []))
+                names = list(dict.fromkeys((current_names or []) + list(names or [])))
+                self._friends[identifier] = (uri or current_uri, names)
+                self._index.add(identifier, names)
@@ -0,0 +1,44 @@
+from dataclasses import dataclass
+from typing import Iterable, List, Mapping, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class Trigger:
+    """
+    Phrases that trigger a desire and a reply.
+
+    By default a phrase triggers if it is the whole utterance, if contains is set it also triggers if it occurs
+    as words within the utterance.
+    """
+    phrases: Tuple[str, ...]
+    desire: Optional[str] = None
+    replies: Tuple[str, ...] = ()
+    contains: bool = False
+
+    @classmethod
+    def from_table(cls, table: Iterable[Mapping]) -> List["Trigger"]:
+        """
+        Create triggers from a table of entries with the keys 'phrases', and optionally 'desire', 'replies'
+        and 'contains', e.g. parsed from JSON.
+        """
+        triggers = []
+        for entry in table:
+            phrases = entry["phrases"]
+            replies = entry.get("replies", ())
+            triggers.append(cls(phrases=(phrases,) if isinstance(phrases, str) else tuple(phrases),
+                                desire=entry.get("desire"),
+                                replies=(replies,) if isinstance(replies, str) else tuple(replies),
+                                contains=bool(entry.get("contains", False))))
+
+        return triggers
+
+
+class KeywordMatcher:
+    def match(self, utterance: str) -> Optional[Trigger]:
+        """
+        Get the trigger matched by the utterance, or None if the utterance does not match any trigger.
+
+        If the utterance matches multiple triggers, the trigger with the whole utterance as phrase is returned,
+        otherwise the first one in the order of the triggers.
+        """
+        raise NotImplementedError()
@@ -0,0 +1,109 @@
+import collections
+import logging
+import re
+import unicodedata
+from typing import Iterable, Optional, Tuple
+
+from cltl.keyword.api import KeywordMatcher, Trigger
+
+logger = logging.getLogger(__name__)
+
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize(text: str) -> str:
+    """
+    Normalize text for matching: case folded, with each sequence of characters other than letters and digits
+    replaced by a single space.
+    """
+    return _NON_WORD.sub(" ", unicodedata.normalize("NFKC", text).casefold()).strip()
+
+
+class CompiledKeywordMatcher(KeywordMatcher):
+    """
+    Matches utterances against triggers compiled once at construction.
+
+    Phrases that must be the whole utterance are looked up in a hash table of the normalized phrases. Phrases that
+    may occur within the utterance are found with an Aho-Corasick automaton over the normalized phrases, such that
+    matching takes time linear in the length of the utterance, independent of the number of phrases.
+    """
+    def __init__(self, triggers: Iterable[Trigger]):
+        self._triggers = list(triggers)
+
+        self._utterances = dict()
+        contained = []
+        for index, trigger in enumerate(self._triggers):
+            for phrase in filter(None, map(normalize, trigger.phrases)):
+                self._utterances.setdefault(phrase, index)
+                if trigger.contains:
+                    # Pad with spaces to only match whole words in the padded utterance
+                    contained.append((f" {phrase} ", index))
+
+        self._automaton = _Automaton(contained) if contained else None
+
+        logger.info("Compiled %s keyword triggers with %s phrases", len(self._triggers), len(self._utterances))
+
+    def match(self, utterance: str) -> Optional[Trigger]:
+        normalized = normalize(utterance)
+        if not normalized:
+            return None
+
+        index = self._utterances.get(normalized)
+        if index is None and self._automaton:
+            index = self._automaton.search(f" {normalized} ")
+
+        return self._triggers[index] if index is not None else None
+
+
+class _Automaton:
+    """
+    Aho-Corasick automaton that finds the lowest value of the phrases contained in a text.
+    """
+    def __init__(self, phrases: Iterable[Tuple[str, int]]):
+        self._goto = [dict()]
+        self._fail = [0]
+        # Lowest value of the phrases ending at the node, including phrases that are suffixes of the node
+        self._value = [None]
+
+        for phrase, value in phrases:
+            node = 0
+            for char in phrase:
+                if char not in self._goto[node]:
+                    self._goto[node][char] = len(self._goto)
+                    self._goto.append(dict())
+                    self._fail.append(0)
+                    self._value.append(None)
+                node = self._goto[node][char]
+            self._value[node] = _min(self._value[node], value)
+
+        queue = collections.deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._value[child] = _min(self._value[child], self._value[self._fail[child]])
+                queue.append(child)
+
+    def search(self, text: str) -> Optional[int]:
+        value = None
+        node = 0
+        for char in text:
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            value = _min(value, self._value[node])
+
+        return value
+
+
+def _min(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+
+    return min(a, b)
@@ -1,10 +1,13 @@
 import logging
+from typing import List
 
 from cltl.combot.event.bdi import IntentionEvent, Intention
 from cltl.combot.infra.config import ConfigurationManager
 from cltl.combot.infra.event import Event, EventBus
 from cltl.combot.infra.resource import ResourceManager
 from cltl.combot.infra.topic_worker import TopicWorker
+from cltl_service.infra.metrics import MetricsRegistry, instrument
+from cltl_service.infra.session import SessionTable, session_key, with_session
 
 logger = logging.getLogger(__name__)
 
@@ -12,35 +15,56 @@ logger = logging.getLogger(__name__)
 CONTENT_TYPE_SEPARATOR = ';'
 
 
+class _BDISession:
+    __slots__ = ("intentions",)
+
+    def __init__(self, intentions):
+        self.intentions = intentions
+
+
 class BDIService:
     """
     Service to manage the BDI model of the agent.
 
     Components should listen to intentions (use intentions in the TopicWorker
     to activate them for certain intentions only) and publish achieved desires.
+
+    Intentions are kept per session, see :func:`cltl_service.infra.session.session_key`. New sessions start with
+    the initial intention, which is published unless the session starts with an intention event. Besides intention
+    and desire events, events on the session topics start new sessions.
     """
 
+    # Capacity of the event queue of the worker
+    BUFFER_SIZE = 16
+
     @classmethod
     def from_config(cls, bdi_model: dict, event_bus: EventBus, resource_manager: ResourceManager,
-                    config_manager: ConfigurationManager):
+                    config_manager: ConfigurationManager, metrics: MetricsRegistry = None):
         config = config_manager.get_config("cltl.bdi")
 
+        session_timeout = config.get_float("session_timeout") if "session_timeout" in config else None
+        initial_intention = config.get("initial_intention") if "initial_intention" in config else None
+        session_topics = config.get("session_topics", multi=True) if "session_topics" in config else []
+
         return cls(bdi_model, config.get("topic_scenario"), config.get("topic_intention"), config.get("topic_desire"),
-                   event_bus, resource_manager)
+                   event_bus, resource_manager, session_timeout, initial_intention, session_topics, metrics)
 
     def __init__(self, bdi_model: dict, scenario_topic: str, intention_topic: str, desire_topic: str,
-                 event_bus: EventBus, resource_manager: ResourceManager):
+                 event_bus: EventBus, resource_manager: ResourceManager, session_timeout: float = None,
+                 initial_intention: str = None, session_topics: List[str] = (), metrics: MetricsRegistry = None):
         self._event_bus = event_bus
         self._resource_manager = resource_manager
 
         self._scenario_topic = scenario_topic
         self._intention_topic = intention_topic
         self._desire_topic = desire_topic
+        self._session_topics = list(session_topics)
 
         self._topic_worker = None
+        self._metrics = metrics
 
-        self._scenario = None
-        self._intentions = []
+        self._initial_intention = initial_intention
+        self._sessions = SessionTable(self._create_session, session_timeout)
 
         self._bdi = bdi_model
 
@@ -49,9 +73,11 @@ class BDIService:
         return None
 
     def start(self, timeout=30):
-        self._topic_worker = TopicWorker([self._intention_topic, self._desire_topic],
-                                         self._event_bus, provides=[self._intention_topic],
-                                         resource_manager=self._resource_manager, processor=self._process,
+        event_bus, processor = instrument(self._metrics, self.__class__.__name__, self._event_bus, self._process,
+                                          buffer_size=self.BUFFER_SIZE)
+        self._topic_worker = TopicWorker([self._intention_topic, self._desire_topic] + self._session_topics,
+                                         event_bus, provides=[self._intention_topic], buffer_size=self.BUFFER_SIZE,
+                                         resource_manager=self._resource_manager, processor=processor,
                                          name=self.__class__.__name__)
         self._topic_worker.start().wait()
 
@@ -63,18 +89,38 @@ class BDIService:
         self._topic_worker.await_stop()
         self._topic_worker = None
 
+    def _create_session(self, key):
+        intentions = [self._initial_intention] if self._initial_intention else []
+        logger.info("Started session %s with intentions %s", key, intentions)
+
+        return _BDISession(intentions)
+
     def _process(self, event: Event):
+        key = session_key(event)
+        new_session = key not in self._sessions
+        session = self._sessions.get(key)
+        self._sessions.expire()
+
+        if new_session and session.intentions and event.metadata.topic != self._intention_topic:
+            self._publish_intentions(key, session)
+
         try:
             if event.metadata.topic == self._intention_topic:
-                self._intentions = {intention.label for intention in event.payload.intentions}
-                logger.info("Set intentions to %s", self._intentions)
+                session.intentions = {intention.label for intention in event.payload.intentions}
+                logger.info("Set intentions of session %s to %s", key, session.intentions)
             elif event.metadata.topic == self._desire_topic:
-                self._intentions = [intention
-                                    for current_intention in self._intentions
-                                    for achieved in event.payload.achieved
-                                    for intention in self._bdi[current_intention][achieved]]
-                intentions_payload = [Intention(intention, None) for intention in self._intentions]
-                self._event_bus.publish(self._intention_topic, Event.for_payload(IntentionEvent(intentions_payload)))
-                logger.info("Achieved %s, set intentions to %s", event.payload.achieved[0], intentions_payload)
+                session.intentions = [intention
+                                      for current_intention in session.intentions
+                                      for achieved in event.payload.achieved
+                                      for intention in self._bdi[current_intention][achieved]]
+                self._publish_intentions(key, session)
+                logger.info("Achieved %s, set intentions of session %s to %s",
+                            event.payload.achieved[0], key, session.intentions)
         except:
-            logger.exception("Failed to process achieved desire %s for intentions %s", event.payload, self._intentions)
+            logger.exception("Failed to process achieved desire %s for intentions %s",
+                             event.payload, session.intentions)
+
+    def _publish_intentions(self, key, session):
+        intentions_payload = [Intention(intention, None) for intention in session.intentions]
+        self._event_bus.publish(self._intention_topic,
+                                Event.for_payload(with_session(IntentionEvent(intentions_payload), key)))
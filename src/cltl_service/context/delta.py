@@ -0,0 +1,167 @@
+import copy
+import logging
+from collections import Counter
+from typing import Optional
+
+from emissor.representation.scenario import Scenario
+
+from cltl_service.context.schema import ScenarioDelta
+
+logger = logging.getLogger(__name__)
+
+
+def _person_key(person):
+    return person.name, person.uri
+
+
+def _speaker_key(speaker):
+    return (speaker.name, speaker.uri) if speaker else None
+
+
+class ScenarioDeltaEncoder:
+    """
+    Creates ScenarioDelta events from the changes of a scenario between calls.
+
+    Not thread safe, all calls are expected from the same thread.
+    """
+    def __init__(self, snapshot_interval: int):
+        """
+        :param snapshot_interval: Interval in milliseconds after which a snapshot delta is created
+        """
+        self._snapshot_interval = snapshot_interval
+
+        self._scenario_id = None
+        self._sequence = 0
+        self._last_snapshot = None
+        self._speaker = None
+        self._location = None
+        self._end = None
+        self._persons = dict()
+        self._objects = Counter()
+
+    def snapshot(self, scenario: Scenario, timestamp: int) -> ScenarioDelta:
+        """
+        Create a snapshot delta of the scenario, starting a new sequence if the scenario changed.
+        """
+        if scenario.id != self._scenario_id:
+            self._scenario_id = scenario.id
+            self._sequence = 0
+        else:
+            self._sequence += 1
+
+        self._last_snapshot = timestamp
+        self._remember(scenario)
+
+        return ScenarioDelta.create(scenario.id, self._sequence, timestamp,
+                                    speaker=scenario.context.speaker, location=scenario.context.location,
+                                    end=scenario.ruler.end, snapshot=scenario)
+
+    def snapshot_due(self, timestamp: int) -> bool:
+        """
+        :return: True if the snapshot interval has passed since the last snapshot
+        """
+        return self._last_snapshot is not None and timestamp - self._last_snapshot >= self._snapshot_interval
+
+    def delta(self, scenario: Scenario, timestamp: int) -> Optional[ScenarioDelta]:
+        """
+        Create a delta with the changes of the scenario since the previous delta, or a snapshot if the snapshot
+        interval has passed.
+
+        :return: The delta, or None if nothing changed
+        """
+        if scenario.id != self._scenario_id or self.snapshot_due(timestamp):
+            return self.snapshot(scenario, timestamp)
+
+        context = scenario.context
+        speaker = context.speaker if _speaker_key(context.speaker) != self._speaker else None
+        location = context.location if context.location != self._location else None
+
+        persons = {_person_key(person): person for person in context.persons}
+        added_persons = [person for key, person in persons.items() if key not in self._persons]
+        removed_persons = [person for key, person in self._persons.items() if key not in persons]
+
+        objects = Counter(context.objects)
+        added_objects = list((objects - self._objects).elements())
+        removed_objects = list((self._objects - objects).elements())
+
+        end = scenario.ruler.end if scenario.ruler.end != self._end else None
+
+        delta = ScenarioDelta.create(scenario.id, self._sequence + 1, timestamp,
+                                     speaker=speaker, location=location,
+                                     added_persons=added_persons, removed_persons=removed_persons,
+                                     added_objects=added_objects, removed_objects=removed_objects,
+                                     end=end)
+        if delta.empty:
+            return None
+
+        self._sequence += 1
+        self._remember(scenario)
+
+        return delta
+
+    def _remember(self, scenario):
+        context = scenario.context
+        self._speaker = _speaker_key(context.speaker)
+        self._location = dict(context.location) if context.location else None
+        self._end = scenario.ruler.end
+        self._persons = {_person_key(person): person for person in context.persons}
+        self._objects = Counter(context.objects)
+
+
+class ScenarioRebuilder:
+    """
+    Rebuilds the current scenario from ScenarioDelta events.
+
+    Deltas are applied on top of the latest snapshot. If a delta is missing in the sequence, deltas are ignored
+    until the next snapshot is received.
+    """
+    def __init__(self):
+        self._scenario = None
+        self._sequence = None
+
+    @property
+    def scenario(self) -> Optional[Scenario]:
+        """
+        The current scenario, or None if no snapshot was received yet or the sequence of deltas is incomplete.
+        """
+        return self._scenario
+
+    def apply(self, delta: ScenarioDelta) -> Optional[Scenario]:
+        """
+        Apply the delta to the current scenario.
+
+        :return: The updated scenario, or None if the scenario cannot be rebuilt until the next snapshot
+        """
+        if delta.snapshot:
+            self._scenario = copy.deepcopy(delta.snapshot)
+            self._sequence = delta.sequence
+            return self._scenario
+
+        if not self._scenario or self._scenario.id != delta.scenario_id or delta.sequence != self._sequence + 1:
+            if self._scenario:
+                logger.debug("Missing delta before %s of scenario %s, wait for snapshot",
+                             delta.sequence, delta.scenario_id)
+            self._scenario = None
+            return None
+
+        context = self._scenario.context
+        if delta.speaker:
+            context.speaker = delta.speaker
+        if delta.location:
+            context.location = delta.location
+
+        removed = {_person_key(person) for person in delta.removed_persons}
+        context.persons = [person for person in context.persons if _person_key(person) not in removed]
+        context.persons.extend(delta.added_persons)
+
+        objects = Counter(context.objects)
+        objects.subtract(delta.removed_objects)
+        objects.update(delta.added_objects)
+        context.objects = list(objects.elements())
+
+        if delta.end:
+            self._scenario.ruler.end = delta.end
+
+        self._sequence = delta.sequence
+
+        return self._scenario
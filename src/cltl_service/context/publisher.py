@@ -0,0 +1,73 @@
+import logging
+import time
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class CoalescingPublisher:
+    """
+    Publishes updates at a limited rate.
+
+    Updates are marked as pending with :meth:`update` and published by :meth:`flush`, multiple updates in between
+    are merged into a single call of the publish function, which publishes the latest state. A pending update is
+    published once min_interval has passed since the last publication, or at the latest max_delay after the first
+    pending update. Not thread safe, all calls are expected from the same thread.
+    """
+    def __init__(self, publish: Callable[[], None], min_interval: float, max_delay: float):
+        """
+        :param publish: Publishes the latest state
+        :param min_interval: Minimal interval in seconds between publications, i.e. the inverse of the max rate
+        :param max_delay: Maximal time in seconds a pending update is delayed
+        """
+        self._publish = publish
+        self._min_interval = min_interval
+        self._max_delay = max_delay
+
+        self._pending_since = None
+        self._last_published = None
+
+    @property
+    def pending(self) -> bool:
+        return self._pending_since is not None
+
+    def update(self):
+        """
+        Mark an update as pending.
+        """
+        if self._pending_since is None:
+            self._pending_since = time.monotonic()
+
+    def published(self):
+        """
+        Record a publication outside of the publisher, discarding any pending update.
+        """
+        self._pending_since = None
+        self._last_published = time.monotonic()
+
+    def discard(self):
+        self._pending_since = None
+
+    def flush(self, force: bool = False) -> bool:
+        """
+        Publish the pending update if it is due.
+
+        :param force: Publish any pending update regardless of the rate limit
+        :return: True if the update was published
+        """
+        if self._pending_since is None:
+            return False
+
+        now = time.monotonic()
+        due = force \
+              or self._last_published is None \
+              or now - self._last_published >= self._min_interval \
+              or now - self._pending_since >= self._max_delay
+        if not due:
+            return False
+
+        self._publish()
+        self.published()
+        logger.debug("Published coalesced update")
+
+        return True
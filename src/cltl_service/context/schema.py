@@ -0,0 +1,40 @@
+from dataclasses import dataclass, field
+from typing import List, Optional, Mapping
+
+from cltl.combot.event.emissor import Agent
+from emissor.representation.scenario import Scenario
+
+
+@dataclass
+class ScenarioDelta:
+    """
+    Changes of a scenario since the previous ScenarioDelta of the same scenario.
+
+    Deltas of a scenario are numbered consecutively by sequence. Snapshot deltas contain the full scenario in
+    snapshot and are published at the start of a scenario and periodically after that, such that consumers that
+    missed earlier deltas can start from there.
+
+    Objects are listed with one label per object instance. The speaker and location are only set if they changed,
+    end is set when the scenario stopped.
+    """
+    type: str
+    scenario_id: str
+    sequence: int
+    timestamp: int
+    speaker: Optional[Agent] = None
+    location: Optional[Mapping[str, str]] = None
+    added_persons: List[Agent] = field(default_factory=list)
+    removed_persons: List[Agent] = field(default_factory=list)
+    added_objects: List[str] = field(default_factory=list)
+    removed_objects: List[str] = field(default_factory=list)
+    end: Optional[int] = None
+    snapshot: Optional[Scenario] = None
+
+    @classmethod
+    def create(cls, scenario_id: str, sequence: int, timestamp: int, **changes):
+        return cls(cls.__name__, scenario_id, sequence, timestamp, **changes)
+
+    @property
+    def empty(self) -> bool:
+        return not (self.speaker or self.location or self.added_persons or self.removed_persons
+                    or self.added_objects or self.removed_objects or self.end or self.snapshot)
@@ -1,9 +1,10 @@
 import logging
+import queue
 import uuid
-from collections import Counter
 from datetime import datetime
+from functools import partial
+from typing import List
 
-import requests
 from cltl.combot.event.emissor import LeolaniContext, Agent, ScenarioStarted, ScenarioStopped, ScenarioEvent
 from cltl.combot.infra.config import ConfigurationManager
 from cltl.combot.infra.event import Event, EventBus
@@ -13,7 +14,16 @@ from cltl.combot.infra.topic_worker import TopicWorker
 from cltl.object_recognition.api import Object
 from emissor.representation.scenario import Modality, Scenario, class_type
 
-from cltl.friends.api import FriendStore
+from cltl.context.api import LocationProvider
+from cltl.context.location import StaticLocationProvider, UNKNOWN_LOCATION
+from cltl.context.objects import ObjectPresence
+from cltl_service.context.delta import ScenarioDeltaEncoder
+from cltl_service.context.publisher import CoalescingPublisher
+from cltl_service.infra.session import SessionTable, session_key, with_session
+from cltl_service.infra.metrics import MetricsRegistry, instrument
+from cltl_service.infra.worker import PriorityTopicWorker
+from cltl.friends.aio import BackgroundEventLoop
+from cltl.friends.api import FriendStore, AsyncFriendStore
 
 logger = logging.getLogger(__name__)
 
@@ -21,28 +31,99 @@ logger = logging.getLogger(__name__)
 AGENT = Agent("Leolani", "http://cltl.nl/leolani/world/leolani")
 
 
+class _ContextSession:
+    __slots__ = ("key", "scenario", "objects", "publisher", "delta_encoder")
+
+    def __init__(self, key):
+        self.key = key
+        self.scenario = None
+        self.objects = None
+        self.publisher = None
+        self.delta_encoder = None
+
+    @property
+    def active(self):
+        return self.scenario is not None and not self.scenario.ruler.end
+
+
 class ContextService:
+    # Capacity of the event queue of the worker, per priority for the PriorityTopicWorker
+    BUFFER_SIZE = 32
+    # Interval in seconds to apply location updates, completed friend lookups and pending scenario updates
+    POLL_INTERVAL = 0.5
+
     @classmethod
     def from_config(cls, friend_store: FriendStore,
-                    event_bus: EventBus, resource_manager: ResourceManager, config_manager: ConfigurationManager):
+                    event_bus: EventBus, resource_manager: ResourceManager, config_manager: ConfigurationManager,
+                    async_friend_store: AsyncFriendStore = None, location_provider: LocationProvider = None,
+                    metrics: MetricsRegistry = None):
         config = config_manager.get_config("cltl.context")
         scenario_topic = config.get("topic_scenario")
+        scenario_delta_topic = config.get("topic_scenario_delta") if "topic_scenario_delta" in config else None
         speaker_topic = config.get("topic_speaker")
         object_topic = config.get("topic_object")
         vector_id_topic = config.get("topic_vector_id")
         knowledge_topic = config.get("topic_knowledge")
         intention_topic = config.get("topic_intention")
         desire_topic = config.get("topic_desire")
+        object_window = config.get_float("object_window") if "object_window" in config else 60
+        scenario_max_rate = config.get_float("scenario_max_rate") if "scenario_max_rate" in config else 2
+        scenario_max_delay = config.get_float("scenario_max_delay") if "scenario_max_delay" in config else 1
+        scenario_full_updates = config.get_boolean("scenario_full_updates") \
+            if "scenario_full_updates" in config else True
+        scenario_snapshot_interval = config.get_float("scenario_snapshot_interval") \
+            if "scenario_snapshot_interval" in config else 30
+        session_timeout = config.get_float("session_timeout") if "session_timeout" in config else None
+        max_sessions = config.get_int("max_sessions") if "max_sessions" in config else None
+        priority_topics = config.get("priority_topics", multi=True) if "priority_topics" in config else []
+        latest_topics = config.get("latest_topics", multi=True) if "latest_topics" in config else []
 
         return cls(scenario_topic, speaker_topic, knowledge_topic,
                    object_topic, vector_id_topic,
                    intention_topic, desire_topic,
-                   friend_store, event_bus, resource_manager)
+                   friend_store, event_bus, resource_manager, async_friend_store, location_provider,
+                   object_window, scenario_max_rate, scenario_max_delay,
+                   scenario_delta_topic, scenario_full_updates, scenario_snapshot_interval,
+                   session_timeout, max_sessions, priority_topics, latest_topics, metrics)
 
     def __init__(self, scenario_topic: str, speaker_topic: str, knowledge_topic: str,
                  object_topic: str, vector_id_topic: str,
                  intention_topic: str, desire_topic: str,
-                 friend_store: FriendStore, event_bus: EventBus, resource_manager: ResourceManager):
+                 friend_store: FriendStore, event_bus: EventBus, resource_manager: ResourceManager,
+                 async_friend_store: AsyncFriendStore = None, location_provider: LocationProvider = None,
+                 object_window: float = 60, scenario_max_rate: float = 2, scenario_max_delay: float = 1,
+                 scenario_delta_topic: str = None, scenario_full_updates: bool = True,
+                 scenario_snapshot_interval: float = 30,
+                 session_timeout: float = None, max_sessions: int = None,
+                 priority_topics: List[str] = (), latest_topics: List[str] = (), metrics: MetricsRegistry = None):
+        """
+        If an async_friend_store is provided, friends are registered and looked up with it while the service
+        continues to process events, and the results are applied to the scenario once they are available. Repeated
+        detections of the same faces are not looked up again while their lookup is in flight.
+
+        The location_provider must not block, the location of the current scenario is updated when the provider
+        returns a new location. Without location_provider the location of scenarios is left empty.
+
+        Objects in the scenario context are counted by the maximal number of instances detected at once within the
+        last object_window seconds, objects not detected within that window are removed from the scenario.
+
+        Changes to the scenario are merged and published at most scenario_max_rate times per second, delayed by at
+        most scenario_max_delay seconds. Start and stop of a scenario are published immediately.
+
+        If a scenario_delta_topic is provided, each published change is also published as ScenarioDelta on that
+        topic, with a full snapshot at the start of a scenario and every scenario_snapshot_interval seconds. If
+        scenario_full_updates is not set, changes are only published as ScenarioDelta, start and stop of a
+        scenario and changes of the speaker are always published on the scenario_topic.
+
+        Scenarios are managed per session, identified by the session key of the events (see
+        :func:`cltl_service.infra.session.session_key`), and published events are marked with the session key.
+        Sessions idle for more than session_timeout seconds are discarded, and at most max_sessions are kept. The
+        active scenario of a discarded session is stopped.
+
+        If priority_topics or latest_topics are provided, events are processed with a
+        :class:`cltl_service.infra.worker.PriorityTopicWorker`: events of the priority_topics are processed before
+        events of other topics, and for latest_topics only the latest pending event per session is processed.
+        """
         self._event_bus = event_bus
         self._resource_manager = resource_manager
 
@@ -55,22 +136,63 @@ class ContextService:
         self._knowledge_topic = knowledge_topic
 
         self._topic_worker = None
+        self._priority_topics = list(priority_topics)
+        self._latest_topics = list(latest_topics)
+        self._metrics = metrics
 
         self.AGENT = AGENT
         self._friend_store = friend_store
-        self._scenario = None
+        self._async_friend_store = async_friend_store
+        self._event_loop = None
+        self._completed_lookups = queue.SimpleQueue()
+        # Person lookups in flight, accessed on the worker thread only
+        self._pending_person_lookups = set()
+        self._location_provider = location_provider or StaticLocationProvider(UNKNOWN_LOCATION)
+        self._object_window = int(object_window * 1000)
+
+        self._scenario_delta_topic = scenario_delta_topic
+        self._scenario_full_updates = scenario_full_updates
+        self._scenario_snapshot_interval = int(scenario_snapshot_interval * 1000)
+        self._scenario_min_interval = 1 / scenario_max_rate if scenario_max_rate > 0 else 0
+        self._scenario_max_delay = scenario_max_delay
+
+        self._sessions = SessionTable(self._create_session, session_timeout, max_sessions,
+                                      on_remove=self._close_session)
+
+        self._poll_interval = min(self.POLL_INTERVAL, scenario_max_delay) if scenario_max_delay > 0 \
+            else self.POLL_INTERVAL
 
     @property
     def app(self):
         return None
 
     def start(self, timeout=30):
-        self._topic_worker = TopicWorker([self._intention_topic, self._desire_topic, self._speaker_topic,
-                                          self._object_topic, self._vector_id_topic],
-                                         self._event_bus, provides=[self._intention_topic],
-                                         buffer_size=32, processor=self._process,
-                                         resource_manager=self._resource_manager,
-                                         name=self.__class__.__name__)
+        if self._async_friend_store:
+            self._event_loop = BackgroundEventLoop(name=self.__class__.__name__ + "Lookups")
+            self._event_loop.start()
+
+        topics = [self._intention_topic, self._desire_topic, self._speaker_topic,
+                  self._object_topic, self._vector_id_topic]
+        event_bus, processor = instrument(self._metrics, self.__class__.__name__, self._event_bus, self._process,
+                                          buffer_size=self.BUFFER_SIZE)
+        if self._priority_topics or self._latest_topics:
+            self._topic_worker = PriorityTopicWorker(topics, event_bus, processor,
+                                                     priorities={topic: 0 if topic in self._priority_topics else 1
+                                                                 for topic in topics},
+                                                     latest_topics=self._latest_topics,
+                                                     buffer_size=self.BUFFER_SIZE, scheduled=self._poll_interval,
+                                                     provides=[self._intention_topic],
+                                                     resource_manager=self._resource_manager,
+                                                     name=self.__class__.__name__)
+            if self._metrics:
+                self._metrics.worker(self.__class__.__name__).observe(self._topic_worker)
+        else:
+            self._topic_worker = TopicWorker(topics,
+                                             event_bus, provides=[self._intention_topic],
+                                             buffer_size=self.BUFFER_SIZE, processor=processor,
+                                             scheduled=self._poll_interval,
+                                             resource_manager=self._resource_manager,
+                                             name=self.__class__.__name__)
         self._topic_worker.start().wait()
 
     def stop(self):
@@ -81,53 +203,159 @@ class ContextService:
         self._topic_worker.await_stop()
         self._topic_worker = None
 
+        if self._event_loop:
+            self._event_loop.stop()
+            self._event_loop = None
+
+    def _create_session(self, key):
+        session = _ContextSession(key)
+        session.publisher = CoalescingPublisher(partial(self._publish_scenario_update, session),
+                                                self._scenario_min_interval, self._scenario_max_delay)
+        if self._scenario_delta_topic:
+            session.delta_encoder = ScenarioDeltaEncoder(self._scenario_snapshot_interval)
+
+        return session
+
+    def _close_session(self, key, session):
+        """
+        Publish pending updates and stop the active scenario of a session that is discarded.
+        """
+        session.publisher.flush(force=True)
+        self._stop_scenario(session)
+
     def _process(self, event: Event):
+        self._apply_completed_lookups()
+
+        if not event:
+            self._sessions.expire()
+            for _, session in self._sessions:
+                self._update_scenario_location(session)
+                self._expire_scenario_context_objects(session)
+                session.publisher.flush()
+                self._publish_scenario_snapshot(session)
+            return
+
+        session = self._sessions.get(session_key(event))
+        self._update_scenario_location(session)
+
         if event.metadata.topic == self._intention_topic:
             intentions = {intention.label for intention in event.payload.intentions}
             if "init" in intentions:
-                self._start_scenario()
+                self._start_scenario(session)
             if "terminate" in intentions:
-                self._stop_scenario()
+                self._stop_scenario(session)
         elif event.metadata.topic == self._desire_topic:
             achieved = event.payload.achieved
             if "quit" in achieved:
-                self._stop_scenario()
+                self._stop_scenario(session)
+        elif not session.scenario:
+            logger.debug("Skipped event without scenario in session %s: %s", session.key, event)
         elif event.metadata.topic == self._speaker_topic:
-            self._update_scenario_speaker(event)
+            self._update_scenario_speaker(session, event)
         elif event.metadata.topic == self._object_topic:
-            self._update_scenario_context_objects(event)
+            self._update_scenario_context_objects(session, event)
         elif event.metadata.topic == self._vector_id_topic:
-            self._update_scenario_context_people(event)
+            self._update_scenario_context_people(session, event)
         else:
             logger.warning("Unhandled event: %s", event)
 
-    def _start_scenario(self):
-        scenario, capsule = self._create_scenario()
-        self._event_bus.publish(self._scenario_topic,
-                                Event.for_payload(ScenarioStarted.create(scenario)))
-        self._event_bus.publish(self._knowledge_topic, Event.for_payload([capsule]))
-        self._scenario = scenario
-        logger.info("Started scenario %s", scenario)
-
-    def _update_scenario_speaker(self, event):
+        session.publisher.flush()
+
+    def _publish(self, topic, session, payload):
+        self._event_bus.publish(topic, Event.for_payload(with_session(payload, session.key)))
+
+    def _start_scenario(self, session):
+        scenario = self._create_scenario()
+        session.scenario = scenario
+        session.objects = ObjectPresence(self._object_window)
+
+        self._publish(self._scenario_topic, session, ScenarioStarted.create(scenario))
+        session.publisher.published()
+        if session.delta_encoder:
+            self._publish(self._scenario_delta_topic, session,
+                          session.delta_encoder.snapshot(scenario, timestamp_now()))
+        self._publish(self._knowledge_topic, session, [self._create_context_capsule(scenario)])
+        logger.info("Started scenario %s in session %s", scenario, session.key)
+
+    def _publish_scenario_update(self, session):
+        if self._scenario_full_updates:
+            self._publish(self._scenario_topic, session, ScenarioEvent.create(session.scenario))
+        self._publish_scenario_delta(session)
+
+    def _publish_scenario_delta(self, session):
+        if not session.delta_encoder:
+            return
+
+        delta = session.delta_encoder.delta(session.scenario, timestamp_now())
+        if delta:
+            self._publish(self._scenario_delta_topic, session, delta)
+
+    def _publish_scenario_snapshot(self, session):
+        """
+        Publish a snapshot of an active scenario once the snapshot interval has passed, also if the scenario did not
+        change, such that consumers that missed the start of the scenario can rebuild it.
+        """
+        if not session.delta_encoder or not session.active:
+            return
+
+        timestamp = timestamp_now()
+        if session.delta_encoder.snapshot_due(timestamp):
+            self._publish(self._scenario_delta_topic, session,
+                          session.delta_encoder.snapshot(session.scenario, timestamp))
+
+    def _update_scenario_speaker(self, session, event):
         # TODO multiple mentions
         mention = event.payload.mentions[0]
         name_annotation = next(iter(filter(lambda a: a.type == "Entity", mention.annotations)))
         id_annotation = next(iter(filter(lambda a: a.type == "VectorIdentity", mention.annotations)))
 
         speaker_name = name_annotation.value.text
-        uri = self._friend_store.add_friend(id_annotation.value, speaker_name,
-                                            scenario_id=self._scenario.id, mention_id=mention.id)
-        self._scenario.context.speaker = Agent(speaker_name, str(uri))
-
-        self._event_bus.publish(self._scenario_topic, Event.for_payload(ScenarioEvent.create(self._scenario)))
-        logger.info("Updated scenario %s", self._scenario)
-
-    def _stop_scenario(self):
-        self._scenario.ruler.end = timestamp_now()
-        self._event_bus.publish(self._scenario_topic,
-                                Event.for_payload(ScenarioStopped.create(self._scenario)))
-        logger.info("Stopped scenario %s", self._scenario)
+        scenario_id = session.scenario.id
+        if self._async_friend_store:
+            self._submit_lookup(self._async_friend_store.add_friend(id_annotation.value, speaker_name,
+                                                                    scenario_id=scenario_id,
+                                                                    mention_id=mention.id),
+                                partial(self._set_speaker, session.key, scenario_id, speaker_name))
+        else:
+            uri = self._friend_store.add_friend(id_annotation.value, speaker_name,
+                                                scenario_id=scenario_id, mention_id=mention.id)
+            self._set_speaker(session.key, scenario_id, speaker_name, uri)
+
+    def _active_session(self, key, scenario_id):
+        session = self._sessions.get(key, create=False)
+        if not session or not session.scenario or session.scenario.id != scenario_id:
+            return None
+
+        return session
+
+    def _set_speaker(self, key, scenario_id, speaker_name, uri):
+        session = self._active_session(key, scenario_id)
+        if not session:
+            logger.debug("Skipped speaker %s for inactive scenario %s", speaker_name, scenario_id)
+            return
+
+        previous = session.scenario.context.speaker
+        session.scenario.context.speaker = Agent(speaker_name, str(uri))
+        speaker_changed = not previous or (previous.name, previous.uri) != (speaker_name, str(uri))
+        if self._scenario_full_updates or not speaker_changed:
+            session.publisher.update()
+        else:
+            # Consumers of the scenario_topic, e.g. InitializeChatService, take the speaker from ScenarioEvents
+            self._publish(self._scenario_topic, session, ScenarioEvent.create(session.scenario))
+            self._publish_scenario_delta(session)
+            session.publisher.published()
+        logger.info("Updated scenario %s", session.scenario)
+
+    def _stop_scenario(self, session):
+        if not session.active:
+            logger.debug("No active scenario to stop in session %s", session.key)
+            return
+
+        session.scenario.ruler.end = timestamp_now()
+        self._publish(self._scenario_topic, session, ScenarioStopped.create(session.scenario))
+        session.publisher.published()
+        self._publish_scenario_delta(session)
+        logger.info("Stopped scenario %s in session %s", session.scenario, session.key)
 
     def _create_scenario(self):
         signals = {
@@ -137,15 +365,19 @@ class ContextService:
         }
 
         scenario_start = timestamp_now()
-        location = self._get_location()
+        location = self._location_provider.get_location() or UNKNOWN_LOCATION
 
         scenario_context = LeolaniContext(AGENT, Agent(), str(uuid.uuid4()), location, [], [])
-        scenario = Scenario.new_instance(str(uuid.uuid4()), scenario_start, None, scenario_context, signals)
 
-        capsule = {
+        return Scenario.new_instance(str(uuid.uuid4()), scenario_start, None, scenario_context, signals)
+
+    def _create_context_capsule(self, scenario):
+        location = scenario.context.location
+
+        return {
             "type": "context",
             "context_id": scenario.id,
-            "date": datetime.utcfromtimestamp(scenario_start//1000).strftime('%Y-%m-%d'),
+            "date": datetime.utcfromtimestamp(scenario.ruler.start//1000).strftime('%Y-%m-%d'),
             "place": None,
             "place_id": None,
             "country": location["country"],
@@ -153,16 +385,51 @@ class ContextService:
             "city": location["city"]
         }
 
-        return scenario, capsule
+    def _update_scenario_location(self, session):
+        if not session.active:
+            return
 
-    def _update_scenario_context_people(self, event):
-        added = False
+        location = self._location_provider.get_location()
+        if not location or location == session.scenario.context.location:
+            return
+
+        session.scenario.context.location = location
+        session.publisher.update()
+        self._publish(self._knowledge_topic, session, [self._create_context_capsule(session.scenario)])
+        logger.info("Updated location of scenario %s to %s", session.scenario.id, location)
+
+    def _update_scenario_context_people(self, session, event):
         # TODO replace "VectorIdentity" with class_type(VectorIdentity)
-        for face_id in [annotation.value
-                        for mention in event.payload.mentions
-                        for annotation in mention.annotations
-                        if annotation.type == "VectorIdentity"]:
-            uri, names = self._friend_store.get_friend(face_id)
+        face_ids = [annotation.value
+                    for mention in event.payload.mentions
+                    for annotation in mention.annotations
+                    if annotation.type == "VectorIdentity"]
+
+        scenario_id = session.scenario.id
+        if self._async_friend_store:
+            # Coalesce repeated detections of the same faces while their lookup is in flight
+            lookup_key = (session.key, scenario_id, tuple(face_ids))
+            if lookup_key in self._pending_person_lookups:
+                return
+
+            self._pending_person_lookups.add(lookup_key)
+            self._submit_lookup(self._async_friend_store.get_friends_by_ids(list(filter(None, face_ids))),
+                                partial(self._add_scenario_persons, session.key, scenario_id, face_ids, event),
+                                partial(self._pending_person_lookups.discard, lookup_key))
+        else:
+            friends = self._friend_store.get_friends_by_ids(filter(None, face_ids))
+            self._add_scenario_persons(session.key, scenario_id, face_ids, event, friends)
+
+    def _add_scenario_persons(self, key, scenario_id, face_ids, event, friends):
+        session = self._active_session(key, scenario_id)
+        if not session:
+            logger.debug("Skipped persons for inactive scenario %s", scenario_id)
+            return
+
+        persons = session.scenario.context.persons
+        added = False
+        for face_id in face_ids:
+            uri, names = friends.get(face_id, (None, None))
             if names and names[0] and uri:
                 agent = Agent(names[0], uri)
             elif uri:
@@ -173,35 +440,55 @@ class ContextService:
                 agent = None
                 logger.debug("No person in event %s", event)
 
-            if agent and agent not in self._scenario.context.persons:
-                self._scenario.context.persons.append(agent)
+            if agent and agent not in persons:
+                persons.append(agent)
 
             added = True
 
         if added:
-            self._event_bus.publish(self._scenario_topic, Event.for_payload(ScenarioEvent.create(self._scenario)))
-            logger.info("Updated scenario with persons %s", self._scenario)
+            session.publisher.update()
+            logger.info("Updated scenario with persons %s", session.scenario)
 
-    def _update_scenario_context_objects(self, event):
+    def _update_scenario_context_objects(self, session, event):
         object_labels = [annotation.value.label
                         for mention in event.payload.mentions
                         for annotation in mention.annotations
                         if annotation.type == class_type(Object) and annotation.value]
 
-        object_counts = Counter(object_labels)
-        current_counts = Counter(self._scenario.context.objects)
-        object_counts.subtract(current_counts)
-
-        for label, count in object_counts.items():
-            if count > 0:
-                self._scenario.context.objects.extend([label,] * count)
-
-        if any(cnt > 0 for cnt in object_counts.values()):
-            self._event_bus.publish(self._scenario_topic, Event.for_payload(ScenarioEvent.create(self._scenario)))
-            logger.info("Updated scenario with persons %s", self._scenario)
-
-    def _get_location(self):
-        try:
-            return requests.get("https://ipinfo.io").json()
-        except:
-            return {"country": "", "region": "", "city": ""}
+        if session.objects.update(object_labels, timestamp_now()):
+            self._update_scenario_objects(session)
+
+    def _expire_scenario_context_objects(self, session):
+        if not session.active:
+            return
+
+        if session.objects.expire(timestamp_now()):
+            self._update_scenario_objects(session)
+
+    def _update_scenario_objects(self, session):
+        session.scenario.context.objects = session.objects.labels()
+        session.publisher.update()
+        logger.info("Updated scenario with objects %s", session.scenario)
+
+    def _submit_lookup(self, coroutine, callback, on_done=None):
+        """
+        Run the coroutine on the lookup event loop and apply its result with the callback on the worker thread.
+        If provided, on_done is called on the worker thread after the callback, also if the lookup failed.
+        """
+        future = self._event_loop.submit(coroutine)
+        future.add_done_callback(lambda done: self._completed_lookups.put((done, callback, on_done)))
+
+    def _apply_completed_lookups(self):
+        while True:
+            try:
+                future, callback, on_done = self._completed_lookups.get_nowait()
+            except queue.Empty:
+                return
+
+            try:
+                callback(future.result())
+            except:
+                logger.exception("Failed to apply friend lookup")
+            finally:
+                if on_done:
+                    on_done()
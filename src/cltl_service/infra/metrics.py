@@ -0,0 +1,286 @@
+import bisect
+import collections
+import logging
+import threading
+import time
+from typing import Callable, Optional, Sequence, Tuple
+
+import flask
+from cltl.combot.infra.event import Event, EventBus
+
+logger = logging.getLogger(__name__)
+
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+"""Upper bounds in seconds of the buckets of the processing latency histograms."""
+
+SCHEDULED = "scheduled"
+"""Topic label of scheduled invocations of a processor."""
+
+
+class WorkerMetrics:
+    """
+    Event counts, queue occupancy and processing latency of the worker of a service.
+
+    Events are counted when the event bus delivers them to the worker and when the worker passes them to the
+    processor. Workers that report their queue, like the :class:`cltl_service.infra.worker.PriorityTopicWorker`,
+    can be observed with :meth:`observe`. For other workers the queue size is derived from these counts, and if
+    the buffer_size of the worker is known, events that arrive while the buffer is full are counted as dropped.
+    Dropped events are then counted for the topic of the arriving event, which is not necessarily the dropped one.
+    """
+    def __init__(self, service: str, buffer_size: int = None, buckets: Sequence[float] = LATENCY_BUCKETS):
+        """
+        :param service: Name of the service
+        :param buffer_size: Capacity of the queue of the worker, None if unknown
+        :param buckets: Upper bounds of the latency histogram buckets in seconds
+        """
+        self.service = service
+        self.buffer_size = buffer_size
+        self._buckets = tuple(buckets)
+
+        self._lock = threading.Lock()
+        self._received = collections.Counter()
+        self._processed = collections.Counter()
+        self._dropped = collections.Counter()
+        # Per topic the counts per bucket (not cumulative), the sum and the count of processing times
+        self._latency = dict()
+        self._queued = 0
+        self._in_flight = 0
+        self._worker = None
+
+    def instrument(self, event_bus: EventBus, processor: Callable[[Optional[Event]], None]) \
+            -> Tuple[EventBus, Callable[[Optional[Event]], None]]:
+        """
+        Instrument a new worker of the service.
+
+        :return: The event bus and processor to create the worker with
+        """
+        with self._lock:
+            # Events still queued in a previous worker were discarded when it stopped
+            self._queued = 0
+            self._worker = None
+
+        return _InstrumentedEventBus(event_bus, self._received_event), self._instrument_processor(processor)
+
+    def observe(self, worker):
+        """
+        Report the queue size and dropped events of a worker that provides them as 'pending' and 'dropped'.
+        """
+        with self._lock:
+            self._worker = worker
+
+    def samples(self):
+        """
+        :return: A snapshot of the metrics as dictionary
+        """
+        with self._lock:
+            worker = self._worker
+            samples = {
+                "received": dict(self._received),
+                "processed": dict(self._processed),
+                "dropped": dict(self._dropped),
+                "queued": self._queued,
+                "in_flight": self._in_flight,
+                "latency": {topic: (list(counts), total, count)
+                            for topic, (counts, total, count) in self._latency.items()},
+            }
+
+        if worker:
+            samples["queued"] = worker.pending
+            samples["dropped"] = worker.dropped
+
+        return samples
+
+    @property
+    def buckets(self) -> Tuple[float, ...]:
+        return self._buckets
+
+    def _received_event(self, event: Event):
+        topic = event.metadata.topic
+        with self._lock:
+            self._received[topic] += 1
+            if self._worker:
+                return
+
+            if self.buffer_size and self._queued >= self.buffer_size:
+                self._dropped[topic] += 1
+            else:
+                self._queued += 1
+
+    def _instrument_processor(self, processor):
+        def instrumented(event: Optional[Event]):
+            topic = event.metadata.topic if event is not None else SCHEDULED
+            with self._lock:
+                if event is not None:
+                    self._queued = max(0, self._queued - 1)
+                self._in_flight += 1
+
+            start = time.monotonic()
+            try:
+                return processor(event)
+            finally:
+                self._processed_event(topic, time.monotonic() - start)
+
+        return instrumented
+
+    def _processed_event(self, topic, duration):
+        with self._lock:
+            self._in_flight -= 1
+            if topic != SCHEDULED:
+                self._processed[topic] += 1
+
+            if topic not in self._latency:
+                self._latency[topic] = ([0] * (len(self._buckets) + 1), 0.0, 0)
+            counts, total, count = self._latency[topic]
+            counts[bisect.bisect_left(self._buckets, duration)] += 1
+            self._latency[topic] = (counts, total + duration, count + 1)
+
+
+class _InstrumentedEventBus:
+    """
+    Event bus that notifies a listener before an event is delivered to a subscribed handler.
+    """
+    def __init__(self, event_bus: EventBus, listener: Callable[[Event], None]):
+        self._event_bus = event_bus
+        self._listener = listener
+        self._handlers = dict()
+
+    def subscribe(self, topic, handler):
+        def instrumented(event):
+            self._listener(event)
+            handler(event)
+
+        self._handlers[(topic, handler)] = instrumented
+        self._event_bus.subscribe(topic, instrumented)
+
+    def unsubscribe(self, topic, handler=None):
+        instrumented = self._handlers.pop((topic, handler), handler)
+        self._event_bus.unsubscribe(topic, instrumented)
+
+    def __getattr__(self, name):
+        return getattr(self._event_bus, name)
+
+
+class MetricsRegistry:
+    """
+    Registry of the worker metrics of the services of the application.
+
+    The metrics are exposed in the Prometheus text format by the Flask app of the registry.
+    """
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self._buckets = tuple(buckets)
+        self._workers = dict()
+        self._lock = threading.Lock()
+        self._app = None
+
+    def worker(self, service: str, buffer_size: int = None) -> WorkerMetrics:
+        """
+        Get the metrics of the worker of a service, created on first access.
+        """
+        with self._lock:
+            if service not in self._workers:
+                self._workers[service] = WorkerMetrics(service, buffer_size, self._buckets)
+
+            return self._workers[service]
+
+    @property
+    def app(self):
+        if self._app:
+            return self._app
+
+        self._app = flask.Flask(__name__)
+
+        @self._app.route('/', methods=['GET'])
+        def metrics():
+            response = flask.Response(self.render(), content_type=self.CONTENT_TYPE)
+            response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+
+            return response
+
+        return self._app
+
+    def render(self) -> str:
+        """
+        Render the metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            workers = list(self._workers.values())
+        samples = [(worker, worker.samples()) for worker in workers]
+
+        lines = []
+
+        def family(name, metric_type, description):
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+        def sample(name, labels, value):
+            label_str = ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+            lines.append(f"{name}{{{label_str}}} {_format(value)}")
+
+        for key, name, description in (("received", "cltl_worker_events_received_total",
+                                        "Events delivered to the worker of the service."),
+                                       ("processed", "cltl_worker_events_processed_total",
+                                        "Events processed by the worker of the service."),
+                                       ("dropped", "cltl_worker_events_dropped_total",
+                                        "Events dropped by the worker of the service because its queue was full.")):
+            family(name, "counter", description)
+            for worker, worker_samples in samples:
+                for topic, count in sorted(worker_samples[key].items()):
+                    sample(name, {"service": worker.service, "topic": topic}, count)
+
+        family("cltl_worker_queue_size", "gauge", "Events queued by the worker of the service.")
+        for worker, worker_samples in samples:
+            sample("cltl_worker_queue_size", {"service": worker.service}, worker_samples["queued"])
+
+        family("cltl_worker_queue_capacity", "gauge", "Buffer size of the worker of the service.")
+        for worker, _ in samples:
+            if worker.buffer_size:
+                sample("cltl_worker_queue_capacity", {"service": worker.service}, worker.buffer_size)
+
+        family("cltl_worker_in_flight", "gauge", "Events currently processed by the worker of the service.")
+        for worker, worker_samples in samples:
+            sample("cltl_worker_in_flight", {"service": worker.service}, worker_samples["in_flight"])
+
+        name = "cltl_worker_processing_seconds"
+        family(name, "histogram", "Processing time of events by the worker of the service.")
+        for worker, worker_samples in samples:
+            for topic, (counts, total, count) in sorted(worker_samples["latency"].items()):
+                labels = {"service": worker.service, "topic": topic}
+                cumulative = 0
+                for bound, bucket_count in zip(worker.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    sample(name + "_bucket", dict(labels, le=bound), cumulative)
+                sample(name + "_sum", labels, total)
+                sample(name + "_count", labels, count)
+
+        return "\n".join(lines) + "\n"
+
+
+def instrument(metrics: Optional[MetricsRegistry], service: str, event_bus: EventBus,
+               processor: Callable[[Optional[Event]], None], buffer_size: int = None) \
+        -> Tuple[EventBus, Callable[[Optional[Event]], None]]:
+    """
+    Instrument a new worker of a service with the metrics of the service in the registry.
+
+    :return: The event bus and processor to create the worker with, unchanged if metrics is None
+    """
+    if metrics is None:
+        return event_bus, processor
+
+    return metrics.worker(service, buffer_size).instrument(event_bus, processor)
+
+
+def _escape(value) -> str:
+    if isinstance(value, float):
+        return _format(value)
+
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+
+    return repr(value) if isinstance(value, float) else str(value)
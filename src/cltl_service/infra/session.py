@@ -0,0 +1,159 @@
+import logging
+import time
+from typing import Callable, Generic, Iterator, Optional, Tuple, TypeVar
+
+from cltl.combot.infra.event import Event
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_SESSION = "default"
+"""Session of events that carry no session key, i.e. of single session deployments."""
+
+SESSION_KEY = "session"
+
+
+def session_key(event: Event) -> str:
+    """
+    Get the session key of an event.
+
+    The key is read from the 'session' attribute or key of the payload, of the first element of list payloads, or
+    from the 'session' attribute of the event metadata. Events without session key belong to the
+    :data:`DEFAULT_SESSION`.
+    """
+    if event is None:
+        return DEFAULT_SESSION
+
+    payload = event.payload
+    if isinstance(payload, (list, tuple)) and payload:
+        payload = payload[0]
+
+    if isinstance(payload, dict):
+        key = payload.get(SESSION_KEY)
+    else:
+        key = getattr(payload, SESSION_KEY, None)
+
+    return key or getattr(event.metadata, SESSION_KEY, None) or DEFAULT_SESSION
+
+
+def with_session(payload, session: str):
+    """
+    Mark a payload with a session key such that :func:`session_key` finds it in events with the payload.
+
+    Payloads of the :data:`DEFAULT_SESSION` are not modified, such that single session deployments publish the
+    same events as before.
+    """
+    if not session or session == DEFAULT_SESSION:
+        return payload
+
+    if isinstance(payload, (list, tuple)):
+        for element in payload:
+            with_session(element, session)
+    elif isinstance(payload, dict):
+        payload[SESSION_KEY] = session
+    else:
+        setattr(payload, SESSION_KEY, session)
+
+    return payload
+
+
+S = TypeVar('S')
+
+
+class SessionTable(Generic[S]):
+    """
+    Table of per-session state of a service.
+
+    State is created on first access of a session with the factory. Sessions that were not accessed for
+    idle_timeout seconds are removed by :meth:`expire`, and if max_sessions is exceeded, the least recently
+    accessed session is removed. Sessions removed by expiry or eviction are passed to on_remove, e.g. to release
+    their resources. State objects should define __slots__ to keep the table compact with many sessions.
+
+    Not thread safe, all calls are expected from the worker thread of the service.
+    """
+    def __init__(self, factory: Callable[[str], S], idle_timeout: float = None, max_sessions: int = None,
+                 on_remove: Callable[[str, S], None] = None):
+        """
+        :param factory: Creates the state of a new session from the session key
+        :param idle_timeout: Time in seconds after which idle sessions are removed, None to keep them
+        :param max_sessions: Maximal number of sessions kept, None for no limit
+        :param on_remove: Called with the key and state of sessions removed by expiry or eviction
+        """
+        self._factory = factory
+        self._idle_timeout = idle_timeout
+        self._max_sessions = max_sessions
+        self._on_remove = on_remove
+
+        self._sessions = dict()
+        # Insertion order of the dict is the order of last access
+        self._last_access = dict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, key: str):
+        return key in self._sessions
+
+    def __iter__(self) -> Iterator[Tuple[str, S]]:
+        return iter(list(self._sessions.items()))
+
+    def get(self, key: str, create: bool = True) -> Optional[S]:
+        """
+        Get the state of a session and mark it as accessed.
+
+        :param key: Session key
+        :param create: Create the session if it does not exist, otherwise return None
+        """
+        key = key or DEFAULT_SESSION
+        state = self._sessions.get(key)
+        if state is None and not create:
+            return None
+        if state is None:
+            state = self._sessions[key] = self._factory(key)
+            logger.debug("Created session %s", key)
+
+        self._last_access.pop(key, None)
+        self._last_access[key] = time.monotonic()
+
+        if self._max_sessions and len(self._sessions) > self._max_sessions:
+            evicted = next(iter(self._last_access))
+            self._discard(evicted)
+            logger.warning("Removed session %s, exceeded the maximal number of %s sessions",
+                           evicted, self._max_sessions)
+
+        return state
+
+    def remove(self, key: str) -> Optional[S]:
+        self._last_access.pop(key, None)
+
+        return self._sessions.pop(key, None)
+
+    def expire(self) -> int:
+        """
+        Remove sessions that were not accessed within the idle timeout.
+
+        :return: The number of removed sessions
+        """
+        if not self._idle_timeout:
+            return 0
+
+        cutoff = time.monotonic() - self._idle_timeout
+        expired = []
+        for key, last_access in self._last_access.items():
+            if last_access >= cutoff:
+                break
+            expired.append(key)
+
+        for key in expired:
+            self._discard(key)
+            logger.info("Removed idle session %s", key)
+
+        return len(expired)
+
+    def _discard(self, key: str):
+        state = self.remove(key)
+        if self._on_remove and state is not None:
+            try:
+                self._on_remove(key, state)
+            except:
+                logger.exception("Failed to clean up session %s", key)
@@ -0,0 +1,215 @@
+import collections
+import logging
+import threading
+import time
+from typing import Callable, Iterable, List, Mapping, Optional
+
+from cltl.combot.infra.event import Event, EventBus, TopicError
+from cltl.combot.infra.resource import ResourceManager, LockTimeoutError
+
+from cltl_service.infra.session import session_key
+
+logger = logging.getLogger(__name__)
+
+
+class PriorityTopicWorker:
+    """
+    Processes events from multiple topics on a single thread, ordered by the priority of their topic.
+
+    Pending events of topics with a lower priority value are processed first, events of the same priority in the
+    order they were received. For topics listed in latest_topics only the latest pending event per session is
+    kept, i.e. older events of these topics are dropped if the worker falls behind. Events of other topics are
+    buffered up to buffer_size events per priority, dropping the oldest of them if the buffer is full. Pending
+    events of latest_topics do not count towards the buffer_size and are not dropped for other events.
+
+    Like the :class:`TopicWorker`, the processor is called with None every scheduled seconds if scheduled is set.
+    Scheduled invocations take precedence over pending events, such that they are not delayed by a steady
+    stream of events. Required and provided resources are resolved with the resource manager before the worker
+    subscribes to its topics, as by the :class:`TopicWorker`.
+    """
+    # Time in seconds to wait for required resources
+    DEPENDENCY_TIMEOUT = 10
+
+    def __init__(self, topics: List[str], event_bus: EventBus, processor: Callable[[Optional[Event]], None],
+                 priorities: Mapping[str, int] = None, latest_topics: Iterable[str] = (),
+                 buffer_size: int = 32, scheduled: float = None, name: str = None,
+                 resource_manager: ResourceManager = None, requires: Iterable[str] = (),
+                 provides: Iterable[str] = ()):
+        """
+        :param topics: Topics to subscribe to
+        :param event_bus: Event bus to subscribe to
+        :param processor: Called with each event, and with None on scheduled invocations
+        :param priorities: Priority per topic, lower values are processed first, topics not listed have priority 0
+        :param latest_topics: Topics of which only the latest pending event per session is kept
+        :param buffer_size: Maximal number of pending events per priority that are not of latest topics
+        :param scheduled: Interval in seconds of scheduled invocations of the processor
+        :param name: Name of the worker thread
+        :param resource_manager: Resource manager of the application
+        :param requires: Resources required by the worker
+        :param provides: Resources provided by the worker
+        """
+        self._topics = list(topics)
+        self._event_bus = event_bus
+        self._processor = processor
+        self._priorities = dict(priorities) if priorities else {}
+        self._latest_topics = set(latest_topics)
+        self._buffer_size = buffer_size
+        self._scheduled = scheduled
+        self._name = name or self.__class__.__name__
+        self._resource_manager = resource_manager
+        self._requires = list(requires)
+        self._provides = list(provides)
+
+        self._levels = sorted(set(self._priorities.get(topic, 0) for topic in self._topics))
+        self._queues = {level: collections.deque() for level in self._levels}
+        # Queues contain pairs of a single element list with the event and the (topic, session) key for latest
+        # topics, pending events of latest topics are replaced in the list
+        self._latest = dict()
+        # Number of pending events per priority that are not of latest topics
+        self._buffered = collections.Counter()
+        self._dropped = collections.Counter()
+
+        self._condition = threading.Condition()
+        self._started = threading.Event()
+        self._running = False
+        self._thread = None
+
+    @property
+    def dropped(self) -> Mapping[str, int]:
+        """
+        Number of dropped events per topic.
+        """
+        with self._condition:
+            return dict(self._dropped)
+
+    @property
+    def pending(self) -> int:
+        with self._condition:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def start(self) -> threading.Event:
+        """
+        Start the worker.
+
+        :return: Event that is set once the worker is subscribed to its topics
+        """
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+        self._thread.start()
+
+        return self._started
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+
+    def await_stop(self, timeout: float = None):
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        self._resolve_dependencies()
+        for topic in self._topics:
+            self._event_bus.subscribe(topic, self._enqueue)
+        self._started.set()
+        logger.info("Started %s for topics %s", self._name, self._topics)
+
+        try:
+            next_invocation = time.monotonic() + self._scheduled if self._scheduled else None
+            while True:
+                event, scheduled = self._next(next_invocation)
+                if event is None and not scheduled:
+                    break
+
+                if scheduled:
+                    next_invocation = time.monotonic() + self._scheduled
+
+                try:
+                    self._processor(event)
+                except:
+                    logger.exception("Failed to process event %s in %s", event, self._name)
+        finally:
+            for topic in self._topics:
+                self._event_bus.unsubscribe(topic, self._enqueue)
+            logger.info("Stopped %s", self._name)
+
+    def _resolve_dependencies(self):
+        if not self._resource_manager:
+            return
+
+        for required in self._requires:
+            try:
+                self._resource_manager.get_read_lock(required, timeout=self.DEPENDENCY_TIMEOUT)
+            except LockTimeoutError:
+                raise TopicError(self._name + " failed to obtain required resource: " + required)
+
+        for provided in self._provides:
+            try:
+                self._resource_manager.provide_resource(provided)
+            except ValueError:
+                # Resource is already provided
+                pass
+
+    def _next(self, next_invocation):
+        with self._condition:
+            while self._running:
+                if next_invocation is not None and time.monotonic() >= next_invocation:
+                    return None, True
+
+                for level in self._levels:
+                    queue = self._queues[level]
+                    if queue:
+                        holder, key = queue.popleft()
+                        if key:
+                            del self._latest[key]
+                        else:
+                            self._buffered[level] -= 1
+                        return holder[0], False
+
+                timeout = max(0.0, next_invocation - time.monotonic()) if next_invocation is not None else None
+                self._condition.wait(timeout)
+
+        return None, False
+
+    def _enqueue(self, event: Event):
+        topic = event.metadata.topic
+        with self._condition:
+            key = (topic, session_key(event)) if topic in self._latest_topics else None
+            if key and key in self._latest:
+                self._latest[key][0] = event
+                self._dropped[topic] += 1
+                return
+
+            level = self._priorities.get(topic, 0)
+            queue = self._queues[level]
+            if not key:
+                if self._buffered[level] < self._buffer_size:
+                    self._buffered[level] += 1
+                elif not self._drop_oldest(queue):
+                    # Nothing older to drop, e.g. with a buffer_size of zero
+                    self._dropped[topic] += 1
+                    logger.warning("Dropped event on %s, %s is behind", topic, self._name)
+                    return
+
+            holder = [event]
+            if key:
+                self._latest[key] = holder
+
+            queue.append((holder, key))
+            self._condition.notify()
+
+    def _drop_oldest(self, queue) -> bool:
+        # Must be called with the condition held, pending events of latest topics are kept
+        index = next((index for index, (_, key) in enumerate(queue) if not key), None)
+        if index is None:
+            return False
+
+        dropped = queue[index][0][0]
+        del queue[index]
+
+        self._dropped[dropped.metadata.topic] += 1
+        logger.warning("Dropped event on %s, %s is behind", dropped.metadata.topic, self._name)
+
+        return True
@@ -9,31 +9,53 @@ from cltl.combot.infra.time_util import timestamp_now
 from cltl.combot.infra.topic_worker import TopicWorker
 from cltl.commons.discrete import UtteranceType
 from cltl_service.emissordata.client import EmissorDataClient
+from cltl_service.infra.metrics import MetricsRegistry, instrument
+from cltl_service.infra.session import SessionTable, session_key, with_session, DEFAULT_SESSION
 
 logger = logging.getLogger(__name__)
 
 
+class _ChatSession:
+    __slots__ = ("speaker", "scenario_id", "last_utterance", "last_utterance_time", "active", "initialized")
+
+    def __init__(self, key):
+        self.speaker = None
+        self.scenario_id = None
+        self.last_utterance = None
+        self.last_utterance_time = None
+        self.active = False
+        self.initialized = False
+
+
 class InitializeChatService():
     """
     Service used to integrate the component into applications.
     """
 
+    # Capacity of the event queue of the worker
+    BUFFER_SIZE = 4
+
     @classmethod
     def from_config(cls, emissor_client: EmissorDataClient,
                     event_bus: EventBus, resource_manager: ResourceManager,
-                    config_manager: ConfigurationManager):
+                    config_manager: ConfigurationManager, metrics: MetricsRegistry = None):
         config = config_manager.get_config("cltl.leolani.intentions.chat")
 
         init_interval = config.get("init_interval") if "init_interval" in config else None
         intentions = config.get("intentions", multi=True) if "intentions" in config else []
+        session_timeout = config.get_float("session_timeout") if "session_timeout" in config else None
 
         return cls(config.get("topic_scenario"), config.get("topic_utterance"), config.get("topic_speaker_mention"),
                    config.get("topic_intention"), intentions, init_interval,
-                   emissor_client, event_bus, resource_manager)
+                   emissor_client, event_bus, resource_manager, session_timeout, metrics)
 
     def __init__(self, scenario_topic: str, utterance_topic: str, speaker_mention_topic: str,
                  intention_topic: str, intentions: List[str], init_interval: int,
-                 emissor_client: EmissorDataClient, event_bus: EventBus, resource_manager: ResourceManager):
+                 emissor_client: EmissorDataClient, event_bus: EventBus, resource_manager: ResourceManager,
+                 session_timeout: float = None, metrics: MetricsRegistry = None):
+        """
+        The chat is initialized per session, see :func:`cltl_service.infra.session.session_key`.
+        """
 
         self._emissor_client = emissor_client
         self._event_bus = event_bus
@@ -47,23 +69,22 @@ class InitializeChatService():
         self._intentions = intentions
 
         self._topic_worker = None
+        self._metrics = metrics
 
         self._init_interval = init_interval
 
-        self._speaker = None
-        self._last_utterance = None
-        self._last_utterance_time = None
-        self._active = False
-        self._initialized = False
+        self._sessions = SessionTable(_ChatSession, session_timeout)
 
     def start(self, timeout=30):
         topics = [self._scenario_topic, self._intention_topic, self._utterance_topic]
-        self._topic_worker = TopicWorker(topics, self._event_bus,
+        event_bus, processor = instrument(self._metrics, self.__class__.__name__, self._event_bus, self._process,
+                                          buffer_size=self.BUFFER_SIZE)
+        self._topic_worker = TopicWorker(topics, event_bus,
                                          provides=[self._speaker_mention_topic],
                                          resource_manager=self._resource_manager,
                                          scheduled=self._init_interval//2 if self._init_interval else None,
-                                         buffer_size=4,
-                                         processor=self._process, name=self.__class__.__name__)
+                                         buffer_size=self.BUFFER_SIZE,
+                                         processor=processor, name=self.__class__.__name__)
         self._topic_worker.start().wait()
 
     def stop(self):
@@ -75,56 +96,67 @@ class InitializeChatService():
         self._topic_worker = None
 
     def _process(self, event: Event[Union[TextSignalEvent, AnnotationEvent]]):
+        if not event:
+            self._sessions.expire()
+            for key, session in self._sessions:
+                self._process_session(key, session, event)
+        else:
+            key = session_key(event)
+            self._process_session(key, self._sessions.get(key), event)
+
+    def _process_session(self, key: str, session: _ChatSession, event: Event):
         """
         This uses the last utterance before switching intention to 'chat'
         """
-        if not event and self._last_utterance_time and self._init_interval:
-            time_elapsed = timestamp_now() - self._last_utterance_time
-            self._initialized = time_elapsed < self._init_interval // 1000
+        if not event and session.last_utterance_time and self._init_interval:
+            time_elapsed = timestamp_now() - session.last_utterance_time
+            session.initialized = time_elapsed < self._init_interval // 1000
             logger.debug("Reset chat initialization after %s", time_elapsed)
         elif not event:
             pass
-        elif (event.metadata.topic == self._scenario_topic
-                and event.payload.scenario.context.speaker
-                and event.payload.scenario.context.speaker.uri):
-            self._speaker = event.payload.scenario.context.speaker
-            logger.debug("Set speaker to %s", self._speaker)
+        elif event.metadata.topic == self._scenario_topic:
+            session.scenario_id = event.payload.scenario.id
+            if event.payload.scenario.context.speaker and event.payload.scenario.context.speaker.uri:
+                session.speaker = event.payload.scenario.context.speaker
+                logger.debug("Set speaker of session %s to %s", key, session.speaker)
         elif event.metadata.topic == self._utterance_topic:
-            self._last_utterance = event.payload.signal.id
-            self._last_utterance_time = event.metadata.timestamp
+            session.last_utterance = event.payload.signal.id
+            session.last_utterance_time = event.metadata.timestamp
             # TODO ensure timestamps are millisec
-            # self._last_utterance_time = event.payload.signal.time.end if event.payload.signal.time.end else event.metadata.timestamp
-            logger.debug("Set last utterance to %s (%s)", self._last_utterance, event.payload.signal.text)
+            # session.last_utterance_time = event.payload.signal.time.end if event.payload.signal.time.end else event.metadata.timestamp
+            logger.debug("Set last utterance to %s (%s)", session.last_utterance, event.payload.signal.text)
         else:
-            self._active = self._chat_intention_is_active(event)
-            self._initialized = self._active and self._initialized
+            session.active = self._chat_intention_is_active(session, event)
+            session.initialized = session.active and session.initialized
 
-        if self._active and not self._initialized and self._speaker:
-            self._initialize_chat()
-            self._initialized = True
+        if session.active and not session.initialized and session.speaker:
+            self._initialize_chat(key, session)
+            session.initialized = True
 
-    def _chat_intention_is_active(self, event):
+    def _chat_intention_is_active(self, session, event):
         if event.metadata.topic != self._intention_topic or not hasattr(event.payload, "intentions"):
-            return self._active
+            return session.active
 
         return any(intention.label in self._intentions for intention in event.payload.intentions)
 
-    def _initialize_chat(self):
-        response_payload = self._create_payload()
+    def _initialize_chat(self, key, session):
+        response_payload = with_session(self._create_payload(key, session), key)
         self._event_bus.publish(self._speaker_mention_topic, Event.for_payload(response_payload))
         logger.debug("Starting to chat with text mention %s", response_payload)
 
-    def _create_payload(self):
-        scenario_id = self._emissor_client.get_current_scenario_id()
+    def _create_payload(self, key, session):
+        # Other than the default session use the scenario from the scenario events
+        scenario_id = session.scenario_id if key != DEFAULT_SESSION and session.scenario_id \
+            else self._emissor_client.get_current_scenario_id()
 
         mention_text_capsule = {
             "chat": scenario_id,
-            "turn": self._last_utterance,
-            "author": self._get_author(),
+            "turn": session.last_utterance,
+            "author": self._get_author(session.speaker),
             "utterance": "",
             "utterance_type": UtteranceType.TEXT_MENTION,
             "position": "",
-            "item": self._get_author() | {'id': None},
+            "item": self._get_author(session.speaker) | {'id': None},
             "perspective": {},
             'confidence': 1,
             "timestamp": timestamp_now(),
@@ -133,9 +165,9 @@ class InitializeChatService():
 
         return [mention_text_capsule]
 
-    def _get_author(self):
+    def _get_author(self, speaker):
         return {
-            "label": self._speaker.name if self._speaker and self._speaker.name else None,
+            "label": speaker.name if speaker and speaker.name else None,
             "type": ["person"],
-            "uri": self._speaker.uri if self._speaker else None
+            "uri": speaker.uri if speaker else None
         }
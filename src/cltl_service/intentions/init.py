@@ -12,6 +12,8 @@ from cltl.combot.infra.resource import ResourceManager
 from cltl.combot.infra.time_util import timestamp_now
 from cltl.combot.infra.topic_worker import TopicWorker
 from cltl_service.emissordata.client import EmissorDataClient
+from cltl_service.infra.metrics import MetricsRegistry, instrument
+from cltl_service.infra.session import SessionTable, session_key, with_session, DEFAULT_SESSION
 from emissor.representation.scenario import TextSignal
 
 logger = logging.getLogger(__name__)
@@ -23,10 +25,23 @@ TIMEOUT = 120_000
 _GREETINGS = [re.sub('[^a-z]+', '', greeting.lower()) for greeting in GREETING]
 
 
+class _InitSession:
+    __slots__ = ("active", "timeout", "scenario_id")
+
+    def __init__(self, key):
+        self.active = False
+        self.timeout = None
+        self.scenario_id = None
+
+
 class InitService:
+    # Capacity of the event queue of the worker
+    BUFFER_SIZE = 16
+
     @classmethod
     def from_config(cls, emissor_client: EmissorDataClient,
-                    event_bus: EventBus, resource_manager: ResourceManager, config_manager: ConfigurationManager):
+                    event_bus: EventBus, resource_manager: ResourceManager, config_manager: ConfigurationManager,
+                    metrics: MetricsRegistry = None):
         config = config_manager.get_config("cltl.leolani.intentions.init")
         topics = {
             "intention_topic": config.get("topic_intention"),
@@ -37,11 +52,17 @@ class InitService:
         }
 
         greeting = config.get("greeting") if "greeting" in config else None
+        session_timeout = config.get_float("session_timeout") if "session_timeout" in config else None
 
-        return cls(topics, greeting, emissor_client, event_bus, resource_manager)
+        return cls(topics, greeting, emissor_client, event_bus, resource_manager, session_timeout, metrics)
 
     def __init__(self, topics: Mapping[str, str], greeting: str,
-                 emissor_client: EmissorDataClient, event_bus: EventBus, resource_manager: ResourceManager):
+                 emissor_client: EmissorDataClient, event_bus: EventBus, resource_manager: ResourceManager,
+                 session_timeout: float = None, metrics: MetricsRegistry = None):
+        """
+        Initialization is run per session while the 'init' intention is active in that session, see
+        :func:`cltl_service.infra.session.session_key`.
+        """
         self._event_bus = event_bus
         self._resource_manager = resource_manager
         self._emissor_client = emissor_client
@@ -54,18 +75,21 @@ class InitService:
         self._greeting = greeting
 
         self._topic_worker = None
+        self._metrics = metrics
 
-        self._timeout = None
+        self._sessions = SessionTable(_InitSession, session_timeout)
 
     @property
     def app(self):
         return None
 
     def start(self, timeout=30):
-        self._topic_worker = TopicWorker(list(filter(bool, [self._face_topic, self._text_in_topic])),
-                                         self._event_bus, provides=[self._text_out_topic],
-                                         intentions=["init"], intention_topic=self._intention_topic,
-                                         resource_manager=self._resource_manager, processor=self._process,
+        event_bus, processor = instrument(self._metrics, self.__class__.__name__, self._event_bus, self._process,
+                                          buffer_size=self.BUFFER_SIZE)
+        self._topic_worker = TopicWorker(list(filter(bool, [self._intention_topic, self._face_topic,
+                                                            self._text_in_topic])),
+                                         event_bus, provides=[self._text_out_topic], buffer_size=self.BUFFER_SIZE,
+                                         resource_manager=self._resource_manager, processor=processor,
                                          scheduled=30,
                                          name=self.__class__.__name__)
         self._topic_worker.start().wait()
@@ -79,32 +103,55 @@ class InitService:
         self._topic_worker = None
 
     def _process(self, event: Event):
+        if not event:
+            self._sessions.expire()
+            for key, session in self._sessions:
+                if session.active:
+                    self._process_session(key, session, event)
+            return
+
+        key = session_key(event)
+        session = self._sessions.get(key)
+        if event.metadata.topic == self._intention_topic:
+            session.active = any(intention.label == "init" for intention in event.payload.intentions)
+            return
+
+        if event.metadata.topic == self._text_in_topic:
+            session.scenario_id = event.payload.signal.time.container_id
+
+        if session.active:
+            self._process_session(key, session, event)
+
+    def _process_session(self, key, session, event):
         if not self._greeting:
-            self._event_bus.publish(self._desire_topic, Event.for_payload(DesireEvent(["initialized"])))
-            logger.info("Initialized without greeting")
+            self._publish(self._desire_topic, key, DesireEvent(["initialized"]))
+            logger.info("Initialized session %s without greeting", key)
             return
 
         timestamp = timestamp_now()
 
         scheduled_invocation = event is None
-        if (scheduled_invocation or self._face_or_keyword(event)) and not self._timeout:
+        if (scheduled_invocation or self._face_or_keyword(event)) and not session.timeout:
             greeting = random.choice(GREETING) + " " + self._greeting
-            self._event_bus.publish(self._text_out_topic, Event.for_payload(self._create_text_signal_event(greeting)))
-            self._timeout = timestamp
-            logger.info("Start initialization")
+            self._publish(self._text_out_topic, key, self._create_text_signal_event(key, session, greeting))
+            session.timeout = timestamp
+            logger.info("Start initialization of session %s", key)
         elif scheduled_invocation:
             pass
-        elif self._timeout and timestamp - self._timeout < TIMEOUT and self._start_utterance(event):
-            self._timeout = None
-            self._event_bus.publish(self._desire_topic, Event.for_payload(DesireEvent(["initialized"])))
-            logger.info("Interaction initialized")
-        elif self._timeout and timestamp - self._timeout > TIMEOUT:
-            self._timeout = None
+        elif session.timeout and timestamp - session.timeout < TIMEOUT and self._start_utterance(event):
+            session.timeout = None
+            self._publish(self._desire_topic, key, DesireEvent(["initialized"]))
+            logger.info("Interaction initialized in session %s", key)
+        elif session.timeout and timestamp - session.timeout > TIMEOUT:
+            session.timeout = None
             goodbye = random.choice(GOODBYE) + " Let me know when you are back."
-            self._event_bus.publish(self._text_out_topic, Event.for_payload(self._create_text_signal_event(goodbye)))
-            logger.info("Reset initialization")
+            self._publish(self._text_out_topic, key, self._create_text_signal_event(key, session, goodbye))
+            logger.info("Reset initialization of session %s", key)
+
+        logger.debug("Unhandled event %s (%s - %s)", event, timestamp, session.timeout)
 
-        logger.debug("Unhandled event %s (%s - %s)", event, timestamp, self._timeout)
+    def _publish(self, topic, key, payload):
+        self._event_bus.publish(topic, Event.for_payload(with_session(payload, key)))
 
     def _start_utterance(self, event):
         return event.metadata.topic == self._text_in_topic and "yes" in event.payload.signal.text.lower()
@@ -118,8 +165,10 @@ class InitService:
             utterance = re.sub('[^a-z]+', '', event.payload.signal.text.lower())
             return any(greeting in utterance for greeting in _GREETINGS)
 
-    def _create_text_signal_event(self, text: str):
-        scenario_id = self._emissor_client.get_current_scenario_id()
+    def _create_text_signal_event(self, key: str, session: _InitSession, text: str):
+        # Other than the default session use the scenario of the last utterance
+        scenario_id = session.scenario_id if key != DEFAULT_SESSION and session.scenario_id \
+            else self._emissor_client.get_current_scenario_id()
         signal = TextSignal.for_scenario(scenario_id, timestamp_now(), timestamp_now(), None, text)
 
         return TextSignalEvent.for_agent(signal)
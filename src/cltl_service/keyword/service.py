@@ -1,6 +1,7 @@
+import json
 import logging
 import random
-from typing import Mapping
+from typing import List, Mapping
 
 from cltl.combot.event.bdi import DesireEvent
 from cltl.combot.event.emissor import TextSignalEvent
@@ -10,16 +11,38 @@ from cltl.combot.infra.resource import ResourceManager
 from cltl.combot.infra.time_util import timestamp_now
 from cltl.combot.infra.topic_worker import TopicWorker
 from cltl.commons.language_data.sentences import GOODBYE
+from cltl.keyword.api import KeywordMatcher, Trigger
+from cltl.keyword.matcher import CompiledKeywordMatcher
 from cltl_service.emissordata.client import EmissorDataClient
+from cltl_service.infra.metrics import MetricsRegistry, instrument
+from cltl_service.infra.session import SessionTable, session_key, with_session, DEFAULT_SESSION
 from emissor.representation.scenario import TextSignal
 
 logger = logging.getLogger(__name__)
 
 
+class _KeywordSession:
+    __slots__ = ("active",)
+
+    def __init__(self, key):
+        self.active = False
+
+
+def _default_triggers() -> List[Trigger]:
+    """
+    Triggers of the goodbye phrases, with the 'quit' desire and a goodbye as reply.
+    """
+    return [Trigger(phrases=tuple(GOODBYE), desire="quit", replies=tuple(GOODBYE))]
+
+
 class KeywordService:
+    # Capacity of the event queue of the worker
+    BUFFER_SIZE = 16
+
     @classmethod
     def from_config(cls, emissor_client: EmissorDataClient,
-                    event_bus: EventBus, resource_manager: ResourceManager, config_manager: ConfigurationManager):
+                    event_bus: EventBus, resource_manager: ResourceManager, config_manager: ConfigurationManager,
+                    metrics: MetricsRegistry = None):
         config = config_manager.get_config("cltl.leolani.keyword")
         topics = {
             "intention_topic": config.get("topic_intention"),
@@ -27,14 +50,26 @@ class KeywordService:
             "text_in_topic": config.get("topic_text_in"),
             "text_out_topic": config.get("topic_text_out")
         }
-
-        return cls(topics, emissor_client, event_bus, resource_manager)
-
-    def __init__(self, topics: Mapping[str, str],
-                 emissor_client: EmissorDataClient, event_bus: EventBus, resource_manager: ResourceManager):
+        session_timeout = config.get_float("session_timeout") if "session_timeout" in config else None
+        triggers = Trigger.from_table(json.loads(config.get("triggers"))) if "triggers" in config \
+            else _default_triggers()
+
+        return cls(topics, CompiledKeywordMatcher(triggers), emissor_client, event_bus, resource_manager,
+                   session_timeout, metrics)
+
+    def __init__(self, topics: Mapping[str, str], matcher: KeywordMatcher,
+                 emissor_client: EmissorDataClient, event_bus: EventBus, resource_manager: ResourceManager,
+                 session_timeout: float = None, metrics: MetricsRegistry = None):
+        """
+        Keywords are detected per session while the 'chat' intention is active in that session, see
+        :func:`cltl_service.infra.session.session_key`.
+
+        Utterances that match a trigger of the matcher publish the desire and one of the replies of the trigger.
+        """
         self._event_bus = event_bus
         self._resource_manager = resource_manager
         self._emissor_client = emissor_client
+        self._matcher = matcher
 
         self._intention_topic = topics["intention_topic"]
         self._desire_topic = topics["desire_topic"]
@@ -42,16 +77,20 @@ class KeywordService:
         self._text_out_topic = topics["text_out_topic"]
 
         self._topic_worker = None
+        self._metrics = metrics
+
+        self._sessions = SessionTable(_KeywordSession, session_timeout)
 
     @property
     def app(self):
         return None
 
     def start(self, timeout=30):
-        self._topic_worker = TopicWorker([self._text_in_topic],
-                                         self._event_bus, provides=[self._text_out_topic],
-                                         intentions=["chat"], intention_topic=self._intention_topic,
-                                         resource_manager=self._resource_manager, processor=self._process,
+        event_bus, processor = instrument(self._metrics, self.__class__.__name__, self._event_bus, self._process,
+                                          buffer_size=self.BUFFER_SIZE)
+        self._topic_worker = TopicWorker([self._intention_topic, self._text_in_topic],
+                                         event_bus, provides=[self._text_out_topic], buffer_size=self.BUFFER_SIZE,
+                                         resource_manager=self._resource_manager, processor=processor,
                                          name=self.__class__.__name__)
         self._topic_worker.start().wait()
 
@@ -64,19 +103,31 @@ class KeywordService:
         self._topic_worker = None
 
     def _process(self, event: Event):
-        if self._keyword(event):
-            self._event_bus.publish(self._desire_topic, Event.for_payload(DesireEvent(['quit'])))
-            self._event_bus.publish(self._text_out_topic, Event.for_payload(self._greeting_payload()))
-
-    def _keyword(self, event):
-        if event.metadata.topic == self._text_in_topic:
-            return any(event.payload.signal.text.lower() == bye.lower() for bye in GOODBYE)
-
-        return False
-
-    def _greeting_payload(self):
-        scenario_id = self._emissor_client.get_current_scenario_id()
+        key = session_key(event)
+        session = self._sessions.get(key)
+        self._sessions.expire()
+
+        if event.metadata.topic == self._intention_topic:
+            session.active = any(intention.label == "chat" for intention in event.payload.intentions)
+        elif session.active and event.metadata.topic == self._text_in_topic:
+            trigger = self._matcher.match(event.payload.signal.text)
+            if trigger:
+                self._trigger(key, event, trigger)
+
+    def _trigger(self, key, event, trigger):
+        if trigger.desire:
+            self._event_bus.publish(self._desire_topic,
+                                    Event.for_payload(with_session(DesireEvent([trigger.desire]), key)))
+        if trigger.replies:
+            self._event_bus.publish(self._text_out_topic,
+                                    Event.for_payload(with_session(self._reply_payload(key, event, trigger), key)))
+        logger.debug("Triggered %s in session %s", trigger.desire, key)
+
+    def _reply_payload(self, key, event, trigger):
+        # Reply in the scenario of the utterance for other than the default session
+        scenario_id = self._emissor_client.get_current_scenario_id() if key == DEFAULT_SESSION \
+            else event.payload.signal.time.container_id
         signal = TextSignal.for_scenario(scenario_id, timestamp_now(), timestamp_now(), None,
-                                         random.choice(GOODBYE))
+                                         random.choice(trigger.replies))
 
         return TextSignalEvent.for_agent(signal)
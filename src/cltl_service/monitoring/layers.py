@@ -0,0 +1,63 @@
+import collections
+import time
+from typing import Iterable, List, Tuple
+
+Annotation = Tuple[str, Tuple[float, float, float, float]]
+
+
+class AnnotationLayers:
+    """
+    Annotations of images in one layer per source, e.g. faces and objects.
+
+    Annotations are associated with the image they were detected in, and are only returned for that image.
+    Annotations of images older than max_age seconds are removed. Not thread safe.
+    """
+    def __init__(self, max_age: float):
+        """
+        :param max_age: Time in seconds after which the annotations of an image are removed
+        """
+        self._max_age = max_age
+        # Layers by image id in the order of the first annotation, with the time of the first annotation
+        self._images = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._images)
+
+    def add(self, source: str, image_id: str, annotations: Iterable[Annotation], timestamp: float = None) -> bool:
+        """
+        Add annotations of the image to the layer of the source and remove outdated annotations.
+
+        :return: True if the annotations of any image were removed
+        """
+        timestamp = timestamp if timestamp is not None else time.monotonic()
+        if image_id not in self._images:
+            self._images[image_id] = (timestamp, dict())
+
+        self._images[image_id][1].setdefault(source, []).extend(annotations)
+
+        return self.expire(timestamp)
+
+    def layers(self, image_id: str) -> List[Tuple[str, List[Annotation]]]:
+        """
+        Get the layers of an image as pairs of source and annotations.
+        """
+        _, layers = self._images.get(image_id, (None, {}))
+
+        return list(layers.items())
+
+    def expire(self, timestamp: float = None) -> bool:
+        """
+        Remove the annotations of images that are older than max_age at the given time.
+
+        :return: True if the annotations of any image were removed
+        """
+        cutoff = (timestamp if timestamp is not None else time.monotonic()) - self._max_age
+        expired = False
+        while self._images and next(iter(self._images.values()))[0] < cutoff:
+            self._images.popitem(last=False)
+            expired = True
+
+        return expired
+
+    def clear(self):
+        self._images.clear()
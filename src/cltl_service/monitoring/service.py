@@ -1,12 +1,16 @@
+import collections
 import io
 import json
 import logging
-from functools import wraps
+import threading
+import uuid
+from functools import wraps, partial
 from http import HTTPStatus
-from typing import Callable
+from typing import Callable, Optional, Tuple
 
 import flask
 import time
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image, ImageDraw, ImageFont
 from cltl.backend.source.client_source import ClientImageSource
 from cltl.backend.spi.image import ImageSource
@@ -19,7 +23,10 @@ from cltl.object_recognition.api import Object
 from emissor.representation.scenario import class_type
 from flask import Response
 
-from cltl.friends.api import FriendStore
+from cltl.friends.aio import BackgroundEventLoop
+from cltl.friends.api import FriendStore, AsyncFriendStore
+from cltl_service.infra.metrics import MetricsRegistry, instrument
+from cltl_service.monitoring.layers import AnnotationLayers
 
 logger = logging.getLogger(__name__)
 
@@ -48,30 +55,61 @@ def no_cache(f):
 
 class MonitoringService:
     ACTIVE_INTERVAL = 15 #sec
+    # Interval in seconds after which a stream resends the current frame if the display did not change
+    STREAM_KEEPALIVE = 5
+    # Number of text updates kept to replay to reconnecting clients
+    TEXT_REPLAY = 32
+    # Time in seconds the first image request after activation waits for a fresh image
+    SNAPSHOT_TIMEOUT = 3
+    # Capacity of the event queue of the worker
+    BUFFER_SIZE = 8
+    # Time in seconds a request that activates monitoring waits for the subscription to the monitored topics
+    ACTIVATION_TIMEOUT = 3
+    # Size the frame is fitted into, smaller sizes can be requested per client
+    DISPLAY_SIZE = (1200, 750)
+    JPEG_QUALITY = 75
+    # Number of encoded size and quality variants of the display cached per version
+    DISPLAY_VARIANTS = 8
 
     @classmethod
     def from_config(cls, friend_store: FriendStore,
-                    event_bus: EventBus, resource_manager: ResourceManager, config_manager: ConfigurationManager):
+                    event_bus: EventBus, resource_manager: ResourceManager, config_manager: ConfigurationManager,
+                    async_friend_store: AsyncFriendStore = None, metrics: MetricsRegistry = None):
         config = config_manager.get_config("cltl.monitoring")
         image_topic = config.get("topic_image")
         object_topic = config.get("topic_object")
         vector_id_topic = config.get("topic_vector_id")
         text_in_topic = config.get("topic_text_in")
         text_out_topic = config.get("topic_text_out")
+        image_fetch_workers = config.get_int("image_fetch_workers") if "image_fetch_workers" in config else 2
+        annotation_max_age = config.get_float("annotation_max_age") if "annotation_max_age" in config else 10
 
         def image_loader(url) -> ImageSource:
             return ClientImageSource.from_config(config_manager, url)
 
         return cls(image_topic, object_topic, vector_id_topic, text_in_topic, text_out_topic,
-                   image_loader, friend_store, event_bus, resource_manager)
+                   image_loader, friend_store, event_bus, resource_manager, async_friend_store, image_fetch_workers,
+                   annotation_max_age, metrics)
 
     def __init__(self, image_topic: str, object_topic: str, vector_id_topic: str, text_in_topic: str, text_out_topic: str,
                  image_loader: Callable[[str], ImageSource], friend_store: FriendStore,
-                 event_bus: EventBus, resource_manager: ResourceManager):
+                 event_bus: EventBus, resource_manager: ResourceManager, async_friend_store: AsyncFriendStore = None,
+                 image_fetch_workers: int = 2, annotation_max_age: float = 10, metrics: MetricsRegistry = None):
+        """
+        Images are fetched by a pool of image_fetch_workers threads. Requested images that did not start to load
+        when a newer image arrives are skipped, and a loaded image is only displayed if no newer image is displayed
+        yet.
+
+        Face and object annotations are kept in separate layers per image and drawn on the image they refer to,
+        annotations are discarded after annotation_max_age seconds.
+        """
         self._event_bus = event_bus
         self._resource_manager = resource_manager
 
         self._image_loader = image_loader
+        self._image_fetch_workers = image_fetch_workers
+        self._image_executor = None
+        self._image_future = None
 
         self._image_topic = image_topic
         self._object_topic = object_topic
@@ -80,14 +118,44 @@ class MonitoringService:
         self._text_out_topic = text_out_topic
 
         self._topic_worker = None
+        self._metrics = metrics
+        self._worker_lock = threading.Lock()
+        self._activity_watch = None
+        self._stopped = threading.Event()
 
         self._friend_store = friend_store
+        self._async_friend_store = async_friend_store
+        self._event_loop = None
         self._friend_cache = dict()
+        self._pending_names = set()
 
         self._app = None
         self._text_info = None
-        self._image = None
+        self._text_changed = threading.Condition()
+        self._text_updates = collections.deque(maxlen=self.TEXT_REPLAY)
+        self._text_id = 0
+
+        # The display is rendered on request from the latest frame and its annotations
+        self._display_lock = threading.Lock()
+        self._display_changed = threading.Condition(self._display_lock)
+        self._frame = None
+        self._frame_id = None
+        # Downscaled frame with its scale factor, rendered once per frame
+        self._base = None
+        self._base_scale = None
+        self._annotation_max_age = annotation_max_age
+        self._annotation_layers = AnnotationLayers(annotation_max_age)
+        # Sequence number of the latest requested and of the displayed image
+        self._image_seq = 0
+        self._frame_seq = 0
+        # Rendered display and its JPEG encoded variants by size and quality in the order of their last use
         self._display = None
+        self._variants = collections.OrderedDict()
+        self._dirty = False
+        self._version = 0
+        # Distinguishes ETags of different service instances, as versions restart at zero
+        self._etag_prefix = uuid.uuid4().hex[:8]
+        self._streaming = False
 
         self._active = ThreadsafeValue(None)
 
@@ -101,53 +169,161 @@ class MonitoringService:
         @self._app.route('/text', methods=['GET'])
         @no_cache
         def text_info():
-            self._active.value = time.time()
+            self._activate()
 
             if not self._text_info:
                 return Response(status=HTTPStatus.NOT_FOUND)
 
             return Response(json.dumps(self._text_info), mimetype="application/json")
 
-        @self._app.route('/image.jpg', methods=['GET'])
+        @self._app.route('/text/stream', methods=['GET'])
         @no_cache
-        def _image():
-            self._active.value = time.time()
+        def text_stream():
+            last_id = flask.request.headers.get("Last-Event-ID", type=int)
 
-            if not self._display:
-                return Response(status=HTTPStatus.NOT_FOUND)
+            return Response(self._stream_text(last_id), mimetype="text/event-stream")
 
-            response = flask.send_file(io.BytesIO(self._display), mimetype='image/jpeg')
+        @self._app.route('/image.jpg', methods=['GET'])
+        def _image():
+            if self._activate():
+                self._await_display(self.SNAPSHOT_TIMEOUT)
+
+            display, etag = self._get_display(*self._display_args())
+            if not display:
+                response = Response(status=HTTPStatus.NOT_FOUND)
+                response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+                return response
+
+            if etag in flask.request.if_none_match:
+                response = Response(status=HTTPStatus.NOT_MODIFIED)
+            else:
+                response = Response(display, mimetype='image/jpeg')
+            # Clients may cache the display, but must revalidate it on each request
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
 
             return response
 
+        @self._app.route('/image.mjpeg', methods=['GET'])
+        @no_cache
+        def _image_stream():
+            max_fps = flask.request.args.get("fps", default=None, type=float)
+
+            return Response(self._stream_display(1 / max_fps if max_fps else 0, *self._display_args()),
+                            mimetype="multipart/x-mixed-replace; boundary=frame")
+
         return self._app
 
     def start(self, timeout=30):
-        self._topic_worker = TopicWorker([self._image_topic, self._object_topic, self._vector_id_topic,
-                                          self._text_in_topic, self._text_out_topic],
-                                         self._event_bus, buffer_size=8, processor=self._process,
-                                         resource_manager=self._resource_manager,
-                                         name=self.__class__.__name__)
-        self._topic_worker.start().wait()
+        self._streaming = True
+        self._image_executor = ThreadPoolExecutor(max_workers=self._image_fetch_workers,
+                                                  thread_name_prefix=self.__class__.__name__ + "Images")
 
-    def stop(self):
-        if not self._topic_worker:
-            pass
+        if self._async_friend_store:
+            self._event_loop = BackgroundEventLoop(name=self.__class__.__name__ + "Lookups")
+            self._event_loop.start()
 
-        self._topic_worker.stop()
-        self._topic_worker.await_stop()
-        self._topic_worker = None
-
-    def _process(self, event: Event):
-        if not self._active.value:
-            logger.debug("Skipping event while monitoring is not active")
-            return
+        self._stopped.clear()
+        self._activity_watch = threading.Thread(target=self._watch_activity, daemon=True,
+                                                name=self.__class__.__name__ + "Activity")
+        self._activity_watch.start()
 
-        if self._active.value < time.time() - self.ACTIVE_INTERVAL:
+    def stop(self):
+        self._streaming = False
+        with self._display_changed:
+            self._display_changed.notify_all()
+        with self._text_changed:
+            self._text_changed.notify_all()
+
+        self._stopped.set()
+        if self._activity_watch:
+            self._activity_watch.join()
+            self._activity_watch = None
+        self._deactivate()
+
+        if self._event_loop:
+            self._event_loop.stop()
+            self._event_loop = None
+
+        if self._image_executor:
+            self._image_executor.shutdown(wait=True, cancel_futures=True)
+            self._image_executor = None
+
+    def _activate(self) -> bool:
+        """
+        Mark monitoring as active and subscribe to the monitored topics if the service is not subscribed.
+
+        :return: True if the service was not subscribed before
+        """
+        self._active.value = time.time()
+
+        with self._worker_lock:
+            if self._topic_worker or not self._streaming:
+                return False
+
+            event_bus, processor = instrument(self._metrics, self.__class__.__name__, self._event_bus,
+                                              self._process, buffer_size=self.BUFFER_SIZE)
+            self._topic_worker = TopicWorker([self._image_topic, self._object_topic, self._vector_id_topic,
+                                              self._text_in_topic, self._text_out_topic],
+                                             event_bus, buffer_size=self.BUFFER_SIZE, processor=processor,
+                                             resource_manager=self._resource_manager,
+                                             name=self.__class__.__name__)
+            subscribed = self._topic_worker.start()
+
+        # Wait outside the lock, such that other requests are not blocked by a slow subscription
+        if not subscribed.wait(self.ACTIVATION_TIMEOUT):
+            logger.warning("Monitoring did not subscribe within %s seconds", self.ACTIVATION_TIMEOUT)
+
+        logger.info("Activated monitoring")
+
+        return True
+
+    def _deactivate(self, inactive_since: float = None):
+        """
+        Unsubscribe from the monitored topics and discard the outdated display and text.
+
+        :param inactive_since: Only deactivate if monitoring was not active since this time
+        """
+        with self._worker_lock:
+            if not self._topic_worker:
+                return
+            if inactive_since and self._active.value and self._active.value >= inactive_since:
+                return
+
+            self._topic_worker.stop()
+            self._topic_worker.await_stop()
+            self._topic_worker = None
             self._active.value = None
-            logger.info("Deactivate monitoring")
-            return
 
+            with self._display_lock:
+                # Discard images that are still loading
+                self._image_seq += 1
+                self._frame_seq = self._image_seq
+                self._frame = None
+                self._frame_id = None
+                self._base = None
+                self._annotation_layers.clear()
+                self._display = None
+                self._variants.clear()
+                self._dirty = False
+            with self._text_changed:
+                self._text_info = None
+
+        logger.info("Deactivated monitoring")
+
+    def _watch_activity(self):
+        # Also remove expired annotations from a display that does not change otherwise
+        interval = min(self.ACTIVE_INTERVAL / 3, max(1, self._annotation_max_age / 2))
+        while not self._stopped.wait(interval):
+            self._deactivate(inactive_since=time.time() - self.ACTIVE_INTERVAL)
+            with self._display_lock:
+                self._expire_annotations()
+
+    def _await_display(self, timeout):
+        with self._display_changed:
+            self._display_changed.wait_for(lambda: self._frame is not None or not self._streaming, timeout=timeout)
+
+    def _process(self, event: Event):
         if event.metadata.topic == self._text_in_topic:
             self._update_text(event, "You")
         elif event.metadata.topic == self._text_out_topic:
@@ -162,77 +338,284 @@ class MonitoringService:
             logger.warning("Unhandled event: %s", event)
 
     def _update_text(self, event, speaker):
-        self._text_info = {
+        text_info = {
             "utterance": event.payload.signal.text,
             "speaker": speaker
         }
 
+        with self._text_changed:
+            self._text_info = text_info
+            self._text_id += 1
+            self._text_updates.append((self._text_id, text_info))
+            self._text_changed.notify_all()
+
+    def _stream_text(self, last_id):
+        """
+        Generate text updates as server-sent events.
+
+        Clients that reconnect with the id of the last event they received get the updates they missed, as far as
+        they are still in the replay buffer, other clients start with the latest update.
+        """
+        with self._text_changed:
+            if last_id is None or last_id > self._text_id:
+                last_id = self._text_id - 1 if self._text_id else 0
+
+        logger.info("Start text stream")
+        try:
+            while self._streaming:
+                self._activate()
+
+                with self._text_changed:
+                    self._text_changed.wait_for(lambda: self._text_id > last_id or not self._streaming,
+                                                timeout=self.STREAM_KEEPALIVE)
+                    updates = [(text_id, info) for text_id, info in self._text_updates if text_id > last_id]
+
+                if not self._streaming:
+                    break
+                if not updates:
+                    yield ": keepalive\n\n"
+                    continue
+
+                for text_id, info in updates:
+                    yield f"id: {text_id}\nevent: text\ndata: {json.dumps(info)}\n\n"
+                last_id = updates[-1][0]
+        finally:
+            logger.info("Stopped text stream")
+
     def _update_image(self, event):
+        image_id = event.payload.signal.id
         image_location = event.payload.signal.files[0]
 
-        with self._image_loader(image_location) as source:
-            image = source.capture()
+        with self._display_lock:
+            self._image_seq += 1
+            seq = self._image_seq
+
+        if self._image_future:
+            self._image_future.cancel()
+        self._image_future = self._image_executor.submit(self._fetch_image, seq, image_id, image_location)
+
+    def _fetch_image(self, seq, image_id, image_location):
+        if seq != self._image_seq:
+            logger.debug("Skipped outdated image %s", image_id)
+            return
+
+        try:
+            with self._image_loader(image_location) as source:
+                image = source.capture()
+        except:
+            logger.exception("Failed to load image %s", image_location)
+            return
+
+        with self._display_lock:
+            if seq < self._frame_seq:
+                logger.debug("Discarded outdated image %s", image_id)
+                return
 
-        self._image = Image.fromarray(image.image)
-        self._create_display(self._image)
+            self._frame = image.image
+            self._frame_id = image_id
+            self._frame_seq = seq
+            self._base = None
+            self._mark_dirty()
 
         logger.debug("Updated image")
 
     def _update_people(self, event):
-        items = []
-
         # TODO replace "VectorIdentity" with class_type(VectorIdentity)
-        for face_id, bounds in [(annotation.value, mention.segment[0].bounds)
-                        for mention in event.payload.mentions
-                        for annotation in mention.annotations
-                        if annotation.type == "VectorIdentity" and mention.segment]:
-            if face_id:
-                items.append((self._get_name(face_id), bounds))
+        faces = [(annotation.value, mention.segment[0])
+                 for mention in event.payload.mentions
+                 for annotation in mention.annotations
+                 if annotation.type == "VectorIdentity" and mention.segment and annotation.value]
 
-        self._annotate_image(items)
+        self._resolve_names(face_id for face_id, _ in faces)
+        items = [(self._friend_cache.get(face_id, face_id), segment) for face_id, segment in faces]
 
-    def _get_name(self, face_id):
-        if face_id in self._friend_cache:
-            return self._friend_cache[face_id]
+        self._annotate_image("faces", items)
 
-        _, names = self._friend_store.get_friend(face_id)
-        if names and names[0]:
-            name = names[0]
-            self._friend_cache[face_id] = name
+    def _resolve_names(self, face_ids):
+        unknown = [face_id for face_id in face_ids
+                   if face_id not in self._friend_cache and face_id not in self._pending_names]
+        if not unknown:
+            return
+
+        if self._async_friend_store:
+            # Annotate with the face ids until the names are resolved
+            self._pending_names.update(unknown)
+            future = self._event_loop.submit(self._async_friend_store.get_friends_by_ids(unknown))
+            future.add_done_callback(partial(self._cache_resolved_names, unknown))
+        else:
+            self._cache_names(self._friend_store.get_friends_by_ids(unknown))
 
-            return name
+    def _cache_resolved_names(self, face_ids, future):
+        try:
+            self._cache_names(future.result())
+        except:
+            logger.exception("Failed to resolve names for %s", face_ids)
+        finally:
+            self._pending_names.difference_update(face_ids)
 
-        return face_id
+    def _cache_names(self, friends):
+        for face_id, (_, names) in friends.items():
+            if names and names[0]:
+                self._friend_cache[face_id] = names[0]
 
     def _update_objects(self, event):
-        objects = [(annotation.value.label, mention.segment[0].bounds)
+        objects = [(annotation.value.label, mention.segment[0])
                    for mention in event.payload.mentions
                    for annotation in mention.annotations
                    if annotation.type == class_type(Object) and annotation.value and mention.segment]
 
-        self._annotate_image(objects)
+        self._annotate_image("objects", objects)
 
-    def _annotate_image(self, items) -> None:
-        if not self._image or not items:
+    def _annotate_image(self, source, items) -> None:
+        """
+        Add annotations given as pairs of label and image segment to the layer of the source for the image the
+        segment refers to. Annotations of segments without image id are added to the displayed image.
+        """
+        if not items:
             return
 
-        draw = ImageDraw.Draw(self._image)
-        for name, bbox in items:
-            draw.rectangle(bbox, outline=(0, 0, 0))
-            draw.text((bbox[0], bbox[1]), (name[:12] + ".." if len(name) > 12 else name), fill=(255, 0, 0), font=FONT)
+        with self._display_lock:
+            by_image = collections.defaultdict(list)
+            for name, segment in items:
+                image_id = getattr(segment, "container_id", None) or self._frame_id
+                if image_id is not None:
+                    by_image[image_id].append((name, segment.bounds))
+
+            expired = False
+            for image_id, annotations in by_image.items():
+                expired |= self._annotation_layers.add(source, image_id, annotations)
+
+            if self._frame_id in by_image or (expired and self._frame is not None):
+                self._mark_dirty()
+
+        logger.debug("Added %s items to the image", len(items))
+
+    def _mark_dirty(self):
+        # Must be called with the display lock held
+        self._dirty = True
+        self._version += 1
+        self._display_changed.notify_all()
+
+    def _expire_annotations(self):
+        # Must be called with the display lock held
+        if self._annotation_layers.expire() and self._frame is not None:
+            self._mark_dirty()
+
+    def _display_args(self) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+        """
+        Get the maximal width and height and the JPEG quality of the display from the request arguments.
+        """
+        args = flask.request.args
+        width = args.get("w", default=None, type=int)
+        height = args.get("h", default=None, type=int)
+        quality = args.get("quality", default=None, type=int)
+
+        return (width if width and width > 0 else None,
+                height if height and height > 0 else None,
+                min(95, max(1, quality)) if quality else None)
+
+    def _stream_display(self, min_interval, width=None, height=None, quality=None):
+        """
+        Generate the display as MJPEG stream.
+
+        A frame is sent whenever the display changes. If a client is slower than the display changes, the
+        intermediate frames are dropped for that client and it receives the latest display when it is ready again.
+        Frames are sent at most every min_interval seconds.
+        """
+        version = None
+        logger.info("Start display stream")
+        try:
+            while self._streaming:
+                self._activate()
+
+                with self._display_changed:
+                    self._display_changed.wait_for(lambda: self._version != version or not self._streaming,
+                                                   timeout=self.STREAM_KEEPALIVE)
+                    display, _ = self._render_display(width, height, quality)
+                    version = self._version
+
+                if not self._streaming:
+                    break
+                if display:
+                    yield b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: " \
+                          + str(len(display)).encode() + b"\r\n\r\n" + display + b"\r\n"
+
+                if min_interval:
+                    time.sleep(min_interval)
+        finally:
+            logger.info("Stopped display stream")
+
+    def _get_display(self, width: int = None, height: int = None, quality: int = None) \
+            -> Tuple[Optional[bytes], Optional[str]]:
+        """
+        Get the JPEG encoded display fitted into width and height with the given quality, and its ETag.
+
+        The display is rendered if the frame or its annotations changed since it was last rendered. Encoded variants
+        of the display are cached until it changes, such that repeated requests for the same version do not encode
+        the display again.
+        """
+        with self._display_lock:
+            return self._render_display(width, height, quality)
+
+    def _render_display(self, width=None, height=None, quality=None):
+        # Must be called with the display lock held
+        self._expire_annotations()
+        if self._dirty:
+            if self._base is None:
+                self._base, self._base_scale = self._create_base(self._frame)
+
+            layers = [(source, annotations) for source, annotations in self._annotation_layers.layers(self._frame_id)
+                      if annotations]
+            self._display = self._composite(self._base, self._base_scale, layers) if layers else self._base
+            self._variants.clear()
+            self._dirty = False
+
+        if self._display is None:
+            return None, None
+
+        size = self._fit(self._display.size, width, height)
+        quality = quality or self.JPEG_QUALITY
+        key = (size, quality)
+        if key in self._variants:
+            self._variants.move_to_end(key)
+        else:
+            image = self._display.resize(size, Image.ANTIALIAS) if size != self._display.size else self._display
+            self._variants[key] = self._encode(image, quality)
+            if len(self._variants) > self.DISPLAY_VARIANTS:
+                self._variants.popitem(last=False)
+
+        return self._variants[key], f"{self._etag_prefix}-{self._version}-{size[0]}x{size[1]}-q{quality}"
+
+    def _fit(self, size, width, height):
+        """
+        Fit the size into width and height, keeping the aspect ratio. Sizes are not scaled up.
+        """
+        factor = min(1, width / size[0] if width else 1, height / size[1] if height else 1)
 
-        self._create_display(self._image)
+        return tuple(max(1, int(factor * dim)) for dim in size)
 
-        logger.debug("Draw %s items in image", len(items))
+    def _create_base(self, frame):
+        image = Image.fromarray(frame)
 
-    def _create_display(self, image) -> None:
-        factor = min(1200/image.size[0], 750/image.size[1])
+        factor = min(self.DISPLAY_SIZE[0] / image.size[0], self.DISPLAY_SIZE[1] / image.size[1])
         new_size = tuple(int(factor * dim) for dim in image.size)
 
-        resized = image.resize(new_size, Image.ANTIALIAS)
+        return (image.resize(new_size, Image.ANTIALIAS) if new_size != image.size else image), factor
+
+    def _composite(self, base, scale, layers):
+        image = base.copy()
+        draw = ImageDraw.Draw(image)
+        for _, annotations in layers:
+            for name, bbox in annotations:
+                bbox = tuple(scale * coordinate for coordinate in bbox)
+                draw.rectangle(bbox, outline=(0, 0, 0))
+                draw.text((bbox[0], bbox[1]), (name[:12] + ".." if len(name) > 12 else name),
+                          fill=(255, 0, 0), font=FONT)
+
+        return image
 
+    def _encode(self, image, quality) -> bytes:
         img_src = io.BytesIO()
-        resized.save(img_src, format="JPEG")
-        img_src.seek(0)
+        image.save(img_src, format="JPEG", quality=quality)
 
-        self._display = img_src.read()
+        return img_src.getvalue()
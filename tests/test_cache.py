@@ -0,0 +1,87 @@
+import unittest
+from unittest import mock
+
+from cltl.friends.cache import CachedFriendsStore
+from cltl.friends.memory import MemoryFriendsStore
+
+
+class CountingStore(MemoryFriendsStore):
+    def __init__(self):
+        super().__init__()
+        self.lookups = []
+
+    def get_friend(self, identifier):
+        self.lookups.append(identifier)
+        return super().get_friend(identifier)
+
+    def get_friends_by_ids(self, identifiers):
+        identifiers = list(identifiers)
+        self.lookups.extend(identifiers)
+        return {identifier: super(CountingStore, self).get_friend(identifier) for identifier in identifiers}
+
+
+class CachedFriendsStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        patcher = mock.patch("cltl.friends.cache.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.store = CountingStore()
+        self.store.add_friend("face_1", "Alice")
+        self.store.add_friend("face_2", "Bob")
+        self.store.add_friend("face_3", "Carol")
+
+    def test_lookups_are_cached(self):
+        cache = CachedFriendsStore(self.store)
+
+        self.assertEqual(["Alice"], cache.get_friend("face_1")[1])
+        self.assertEqual(["Alice"], cache.get_friend("face_1")[1])
+        self.assertEqual({"face_1", "face_2"}, set(cache.get_friends_by_ids(["face_1", "face_2"])))
+
+        self.assertEqual(["face_1", "face_2"], self.store.lookups)
+        self.assertEqual({"hits": 2, "misses": 2, "size": 2}, cache.stats)
+
+    def test_evicts_least_recently_used(self):
+        cache = CachedFriendsStore(self.store, max_size=2)
+
+        cache.get_friend("face_1")
+        cache.get_friend("face_2")
+        cache.get_friend("face_1")
+        cache.get_friend("face_3")
+        self.store.lookups.clear()
+
+        cache.get_friends_by_ids(["face_1", "face_2", "face_3"])
+        self.assertEqual(["face_2"], self.store.lookups)
+
+    def test_entries_expire_after_ttl(self):
+        cache = CachedFriendsStore(self.store, ttl=10, negative_ttl=1)
+
+        cache.get_friend("face_1")
+        self.assertEqual((None, None), cache.get_friend("unknown"))
+        self.store.add_friend("unknown", "Dave")
+
+        self.now = 1
+        self.assertEqual((None, None), cache.get_friend("unknown"))
+        self.now = 2
+        self.assertEqual(["Dave"], cache.get_friend("unknown")[1])
+
+        self.now = 10
+        cache.get_friend("face_1")
+        self.now = 11
+        cache.get_friend("face_1")
+
+        self.assertEqual(["face_1", "unknown", "unknown", "face_1"], self.store.lookups)
+
+    def test_writes_invalidate_entries(self):
+        cache = CachedFriendsStore(self.store)
+
+        self.assertEqual((None, None), cache.get_friend("face_4"))
+        cache.add_friend("face_4", "Dave")
+        self.assertEqual(["Dave"], cache.get_friend("face_4")[1])
+
+        cache.get_friend("face_1")
+        cache.add_friends([("face_1", "Ally")])
+        self.assertEqual(["Ally"], cache.get_friend("face_1")[1])
+
+        self.assertEqual(["face_4", "face_4", "face_1", "face_1"], self.store.lookups)
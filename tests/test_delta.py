@@ -0,0 +1,104 @@
+import unittest
+
+from cltl.combot.event.emissor import Agent, LeolaniContext
+from emissor.representation.scenario import Scenario
+
+from cltl_service.context.delta import ScenarioDeltaEncoder, ScenarioRebuilder
+
+AGENT = Agent("Leolani", "http://cltl.nl/leolani/world/leolani")
+
+
+def create_scenario(scenario_id="scenario_1"):
+    context = LeolaniContext(AGENT, Agent(), "context_1", {"city": "Amsterdam"}, [], [])
+
+    return Scenario.new_instance(scenario_id, 0, None, context, {})
+
+
+class ScenarioDeltaTest(unittest.TestCase):
+    def setUp(self):
+        self.scenario = create_scenario()
+        self.encoder = ScenarioDeltaEncoder(snapshot_interval=1000)
+        self.rebuilder = ScenarioRebuilder()
+
+    def test_delta_contains_changes(self):
+        self.assertIsNotNone(self.encoder.delta(self.scenario, 0).snapshot)
+        self.assertIsNone(self.encoder.delta(self.scenario, 10))
+
+        self.scenario.context.persons.append(Agent("Alice", "http://world/alice"))
+        self.scenario.context.objects = ["chair", "chair"]
+        delta = self.encoder.delta(self.scenario, 20)
+
+        self.assertEqual(1, delta.sequence)
+        self.assertIsNone(delta.snapshot)
+        self.assertEqual([Agent("Alice", "http://world/alice")], delta.added_persons)
+        self.assertEqual(["chair", "chair"], delta.added_objects)
+
+        self.scenario.context.persons.clear()
+        self.scenario.context.objects = ["chair"]
+        delta = self.encoder.delta(self.scenario, 30)
+
+        self.assertEqual(2, delta.sequence)
+        self.assertEqual([Agent("Alice", "http://world/alice")], delta.removed_persons)
+        self.assertEqual(["chair"], delta.removed_objects)
+
+    def test_snapshot_after_interval(self):
+        self.assertFalse(self.encoder.snapshot_due(0))
+        self.encoder.delta(self.scenario, 0)
+
+        self.assertFalse(self.encoder.snapshot_due(999))
+        self.assertTrue(self.encoder.snapshot_due(1000))
+
+        delta = self.encoder.delta(self.scenario, 1000)
+        self.assertIsNotNone(delta.snapshot)
+        self.assertEqual(1, delta.sequence)
+        self.assertFalse(self.encoder.snapshot_due(1500))
+
+    def test_new_scenario_starts_new_sequence(self):
+        self.encoder.delta(self.scenario, 0)
+        self.scenario.context.objects = ["chair"]
+        self.encoder.delta(self.scenario, 10)
+
+        delta = self.encoder.delta(create_scenario("scenario_2"), 20)
+        self.assertEqual(("scenario_2", 0), (delta.scenario_id, delta.sequence))
+        self.assertIsNotNone(delta.snapshot)
+
+    def test_rebuild_scenario(self):
+        self.assertIsNone(self.rebuilder.scenario)
+        self.rebuilder.apply(self.encoder.delta(self.scenario, 0))
+
+        self.scenario.context.speaker = Agent("Alice", "http://world/alice")
+        self.scenario.context.persons.append(Agent("Alice", "http://world/alice"))
+        self.scenario.context.objects = ["chair", "table"]
+        self.rebuilder.apply(self.encoder.delta(self.scenario, 10))
+
+        self.scenario.context.objects = ["chair"]
+        self.scenario.ruler.end = 20
+        scenario = self.rebuilder.apply(self.encoder.delta(self.scenario, 20))
+
+        self.assertIsNot(self.scenario, scenario)
+        self.assertEqual(Agent("Alice", "http://world/alice"), scenario.context.speaker)
+        self.assertEqual([Agent("Alice", "http://world/alice")], scenario.context.persons)
+        self.assertEqual(["chair"], scenario.context.objects)
+        self.assertEqual(20, scenario.ruler.end)
+
+    def test_rebuild_waits_for_snapshot_after_gap(self):
+        self.rebuilder.apply(self.encoder.delta(self.scenario, 0))
+
+        self.scenario.context.objects = ["chair"]
+        self.encoder.delta(self.scenario, 10)
+        self.scenario.context.objects = ["chair", "table"]
+        self.assertIsNone(self.rebuilder.apply(self.encoder.delta(self.scenario, 20)))
+
+        self.scenario.context.objects = ["table"]
+        self.assertIsNone(self.rebuilder.apply(self.encoder.delta(self.scenario, 30)))
+        self.assertIsNone(self.rebuilder.scenario)
+
+        scenario = self.rebuilder.apply(self.encoder.delta(self.scenario, 1000))
+        self.assertEqual(["table"], scenario.context.objects)
+
+    def test_rebuild_ignores_deltas_without_snapshot(self):
+        self.encoder.delta(self.scenario, 0)
+        self.scenario.context.objects = ["chair"]
+
+        self.assertIsNone(self.rebuilder.apply(self.encoder.delta(self.scenario, 10)))
+        self.assertIsNone(self.rebuilder.scenario)
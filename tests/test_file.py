@@ -0,0 +1,79 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from cltl.friends.file import FileFriendsStore
+
+
+class FileFriendsStoreTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = Path(tmp_dir.name)
+        self.log_path = self.path / FileFriendsStore.LOG_FILE
+        self.snapshot_path = self.path / FileFriendsStore.SNAPSHOT_FILE
+
+    def open_store(self, **kwargs):
+        store = FileFriendsStore(self.path, **kwargs)
+        self.addCleanup(store.close)
+
+        return store
+
+    def test_replays_log(self):
+        store = self.open_store()
+        store.add_friend("face_1", "Alice")
+        store.add_friends([("face_2", ["Bob", "Bobby"]), ("face_1", "Ally")])
+        store.close()
+
+        store = self.open_store()
+        self.assertEqual({"face_1": (None, ["Ally"]), "face_2": (None, ["Bob", "Bobby"])}, store.get_friends())
+        self.assertEqual({"face_2"}, set(store.find_by_name("bobby")))
+        self.assertFalse(self.snapshot_path.exists())
+
+    def test_discards_torn_entries(self):
+        store = self.open_store()
+        store.add_friends([("face_1", "Alice"), ("face_2", "Bob")])
+        store.close()
+
+        valid = self.log_path.read_bytes()
+        torn_entry = json.dumps({"id": "face_3", "names": ["Carol"]}).encode("utf-8")[:-3]
+        self.log_path.write_bytes(valid + torn_entry)
+
+        store = self.open_store()
+        self.assertEqual({"face_1", "face_2"}, set(store.get_friends()))
+        self.assertEqual(valid, self.log_path.read_bytes())
+
+        # New entries are appended after the last complete entry
+        store.add_friend("face_3", "Carol")
+        store.close()
+
+        self.assertEqual({"face_1", "face_2", "face_3"}, set(self.open_store().get_friends()))
+
+    def test_discards_entries_after_corrupt_line(self):
+        store = self.open_store()
+        store.add_friend("face_1", "Alice")
+        store.close()
+
+        with open(self.log_path, "ab") as log:
+            log.write(b'{"id": "face_2", "na\n')
+            log.write(json.dumps({"id": "face_3", "names": ["Carol"]}).encode("utf-8") + b"\n")
+
+        self.assertEqual({"face_1"}, set(self.open_store().get_friends()))
+
+    def test_compacts_log_into_snapshot(self):
+        store = self.open_store(compact_after=3)
+        store.add_friends([("face_1", "Alice"), ("face_2", "Bob")])
+        self.assertFalse(self.snapshot_path.exists())
+
+        store.add_friend("face_3", "Carol")
+        self.assertTrue(self.snapshot_path.exists())
+        self.assertEqual(0, self.log_path.stat().st_size)
+
+        store.add_friend("face_1", "Ally")
+        store.close()
+
+        store = self.open_store(compact_after=3)
+        self.assertEqual({"face_1": (None, ["Ally"]), "face_2": (None, ["Bob"]), "face_3": (None, ["Carol"])},
+                         store.get_friends())
+        self.assertEqual({"face_1"}, set(store.find_by_name("ally")))
@@ -0,0 +1,30 @@
+import unittest
+
+from cltl.friends.index import NameIndex
+
+
+class NameIndexTest(unittest.TestCase):
+    def test_prefix_ranks_full_names_before_later_words(self):
+        index = NameIndex()
+        index.update((f"face_{i:03}", [f"Anne Th{i:03}"]) for i in range(100))
+        index.update([("thomas", ["Thomas Baier"]), ("tho", ["Tho"]), ("anne", ["Anne Tho"])])
+
+        self.assertEqual(["tho", "anne", "thomas"], index.search("tho", limit=3))
+        self.assertEqual(["thomas"], index.search("thomas b"))
+        self.assertEqual(["thomas"], index.search("bai"))
+
+    def test_prefix_after_remove(self):
+        index = NameIndex()
+        index.update([("thomas", ["Thomas Baier"]), ("tho", ["Tho"])])
+        index.remove("tho")
+        index.add("thomas", ["Tim"])
+
+        self.assertEqual([], index.search("tho"))
+        self.assertEqual(["thomas"], index.search("ti"))
+
+    def test_fuzzy_with_frequent_ngrams(self):
+        index = NameIndex(max_candidates=100)
+        index.update((f"face_{i}", [f"name {i}"]) for i in range(10000))
+
+        self.assertEqual("face_1234", index.search("name 1234", fuzzy=True, limit=5)[0])
+        self.assertEqual("face_5678", index.search("nmae 5678", fuzzy=True, limit=5)[0])
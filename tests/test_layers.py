@@ -0,0 +1,29 @@
+import unittest
+
+from cltl_service.monitoring.layers import AnnotationLayers
+
+
+class AnnotationLayersTest(unittest.TestCase):
+    def test_layers_per_image(self):
+        layers = AnnotationLayers(10)
+
+        self.assertFalse(layers.add("faces", "image_1", [("Alice", (0, 0, 1, 1))], timestamp=0))
+        layers.add("objects", "image_1", [("cup", (1, 1, 2, 2))], timestamp=1)
+        layers.add("faces", "image_2", [("Bob", (0, 0, 1, 1))], timestamp=2)
+
+        self.assertEqual([("faces", [("Alice", (0, 0, 1, 1))]), ("objects", [("cup", (1, 1, 2, 2))])],
+                         layers.layers("image_1"))
+        self.assertEqual([], layers.layers("image_3"))
+
+    def test_expire_reports_removed_annotations(self):
+        layers = AnnotationLayers(10)
+        layers.add("faces", "image_1", [("Alice", (0, 0, 1, 1))], timestamp=0)
+        layers.add("faces", "image_2", [("Bob", (0, 0, 1, 1))], timestamp=5)
+
+        self.assertFalse(layers.expire(10))
+        self.assertTrue(layers.expire(11))
+        self.assertEqual([], layers.layers("image_1"))
+        self.assertEqual(1, len(layers))
+
+        self.assertTrue(layers.add("faces", "image_3", [("Carol", (0, 0, 1, 1))], timestamp=16))
+        self.assertEqual(1, len(layers))
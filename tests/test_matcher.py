@@ -0,0 +1,67 @@
+import random
+import unittest
+
+from cltl.keyword.api import Trigger
+from cltl.keyword.matcher import CompiledKeywordMatcher, normalize
+
+
+def brute_force_match(triggers, utterance):
+    normalized = normalize(utterance)
+    if not normalized:
+        return None
+
+    for trigger in triggers:
+        if normalized in map(normalize, trigger.phrases):
+            return trigger
+    for trigger in triggers:
+        if trigger.contains and any(phrase and f" {phrase} " in f" {normalized} "
+                                    for phrase in map(normalize, trigger.phrases)):
+            return trigger
+
+    return None
+
+
+class CompiledKeywordMatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.triggers = [
+            Trigger(("bye", "goodbye"), desire="quit"),
+            Trigger(("tot ziens",), desire="quit2", contains=True),
+            Trigger(("ziens",), desire="x", contains=True),
+            Trigger(("she", "he"), desire="she", contains=True),
+        ]
+        self.matcher = CompiledKeywordMatcher(self.triggers)
+
+    def test_normalize(self):
+        self.assertEqual("l été", normalize("L'été!"))
+        self.assertEqual("", normalize("?!"))
+
+    def test_whole_utterance(self):
+        self.assertEqual("quit", self.matcher.match("Bye!").desire)
+        self.assertIsNone(self.matcher.match("well bye"))
+        self.assertIsNone(self.matcher.match(""))
+
+    def test_contained_phrases_match_whole_words(self):
+        self.assertEqual("quit2", self.matcher.match("ok, tot ziens!").desire)
+        self.assertEqual("x", self.matcher.match("ziens").desire)
+        self.assertIsNone(self.matcher.match("totziens"))
+        self.assertIsNone(self.matcher.match("ushers"))
+        self.assertEqual("she", self.matcher.match("she said").desire)
+
+    def test_first_trigger_wins(self):
+        self.assertEqual("quit2", self.matcher.match("ziens tot ziens").desire)
+        self.assertEqual("x", self.matcher.match("ziens she").desire)
+        self.assertEqual("x", self.matcher.match("ziens").desire)
+
+    def test_matches_brute_force(self):
+        rng = random.Random(7)
+        words = ["a", "b", "ab", "ba", "aba", "c"]
+
+        for _ in range(20):
+            triggers = [Trigger(tuple(" ".join(rng.choices(words, k=rng.randint(1, 3)))
+                                      for _ in range(rng.randint(1, 3))),
+                                desire=str(index), contains=rng.random() < 0.7)
+                        for index in range(rng.randint(1, 8))]
+            matcher = CompiledKeywordMatcher(triggers)
+            for _ in range(100):
+                utterance = ", ".join(rng.choices(words, k=rng.randint(0, 6)))
+                self.assertIs(brute_force_match(triggers, utterance), matcher.match(utterance), utterance)
@@ -0,0 +1,102 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from cltl_service.infra.metrics import MetricsRegistry, instrument
+
+
+class DummyEventBus:
+    def __init__(self):
+        self.handlers = dict()
+
+    def subscribe(self, topic, handler):
+        self.handlers[topic] = handler
+
+    def unsubscribe(self, topic, handler=None):
+        del self.handlers[topic]
+
+    def deliver(self, topic):
+        self.handlers[topic](SimpleNamespace(metadata=SimpleNamespace(topic=topic)))
+
+
+class MetricsRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        patcher = mock.patch("cltl_service.infra.metrics.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.registry = MetricsRegistry(buckets=(0.1, 1.0))
+        self.event_bus = DummyEventBus()
+        self.queue = []
+
+    def create_worker(self, service="Service", buffer_size=2):
+        def process(event):
+            self.now += 0.5
+
+        event_bus, processor = instrument(self.registry, service, self.event_bus, process, buffer_size=buffer_size)
+        event_bus.subscribe("topic", self.queue.append)
+
+        return processor
+
+    def test_without_registry(self):
+        processor = object()
+        self.assertEqual((self.event_bus, processor), instrument(None, "Service", self.event_bus, processor))
+
+    def test_counts_events(self):
+        processor = self.create_worker()
+
+        for _ in range(3):
+            self.event_bus.deliver("topic")
+        processor(self.queue.pop(0))
+        processor(None)
+
+        samples = self.registry.worker("Service").samples()
+        self.assertEqual({"topic": 3}, samples["received"])
+        self.assertEqual({"topic": 1}, samples["processed"])
+        self.assertEqual({"topic": 1}, samples["dropped"])
+        self.assertEqual(1, samples["queued"])
+        self.assertEqual(0, samples["in_flight"])
+        self.assertEqual({"topic": ([0, 1, 0], 0.5, 1), "scheduled": ([0, 1, 0], 0.5, 1)}, samples["latency"])
+
+    def test_observed_worker(self):
+        self.create_worker()
+        self.registry.worker("Service").observe(SimpleNamespace(pending=5, dropped={"other": 2}))
+
+        self.event_bus.deliver("topic")
+
+        samples = self.registry.worker("Service").samples()
+        self.assertEqual({"topic": 1}, samples["received"])
+        self.assertEqual({"other": 2}, samples["dropped"])
+        self.assertEqual(5, samples["queued"])
+
+    def test_render(self):
+        processor = self.create_worker('Service "A"')
+        self.event_bus.deliver("topic")
+        processor(self.queue.pop(0))
+
+        lines = self.registry.render().splitlines()
+
+        self.assertIn("# TYPE cltl_worker_events_received_total counter", lines)
+        self.assertIn('cltl_worker_events_received_total{service="Service \\"A\\"",topic="topic"} 1', lines)
+        self.assertIn('cltl_worker_queue_size{service="Service \\"A\\""} 0', lines)
+        self.assertIn('cltl_worker_queue_capacity{service="Service \\"A\\""} 2', lines)
+        self.assertIn("# TYPE cltl_worker_processing_seconds histogram", lines)
+
+        histogram = [line for line in lines if line.startswith("cltl_worker_processing_seconds")]
+        self.assertEqual([
+            'cltl_worker_processing_seconds_bucket{service="Service \\"A\\"",topic="topic",le="0.1"} 0',
+            'cltl_worker_processing_seconds_bucket{service="Service \\"A\\"",topic="topic",le="1.0"} 1',
+            'cltl_worker_processing_seconds_bucket{service="Service \\"A\\"",topic="topic",le="+Inf"} 1',
+            'cltl_worker_processing_seconds_sum{service="Service \\"A\\"",topic="topic"} 0.5',
+            'cltl_worker_processing_seconds_count{service="Service \\"A\\"",topic="topic"} 1',
+        ], histogram)
+
+    def test_metrics_endpoint(self):
+        self.create_worker()
+
+        response = self.registry.app.test_client().get("/")
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(MetricsRegistry.CONTENT_TYPE, response.content_type)
+        self.assertIn(b"cltl_worker_queue_size", response.data)
@@ -0,0 +1,56 @@
+import random
+import unittest
+from collections import Counter
+
+from cltl.context.objects import ObjectPresence
+
+
+def window_max(history, window, timestamp):
+    counts = dict()
+    for ts, labels in history:
+        if timestamp - window < ts <= timestamp:
+            for label, count in Counter(labels).items():
+                counts[label] = max(counts.get(label, 0), count)
+
+    return counts
+
+
+class ObjectPresenceTest(unittest.TestCase):
+    def test_count_is_maximum_within_window(self):
+        presence = ObjectPresence(100)
+
+        self.assertTrue(presence.update(["chair", "chair", "cup"], 0))
+        self.assertFalse(presence.update(["chair"], 50))
+        self.assertEqual({"chair": 2, "cup": 1}, presence.counts())
+
+        self.assertTrue(presence.expire(100))
+        self.assertEqual({"chair": 1}, presence.counts())
+        self.assertNotIn("cup", presence)
+        self.assertEqual({"chair": 50}, presence.last_seen())
+
+        self.assertTrue(presence.expire(150))
+        self.assertEqual(0, len(presence))
+
+    def test_update_drops_outdated_detections(self):
+        presence = ObjectPresence(100)
+
+        presence.update(["cup"] * 3, 0)
+        self.assertFalse(presence.update(["cup"], 99))
+        self.assertTrue(presence.update(["cup"] * 2, 100))
+        self.assertEqual(["cup", "cup"], presence.labels())
+
+    def test_matches_brute_force(self):
+        rng = random.Random(42)
+        window = 50
+        presence = ObjectPresence(window)
+        history = []
+
+        for timestamp in range(0, 2000, 7):
+            labels = [rng.choice("abc") for _ in range(rng.randrange(5))]
+            history.append((timestamp, labels))
+            presence.update(labels, timestamp)
+            if rng.random() < 0.3:
+                presence.expire(timestamp)
+                expected = window_max(history, window, timestamp)
+                self.assertEqual(expected, presence.counts())
+                self.assertEqual(Counter(expected), Counter(presence.labels()))
@@ -0,0 +1,79 @@
+import unittest
+from unittest import mock
+
+from cltl_service.context.publisher import CoalescingPublisher
+
+
+class CoalescingPublisherTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        patcher = mock.patch("cltl_service.context.publisher.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.publications = []
+        self.publisher = CoalescingPublisher(lambda: self.publications.append(self.now),
+                                             min_interval=1.0, max_delay=0.5)
+
+    def test_first_update_is_published_immediately(self):
+        self.assertFalse(self.publisher.flush())
+
+        self.publisher.update()
+        self.assertTrue(self.publisher.pending)
+        self.assertTrue(self.publisher.flush())
+        self.assertFalse(self.publisher.pending)
+        self.assertEqual([0.0], self.publications)
+
+    def test_updates_are_coalesced_until_max_delay(self):
+        self.publisher.update()
+        self.publisher.flush()
+
+        self.now = 0.1
+        self.publisher.update()
+        self.now = 0.3
+        self.publisher.update()
+        self.assertFalse(self.publisher.flush())
+
+        self.now = 0.6
+        self.assertTrue(self.publisher.flush())
+        self.assertEqual([0.0, 0.6], self.publications)
+
+    def test_update_is_published_after_min_interval(self):
+        publisher = CoalescingPublisher(lambda: self.publications.append(self.now), min_interval=1.0, max_delay=5.0)
+        publisher.update()
+        publisher.flush()
+
+        self.now = 0.8
+        publisher.update()
+        self.now = 0.9
+        self.assertFalse(publisher.flush())
+
+        self.now = 1.0
+        self.assertTrue(publisher.flush())
+        self.assertEqual([0.0, 1.0], self.publications)
+
+    def test_force_and_external_publication(self):
+        self.publisher.update()
+        self.publisher.flush()
+
+        self.now = 0.1
+        self.publisher.update()
+        self.assertTrue(self.publisher.flush(force=True))
+
+        self.now = 0.2
+        self.publisher.update()
+        self.publisher.published()
+        self.assertFalse(self.publisher.pending)
+
+        self.now = 0.3
+        self.publisher.update()
+        self.now = 0.7
+        self.assertFalse(self.publisher.flush())
+        self.now = 0.8
+        self.assertTrue(self.publisher.flush())
+
+        self.publisher.update()
+        self.publisher.discard()
+        self.now = 5.0
+        self.assertFalse(self.publisher.flush())
+        self.assertEqual([0.0, 0.1, 0.8], self.publications)
@@ -0,0 +1,101 @@
+import threading
+import time
+import unittest
+
+from cltl.friends.memory import MemoryFriendsStore
+from cltl.friends.replica import ReplicatedFriendsStore
+
+
+class DummyBrainStore(MemoryFriendsStore):
+    """
+    In-memory stand-in for the BrainFriendsStore with registration timestamps.
+    """
+    def __init__(self):
+        super().__init__()
+        self.available = threading.Event()
+        self.available.set()
+        self.registered = dict()
+        self.since = []
+        self.now = 1000
+
+    def add_friend(self, identifier, names, scenario_id=None, mention_id=None):
+        uri = super().add_friend(identifier, names, scenario_id, mention_id)
+        self.registered[identifier] = self.now
+
+        return uri
+
+    def get_friends(self):
+        if not self.available.is_set():
+            raise ConnectionError("Brain unavailable")
+
+        return super().get_friends()
+
+    def get_friends_since(self, timestamp):
+        self.since.append(timestamp)
+        identifiers = [identifier for identifier, registered in self.registered.items() if registered >= timestamp]
+        latest = max((self.registered[identifier] for identifier in identifiers), default=timestamp)
+
+        return super().get_friends_by_ids(identifiers), latest
+
+
+def await_condition(condition, timeout=2):
+    end = time.monotonic() + timeout
+    while not condition() and time.monotonic() < end:
+        time.sleep(0.01)
+
+    return condition()
+
+
+class ReplicatedFriendsStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.brain = DummyBrainStore()
+        self.replica = None
+
+    def tearDown(self):
+        if self.replica:
+            self.replica.close()
+
+    def test_initial_load_does_not_block(self):
+        self.brain.add_friend("face_1", "Alice")
+        self.brain.available.clear()
+
+        self.replica = ReplicatedFriendsStore(self.brain, sync_interval=0.05)
+        self.assertFalse(self.replica.loaded)
+
+        # Reads are served by the brain until the replica is loaded
+        self.brain.add_friend("face_2", "Bob")
+        self.assertEqual(["Bob"], self.replica.get_friend("face_2")[1])
+        self.assertEqual({"face_1"}, set(self.replica.find_by_name("ali")))
+
+        self.brain.available.set()
+        self.assertTrue(await_condition(lambda: self.replica.loaded))
+        self.assertEqual({"face_1", "face_2"}, set(self.replica.get_friends()))
+
+    def test_incremental_sync_merges_new_friends(self):
+        self.brain.add_friend("face_1", "Alice")
+        self.replica = ReplicatedFriendsStore(self.brain, sync_interval=0.05, overlap=100)
+        self.assertTrue(await_condition(lambda: self.replica.loaded))
+
+        # Registered by another robot
+        self.brain.now = int(time.time() * 1000) + 1000
+        MemoryFriendsStore.add_friend(self.brain, "face_1", "Ally")
+        self.brain.registered["face_1"] = self.brain.now
+        MemoryFriendsStore.add_friend(self.brain, "face_2", "Bob")
+        self.brain.registered["face_2"] = self.brain.now
+
+        self.assertTrue(await_condition(lambda: "face_2" in self.replica.get_friends()))
+        self.assertEqual(["Alice", "Ally"], self.replica.get_friend("face_1")[1])
+        self.assertEqual({"face_2"}, set(self.replica.find_by_name("bo")))
+
+        # Successive windows overlap and start at the latest registration seen
+        self.assertTrue(await_condition(lambda: self.brain.since[-1] == self.brain.now - 100))
+
+    def test_writes_are_applied_to_replica(self):
+        self.replica = ReplicatedFriendsStore(self.brain, sync_interval=10)
+        self.assertTrue(await_condition(lambda: self.replica.loaded))
+
+        self.replica.add_friend("face_1", ["Alice", "Ali"])
+        self.brain.available.clear()
+
+        self.assertEqual({"face_1"}, set(self.replica.get_friends()))
+        self.assertEqual(["Alice", "Ali"], self.replica.get_friend("face_1")[1])
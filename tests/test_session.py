@@ -0,0 +1,99 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from cltl_service.infra.session import DEFAULT_SESSION, SessionTable, session_key, with_session
+
+
+class _State:
+    __slots__ = ("key",)
+
+    def __init__(self, key):
+        self.key = key
+
+
+class SessionKeyTest(unittest.TestCase):
+    def test_session_key(self):
+        metadata = SimpleNamespace(topic="topic")
+
+        self.assertEqual(DEFAULT_SESSION, session_key(None))
+        self.assertEqual(DEFAULT_SESSION, session_key(SimpleNamespace(payload=SimpleNamespace(), metadata=metadata)))
+        self.assertEqual("a", session_key(SimpleNamespace(payload={"session": "a"}, metadata=metadata)))
+        self.assertEqual("b", session_key(SimpleNamespace(payload=[SimpleNamespace(session="b")], metadata=metadata)))
+        self.assertEqual("c", session_key(SimpleNamespace(payload=[], metadata=SimpleNamespace(session="c"))))
+
+    def test_with_session(self):
+        payload = with_session([{"value": 1}, {"value": 2}], "a")
+        self.assertEqual([{"value": 1, "session": "a"}, {"value": 2, "session": "a"}], payload)
+
+        self.assertEqual({"value": 1}, with_session({"value": 1}, DEFAULT_SESSION))
+        self.assertEqual("b", with_session(SimpleNamespace(), "b").session)
+
+
+class SessionTableTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        patcher = mock.patch("cltl_service.infra.session.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.removed = []
+
+    def create_table(self, **kwargs):
+        return SessionTable(_State, on_remove=lambda key, state: self.removed.append((key, state.key)), **kwargs)
+
+    def test_creates_sessions_on_access(self):
+        sessions = self.create_table()
+
+        self.assertIsNone(sessions.get("a", create=False))
+        state = sessions.get("a")
+        self.assertIs(state, sessions.get("a"))
+        self.assertEqual(DEFAULT_SESSION, sessions.get(None).key)
+        self.assertEqual(["a", DEFAULT_SESSION], [key for key, _ in sessions])
+
+    def test_evicts_least_recently_accessed_session(self):
+        sessions = self.create_table(max_sessions=2)
+
+        sessions.get("a")
+        sessions.get("b")
+        sessions.get("a")
+        sessions.get("c")
+
+        self.assertEqual({"a", "c"}, {key for key, _ in sessions})
+        self.assertEqual([("b", "b")], self.removed)
+
+    def test_expires_idle_sessions(self):
+        sessions = self.create_table(idle_timeout=10)
+
+        sessions.get("a")
+        self.now = 5
+        sessions.get("b")
+        self.now = 10
+        self.assertEqual(0, sessions.expire())
+
+        self.now = 12
+        sessions.get("b")
+        self.assertEqual(1, sessions.expire())
+        self.assertNotIn("a", sessions)
+        self.assertIn("b", sessions)
+        self.assertEqual([("a", "a")], self.removed)
+
+    def test_remove_does_not_notify(self):
+        sessions = self.create_table(idle_timeout=10)
+
+        sessions.get("a")
+        self.assertEqual("a", sessions.remove("a").key)
+        self.assertIsNone(sessions.remove("a"))
+        self.now = 20
+        self.assertEqual(0, sessions.expire())
+        self.assertEqual([], self.removed)
+
+    def test_failing_callback_does_not_keep_session(self):
+        def fail(key, state):
+            raise ValueError(key)
+
+        sessions = SessionTable(_State, max_sessions=1, on_remove=fail)
+        sessions.get("a")
+        sessions.get("b")
+
+        self.assertEqual(["b"], [key for key, _ in sessions])
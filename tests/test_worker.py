@@ -0,0 +1,143 @@
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+from cltl_service.infra.worker import PriorityTopicWorker
+
+
+def event(topic, value, session=None):
+    return SimpleNamespace(payload=SimpleNamespace(value=value, session=session),
+                           metadata=SimpleNamespace(topic=topic))
+
+
+class DummyEventBus:
+    def __init__(self):
+        self.handlers = {}
+
+    def subscribe(self, topic, handler):
+        self.handlers[topic] = handler
+
+    def unsubscribe(self, topic, handler=None):
+        self.handlers.pop(topic, None)
+
+    def publish(self, topic, event):
+        self.handlers[topic](event)
+
+
+class DummyResourceManager:
+    def __init__(self):
+        self.provided = []
+
+    def provide_resource(self, resource):
+        if resource in self.provided:
+            raise ValueError(resource)
+        self.provided.append(resource)
+
+
+class PriorityTopicWorkerTest(unittest.TestCase):
+    def setUp(self):
+        self.event_bus = DummyEventBus()
+        self.processed = []
+        self.first = threading.Event()
+        self.release = threading.Event()
+        self.worker = None
+
+    def tearDown(self):
+        self.release.set()
+        if self.worker:
+            self.worker.stop()
+            self.worker.await_stop()
+
+    def process(self, event):
+        self.processed.append((event.metadata.topic, event.payload.value) if event else None)
+        self.first.set()
+        self.release.wait()
+
+    def start_worker(self, **kwargs):
+        self.worker = PriorityTopicWorker(["intention", "object", "speaker"], self.event_bus, self.process,
+                                          **kwargs)
+        self.worker.start().wait()
+
+    def await_processed(self, count, timeout=2):
+        end = time.monotonic() + timeout
+        while len(self.processed) < count and time.monotonic() < end:
+            time.sleep(0.01)
+
+    def test_priority_order(self):
+        self.start_worker(priorities={"intention": 0, "object": 1, "speaker": 1})
+
+        self.event_bus.publish("speaker", event("speaker", 0))
+        self.first.wait(1)
+        self.event_bus.publish("speaker", event("speaker", 1))
+        self.event_bus.publish("object", event("object", 1))
+        self.event_bus.publish("intention", event("intention", 1))
+        self.release.set()
+        self.await_processed(4)
+
+        self.assertEqual([("speaker", 0), ("intention", 1), ("speaker", 1), ("object", 1)], self.processed)
+
+    def test_latest_topics_keep_latest_event_per_session(self):
+        self.start_worker(latest_topics=["object"])
+
+        self.event_bus.publish("speaker", event("speaker", 0))
+        self.first.wait(1)
+        for value in range(3):
+            self.event_bus.publish("object", event("object", value))
+        self.event_bus.publish("object", event("object", 10, session="other"))
+        self.release.set()
+        self.await_processed(3)
+
+        self.assertEqual([("speaker", 0), ("object", 2), ("object", 10)], self.processed)
+        self.assertEqual({"object": 2}, self.worker.dropped)
+
+    def test_scheduled_invocation_is_not_delayed_by_pending_events(self):
+        self.start_worker(scheduled=0.1)
+
+        self.event_bus.publish("speaker", event("speaker", 0))
+        self.first.wait(1)
+        for value in range(1, 4):
+            self.event_bus.publish("speaker", event("speaker", value))
+        time.sleep(0.2)
+        self.release.set()
+        self.await_processed(5)
+
+        self.assertEqual(("speaker", 0), self.processed[0])
+        self.assertIsNone(self.processed[1])
+        self.assertEqual([("speaker", 1), ("speaker", 2), ("speaker", 3)],
+                         [processed for processed in self.processed[2:] if processed][:3])
+
+    def test_overflow_keeps_pending_events_of_latest_topics(self):
+        self.start_worker(latest_topics=["object"], buffer_size=2)
+
+        self.event_bus.publish("speaker", event("speaker", 0))
+        self.first.wait(1)
+        self.event_bus.publish("object", event("object", 1))
+        for value in range(1, 5):
+            self.event_bus.publish("speaker", event("speaker", value))
+        self.release.set()
+        self.await_processed(4)
+
+        self.assertEqual([("speaker", 0), ("object", 1), ("speaker", 3), ("speaker", 4)], self.processed)
+        self.assertEqual({"speaker": 2}, self.worker.dropped)
+
+    def test_overflow_without_events_to_drop(self):
+        self.start_worker(latest_topics=["object"], buffer_size=0)
+
+        self.event_bus.publish("object", event("object", 0))
+        self.first.wait(1)
+        self.event_bus.publish("object", event("object", 1))
+        self.event_bus.publish("speaker", event("speaker", 1))
+        self.release.set()
+        self.await_processed(2)
+
+        self.assertEqual([("object", 0), ("object", 1)], self.processed)
+        self.assertEqual({"speaker": 1}, self.worker.dropped)
+
+    def test_provides_resources(self):
+        resource_manager = DummyResourceManager()
+        resource_manager.provide_resource("out")
+
+        self.start_worker(resource_manager=resource_manager, provides=["intention", "out"])
+
+        self.assertEqual(["out", "intention"], resource_manager.provided)